@@ -27,10 +27,16 @@ ENDPOINTS_META = [
     {"path": "/api/colecciones", "method": "GET", "desc": "Lista los nombres de las colecciones en la DB"},
     {"path": "/api/coleccion/<nombre>?limit=50", "method": "GET", "desc": "Muestra una muestra de documentos de una colección"},
     {"path": "/api/endpoints", "method": "GET", "desc": "Lista programática de los endpoints disponibles (JSON)"},
-    {"path": "/regresion/simple", "method": "POST", "desc": "Regresión lineal simple; acepta samples inline o parámetros para extraer desde DB"},
-    {"path": "/regresion/multiple", "method": "POST", "desc": "Regresión lineal múltiple; acepta samples inline o parámetros para extraer desde DB"},
+    {"path": "/regresion/simple", "method": "POST", "desc": "Regresión lineal simple; acepta samples inline o parámetros para extraer desde DB (stream=true: colección completa sin tope)"},
+    {"path": "/regresion/multiple", "method": "POST", "desc": "Regresión lineal múltiple; acepta samples inline o parámetros para extraer desde DB (stream=true: colección completa sin tope)"},
+    {"path": "/regresion/predict", "method": "POST", "desc": "Predicciones con un modelo de regresión guardado (modelo_id o parámetros del ajuste), sin leer la colección"},
+    {"path": "/api/analisis", "method": "GET", "desc": "Análisis de ventas desde rollups materializados (?fuente=spark para recalcular con Spark)"},
+    {"path": "/api/analisis/rollups/rebuild?modo=mongo", "method": "POST", "desc": "Reconstruye los rollups de análisis desde cero (modo mongo|spark)"},
+    {"path": "/api/analisis/jobs", "method": "POST", "desc": "Encola un análisis de Spark (deduplicado y con caché por versión de datos)"},
+    {"path": "/api/analisis/jobs/<job_id>", "method": "GET", "desc": "Estado y resultado de un job de análisis"},
     {"path": "/verifica_db", "method": "GET", "desc": "Verifica que la DB y colecciones mínimas estén disponibles"},
     {"path": "/crear_db", "method": "POST", "desc": "Crear/poblar la base de datos (control administrativo)"},
+    {"path": "/db/pool", "method": "GET", "desc": "Estado del pool de conexiones MongoDB (checkouts, tiempos de espera)"},
     {"path": "/multimedia/archivos?tipo=imagen&page=1&limit=20", "method": "GET", "desc": "Listar archivos multimedia (GridFS) por tipo"},
     {"path": "/multimedia/archivo/<id>", "method": "GET", "desc": "Descargar / mostrar archivo almacenado en GridFS"}
 ]
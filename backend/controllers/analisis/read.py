@@ -1,9 +1,9 @@
 # read.py
 """
-Headless analysis using PySpark (compatible Spark 3.2.2).
+Headless analysis using PySpark (conector mongo-spark 10.x, sesión compartida de spark_config).
 Ahora apunta a la base de datos 'superpancho_db'.
 Funciones principales:
- - run_full_analysis(mongo_uri: str = ..., spark_opts: dict = None) -> dict
+ - run_full_analysis(mongo_uri: str = ..., spark_opts: dict = None, stop_spark: bool = False, match: dict = None) -> dict
  - query_result_sections(result: dict, section: str) -> dict | list
 No depende de UI.
 """
@@ -11,10 +11,15 @@ from typing import Any, Dict, List, Optional
 from datetime import datetime
 from decimal import Decimal
 
+from bson import json_util
+from pymongo import uri_parser
+from pyspark import StorageLevel
 from pyspark.sql import SparkSession
-from pyspark.sql.functions import avg, sum as _sum, count as _count, col, desc, explode, max as _max, min as _min
+from pyspark.sql.functions import avg, sum as _sum, count as _count, col, desc, explode, lit, max as _max, min as _min, max_by, struct
 from pyspark.sql.types import DateType
 
+from controllers.spark import spark_config
+
 DEFAULT_MONGO_URI = "mongodb://localhost:27017/superpancho_db.clientes"
 
 class ReadError(ValueError):
@@ -26,39 +31,84 @@ def _safe_iso(val: Optional[Any]) -> Optional[str]:
     return val
 
 def _create_spark_session(app_name: str = "AnalisisSuperpancho", spark_opts: Optional[Dict[str, str]] = None) -> SparkSession:
+    """
+    Sin spark_opts reutiliza la sesión gestionada por spark_config (JVM y jars ya cargados).
+    Con spark_opts construye/ajusta una sesión con esa configuración.
+    """
+    if not spark_opts:
+        spark = spark_config.get_spark_session()
+        if spark is None:
+            raise ReadError("No se pudo establecer la sesión de Spark.")
+        return spark
     builder = SparkSession.builder.appName(app_name)
-    if spark_opts:
-        for k, v in spark_opts.items():
-            builder = builder.config(k, v)
-    else:
-        builder = builder.config("spark.jars.packages", "org.mongodb.spark:mongo-spark-connector_2.12:3.0.1")
-        builder = builder.config("spark.sql.adaptive.enabled", "false")
-        builder = builder.config("spark.sql.shuffle.partitions", "4")
+    for k, v in spark_opts.items():
+        builder = builder.config(k, v)
     return builder.getOrCreate()
 
-def _load_dataframe(spark: SparkSession, mongo_uri: str) -> Any:
+def _load_dataframe(spark: SparkSession, mongo_uri: str, match: Optional[Dict[str, Any]] = None) -> Any:
+    """
+    Carga la colección indicada en mongo_uri ('mongodb://host:port/db.coleccion') con el conector 10.x.
+    'match' se envía como $match en aggregation.pipeline, así el filtro se aplica en MongoDB.
+    """
     try:
-        df = spark.read.format("mongo").option("uri", mongo_uri).load()
-        return df
+        parsed = uri_parser.parse_uri(mongo_uri)
+        database, collection = parsed.get("database"), parsed.get("collection")
+        if not database or not collection:
+            raise ReadError(f"mongo_uri debe incluir base y colección (db.coleccion): {mongo_uri}")
+        reader = (
+            spark.read.format("mongodb")
+            .option("connection.uri", mongo_uri)
+            .option("database", database)
+            .option("collection", collection)
+        )
+        if match:
+            reader = reader.option("aggregation.pipeline", json_util.dumps([{"$match": match}]))
+        return reader.load()
+    except ReadError:
+        raise
     except Exception as e:
         raise ReadError(f"Error cargando datos desde MongoDB ({mongo_uri}): {e}")
 
-def run_full_analysis(mongo_uri: str = DEFAULT_MONGO_URI, spark_opts: Optional[Dict[str, str]] = None, stop_spark: bool = True) -> Dict[str, Any]:
+def run_full_analysis(mongo_uri: str = DEFAULT_MONGO_URI, spark_opts: Optional[Dict[str, str]] = None, stop_spark: bool = False,
+                      match: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
     Ejecuta el análisis completo y devuelve:
       - metadata: started_at, finished_at, total_records, min_fecha, max_fecha
       - summary_text: texto plano
       - sections: lista estructurada (dia_mas_ventas, top_products, top_clients, stats)
     mongo_uri por defecto apunta a 'superpancho_db.clientes'.
+    Por defecto usa la sesión compartida y la deja activa (warm) para el siguiente análisis;
+    stop_spark=True la detiene al terminar. 'match' filtra documentos en MongoDB antes de cargarlos.
     """
     started_at = datetime.utcnow()
     spark = None
+    df = None
     try:
         spark = _create_spark_session(spark_opts=spark_opts)
-        df = _load_dataframe(spark, mongo_uri)
+        df = _load_dataframe(spark, mongo_uri, match=match)
+
+        # Solo las columnas usadas: el conector las proyecta en MongoDB
+        columnas = [c for c in ("_id", "fecha", "total", "nombre", "productos") if c in df.columns]
+        df = df.select(*columnas)
+        if "fecha" in df.columns:
+            df = df.withColumn("fecha_date", col("fecha").substr(1, 10).cast(DateType()))
+        df = df.persist(StorageLevel.MEMORY_AND_DISK)
+
+        # Conteo, rango de fechas y estadísticas de 'total' en una sola agregación
+        aggs = [_count(lit(1)).alias("total_records")]
+        if "fecha_date" in df.columns:
+            aggs += [_min("fecha_date").alias("min_fecha"), _max("fecha_date").alias("max_fecha")]
+        if "total" in df.columns:
+            aggs += [
+                _sum("total").alias("sum_total"),
+                avg("total").alias("avg_total"),
+                _max("total").alias("max_total"),
+                _min("total").alias("min_total"),
+            ]
+        escalares = df.agg(*aggs).first()
 
         result_meta: Dict[str, Any] = {"started_at": _safe_iso(started_at)}
-        total_records = int(df.count())
+        total_records = int(escalares["total_records"])
         result_meta["total_records"] = total_records
 
         summary_lines: List[str] = []
@@ -68,23 +118,26 @@ def run_full_analysis(mongo_uri: str = DEFAULT_MONGO_URI, spark_opts: Optional[D
 
         sections: List[Dict[str, Any]] = []
 
-        # Procesar fechas
-        if "fecha" in df.columns:
-            df = df.withColumn("fecha_simple", col("fecha").substr(1, 10))
-            df = df.withColumn("fecha_date", col("fecha_simple").cast(DateType()))
-            fechas = df.agg(_min("fecha_date").alias("min_fecha"), _max("fecha_date").alias("max_fecha")).first()
-            min_fecha = fechas["min_fecha"]
-            max_fecha = fechas["max_fecha"]
-            result_meta["min_fecha"] = _safe_iso(min_fecha)
-            result_meta["max_fecha"] = _safe_iso(max_fecha)
+        # Rango de fechas
+        if "fecha_date" in df.columns:
+            result_meta["min_fecha"] = _safe_iso(escalares["min_fecha"])
+            result_meta["max_fecha"] = _safe_iso(escalares["max_fecha"])
             summary_lines.append(f"Rango de fechas: Desde {result_meta['min_fecha']} Hasta {result_meta['max_fecha']}")
 
-        # Día con más ventas (por monto)
-        if "fecha_date" in df.columns and "total" in df.columns:
-            ventas_por_dia = df.groupBy("fecha_date").agg(_sum("total").alias("total_ventas"), _count("_id").alias("cantidad_ventas")).orderBy(desc("total_ventas"))
-            top_dia = ventas_por_dia.limit(1).collect()
-            if top_dia:
-                row = top_dia[0]
+        # Serie diaria (una sola agregación): día con más ventas y promedio de clientes por día
+        if "fecha_date" in df.columns:
+            por_dia_aggs = [_count("nombre").alias("clientes_dia")] if "nombre" in df.columns else [_count(lit(1)).alias("clientes_dia")]
+            if "total" in df.columns:
+                por_dia_aggs += [_sum("total").alias("total_ventas"), _count("_id").alias("cantidad_ventas")]
+            ventas_por_dia = df.groupBy("fecha_date").agg(*por_dia_aggs)
+            dia_aggs = [avg("clientes_dia").alias("promedio")]
+            if "total" in df.columns:
+                dia_aggs.append(max_by(struct("fecha_date", "total_ventas", "cantidad_ventas"), "total_ventas").alias("top_dia"))
+            dias = ventas_por_dia.agg(*dia_aggs).first()
+
+            # Día con más ventas (por monto)
+            if "total" in df.columns and dias["top_dia"] is not None:
+                row = dias["top_dia"]
                 dia_info = {
                     "section": "dia_mas_ventas",
                     "fecha": _safe_iso(row["fecha_date"]),
@@ -94,15 +147,11 @@ def run_full_analysis(mongo_uri: str = DEFAULT_MONGO_URI, spark_opts: Optional[D
                 sections.append(dia_info)
                 summary_lines.append(f"1. DIA CON MAS VENTAS: {dia_info['fecha']} Total: ${dia_info['total_ventas']:.2f}")
 
-        # Promedios
-        if "fecha_date" in df.columns:
-            clientes_por_dia = df.groupBy("fecha_date").agg(_count("nombre").alias("clientes_dia"))
-            avg_row = clientes_por_dia.select(avg("clientes_dia").alias("promedio")).first()
-            promedio_clientes = float(avg_row["promedio"]) if avg_row and avg_row["promedio"] is not None else 0.0
+            # Promedios
+            promedio_clientes = float(dias["promedio"]) if dias["promedio"] is not None else 0.0
             summary_lines.append(f"2. PROMEDIO DE CLIENTES POR DIA: {promedio_clientes:.2f}")
         if "total" in df.columns:
-            avg_total_row = df.agg(avg("total").alias("promedio_venta")).first()
-            promedio_venta = float(avg_total_row["promedio_venta"]) if avg_total_row and avg_total_row["promedio_venta"] is not None else 0.0
+            promedio_venta = float(escalares["avg_total"]) if escalares["avg_total"] is not None else 0.0
             summary_lines.append(f"3. PROMEDIO DE VENTA POR CLIENTE: ${promedio_venta:.2f}")
 
         # Productos top
@@ -135,41 +184,43 @@ def run_full_analysis(mongo_uri: str = DEFAULT_MONGO_URI, spark_opts: Optional[D
                 })
             sections.append({"section": "top_clients", "items": top_clients})
 
+            # Estadísticas: ya calculadas en la agregación inicial
             stats = {}
-            stats["total_ventas"] = int(df.count())
-            sum_row = df.agg(_sum("total").alias("sum_total")).first()
-            stats["ingresos_totales"] = float(sum_row["sum_total"]) if sum_row and sum_row["sum_total"] is not None else 0.0
-            avg_row = df.agg(avg("total").alias("avg_total")).first()
-            stats["ticket_promedio"] = float(avg_row["avg_total"]) if avg_row and avg_row["avg_total"] is not None else 0.0
-            max_row = df.agg(_max("total").alias("max_total")).first()
-            stats["venta_maxima"] = float(max_row["max_total"]) if max_row and max_row["max_total"] is not None else 0.0
-            min_row = df.agg(_min("total").alias("min_total")).first()
-            stats["venta_minima"] = float(min_row["min_total"]) if min_row and min_row["min_total"] is not None else 0.0
+            stats["total_ventas"] = total_records
+            stats["ingresos_totales"] = float(escalares["sum_total"]) if escalares["sum_total"] is not None else 0.0
+            stats["ticket_promedio"] = float(escalares["avg_total"]) if escalares["avg_total"] is not None else 0.0
+            stats["venta_maxima"] = float(escalares["max_total"]) if escalares["max_total"] is not None else 0.0
+            stats["venta_minima"] = float(escalares["min_total"]) if escalares["min_total"] is not None else 0.0
             sections.append({"section": "stats", "items": stats})
             summary_lines.append(f"6. ESTADISTICAS: Ingresos totales ${stats['ingresos_totales']:.2f} Ticket promedio ${stats['ticket_promedio']:.2f}")
 
         finished_at = datetime.utcnow()
         result_meta["finished_at"] = _safe_iso(finished_at)
 
-        if stop_spark and spark:
-            try:
-                spark.stop()
-            except Exception:
-                pass
-
         return {
             "metadata": result_meta,
             "summary_text": "\n".join(summary_lines),
             "sections": sections
         }
 
+    except ReadError:
+        raise
     except Exception as e:
-        if spark:
+        raise ReadError(f"Error ejecutando análisis headless: {e}")
+    finally:
+        if df is not None:
             try:
-                spark.stop()
+                df.unpersist()
+            except Exception:
+                pass
+        if stop_spark and spark:
+            try:
+                if spark_opts:
+                    spark.stop()
+                else:
+                    spark_config.stop_spark()
             except Exception:
                 pass
-        raise ReadError(f"Error ejecutando análisis headless: {e}")
 
 def query_result_sections(result: Dict[str, Any], section: str) -> Optional[Any]:
     """
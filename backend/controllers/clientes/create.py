@@ -12,6 +12,7 @@ from pydantic import ValidationError
 from bson import ObjectId
 
 from ...models.clientes_model import ClienteCreate, CompraItem
+from ..puntoVenta.ventas_diarias import registrar_cliente_nuevo
 
 class ClientError(ValueError):
     pass
@@ -83,5 +84,6 @@ def create_client(db_or_callable: Callable[[], Database] | Database, payload: Di
     }
 
     res = clientes_col.insert_one(doc)
+    registrar_cliente_nuevo(db, doc["created_at"])
     doc["_id"] = res.inserted_id
     return _serialize_doc(doc)
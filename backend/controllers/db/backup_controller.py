@@ -1,14 +1,12 @@
-import os
 import logging
-import tempfile
-import zipfile
 import gridfs
-from datetime import datetime
-from bson import json_util, ObjectId
-from flask import Blueprint, jsonify, send_file, Response
+from bson import ObjectId
+from flask import Blueprint, jsonify, request, send_file, Response
 
 # Imports de tu proyecto
 from db.conexion import get_db 
+from .backup_writer import borrar_backup, crear_backup, es_manifiesto, es_parte, zip_en_streaming
+from .backup_restore import colecciones_con_datos, colecciones_de, iniciar_restauracion, progreso
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
@@ -18,36 +16,55 @@ backup_bp = Blueprint('backups', __name__)
 # Nombre de la base de datos donde guardaremos los ZIPS
 BACKUP_DB_NAME = "superpancho_backups"
 
-def _get_backup_fs():
+def _get_backup_db():
     """
-    Obtiene la instancia de GridFS conectada a la base de datos de backups.
-    Reutiliza el cliente de conexión principal.
+    Obtiene la base de datos de backups reutilizando el cliente de conexión principal.
     """
     db_principal = get_db()
     if db_principal is None:
         raise RuntimeError("No hay conexión a la base de datos principal")
-    
-    # Obtenemos el cliente (la conexión general) del objeto db
-    client = db_principal.client
-    # Seleccionamos la base de datos dedicada a backups
-    backup_db = client[BACKUP_DB_NAME]
-    # Retornamos la instancia de GridFS
-    return gridfs.GridFS(backup_db)
-
-def _prune_old_backups_gridfs(fs, keep: int = 3):
+    return db_principal.client[BACKUP_DB_NAME]
+
+def _get_backup_fs():
+    """
+    Obtiene la instancia de GridFS conectada a la base de datos de backups.
+    """
+    return gridfs.GridFS(_get_backup_db())
+
+def _get_backup_bucket():
+    return gridfs.GridFSBucket(_get_backup_db())
+
+def _backups(bucket):
+    """Backups (manifiestos y zips antiguos), sin las partes por colección."""
+    return [f for f in bucket.find({}, sort=[("uploadDate", -1)]) if not es_parte(f)]
+
+def _cadenas(files):
+    """
+    Agrupa los backups por cadena (el completo y sus incrementales), de la más reciente a la más
+    antigua. Un zip antiguo o un backup completo sin incrementales es una cadena de uno.
+    """
+    cadenas = {}
+    for f in files:  # ya vienen del más reciente al más antiguo
+        meta = f.metadata or {}
+        raiz = str(f._id)
+        if es_manifiesto(f) and meta.get("tipo_backup") == "incremental":
+            raiz = meta.get("raiz") or raiz
+        cadenas.setdefault(raiz, []).append(f)
+    return list(cadenas.values())
+
+def _prune_old_backups_gridfs(bucket, keep: int = 3):
     """
-    Elimina los backups antiguos de GridFS, manteniendo solo los 'keep' más recientes.
+    Elimina los backups antiguos de GridFS, manteniendo solo las 'keep' cadenas más recientes
+    (un backup completo con sus incrementales cuenta como una). Nunca se borra un backup del que
+    dependa un incremental que se conserva. Un backup por partes se borra entero (manifiesto + partes).
     """
     try:
-        # Buscar todos los archivos, ordenados por fecha de subida descendente
-        # fs.find() retorna un cursor
-        files = list(fs.find().sort("uploadDate", -1))
-        
-        if len(files) > keep:
-            to_delete = files[keep:]
+        cadenas = _cadenas(_backups(bucket))
+        if len(cadenas) > keep:
+            to_delete = [f for cadena in cadenas[keep:] for f in cadena]
             for f in to_delete:
                 try:
-                    fs.delete(f._id)
+                    borrar_backup(_get_backup_db(), f)
                     logger.info("Backup antiguo eliminado de DB: %s", f.filename)
                 except Exception as e:
                     logger.warning("Error eliminando backup %s: %s", f.filename, e)
@@ -56,54 +73,47 @@ def _prune_old_backups_gridfs(fs, keep: int = 3):
         logger.exception("Error podando backups en GridFS: %s", e)
     return []
 
-def crear_backup_en_db(keep_last: int = 3):
+def crear_backup_en_db(keep_last: int = 3, formato: str = "json", compresion: str = None,
+                       incremental: bool = False, media: str = "dedup"):
+    """
+    Exporta cada colección en paralelo directamente a GridFS (ver backup_writer) y poda los
+    backups viejos. 'collections' mantiene el conteo por colección; 'stats' trae bytes y docs/s.
+    formato: "json" (extended JSON) o "bson" (BSON crudo, estructura de mongodump).
+    incremental: solo lo cambiado desde el último backup, encadenado a él.
+    media: "dedup" (chunks GridFS por contenido, una sola vez entre backups), "excluir" o "incluir".
+    """
     db = get_db()
     if db is None:
         raise RuntimeError("Error de conexión a DB")
 
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    zip_name = f"backup_{timestamp}.zip"
-    summary = {}
-
-    # 1. Crear ZIP en una carpeta temporal (se borra al terminar el 'with')
-    with tempfile.TemporaryDirectory() as tmpdir:
-        try:
-            coll_names = db.list_collection_names()
-            for coll in coll_names:
-                cursor = db[coll].find({})
-                file_path = os.path.join(tmpdir, f"{coll}.json")
-                count = 0
-                with open(file_path, "w", encoding="utf-8") as fh:
-                    for doc in cursor:
-                        fh.write(json_util.dumps(doc) + "\n")
-                        count += 1
-                summary[coll] = count
-        except Exception as e:
-            logger.exception("Error exportando datos: %s", e)
-            raise e
-
-        # Crear el archivo ZIP dentro del directorio temporal
-        zip_path = os.path.join(tmpdir, zip_name)
-        with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-            for fname in os.listdir(tmpdir):
-                if fname.endswith(".json"):
-                    full = os.path.join(tmpdir, fname)
-                    zf.write(full, arcname=fname)
-
-        # 2. Subir el ZIP a MongoDB (GridFS)
-        fs = _get_backup_fs()
-        with open(zip_path, 'rb') as f:
-            # put() guarda el archivo y retorna el file_id
-            file_id = fs.put(f, filename=zip_name, created_at=datetime.now())
-            logger.info("Backup guardado en GridFS con ID: %s", file_id)
+    try:
+        manifiesto = crear_backup(db, _get_backup_db(), formato=formato, compresion=compresion,
+                                  incremental=incremental, media=media)
+    except Exception as e:
+        logger.exception("Error exportando datos: %s", e)
+        raise e
+    logger.info("Backup guardado en GridFS con ID: %s (%.1fs)", manifiesto["file_id"], manifiesto["elapsed_s"])
 
-    # 3. Limpiar backups viejos
-    deleted = _prune_old_backups_gridfs(fs, keep=keep_last)
+    deleted = _prune_old_backups_gridfs(_get_backup_bucket(), keep=keep_last)
 
+    stats = {
+        coll: {k: info[k] for k in ("modo", "docs", "bytes", "bytes_comprimidos", "elapsed_s", "docs_por_seg", "mb_por_seg")}
+        for coll, info in manifiesto["colecciones"].items()
+    }
+    for coll, info in manifiesto["colecciones"].items():
+        if "media" in info:
+            stats[coll]["media"] = info["media"]
     return {
-        "filename": zip_name,
-        "file_id": str(file_id),
-        "collections": summary,
+        "filename": f"{manifiesto['backup_id']}.zip",
+        "file_id": manifiesto["file_id"],
+        "tipo_backup": manifiesto["tipo_backup"],
+        "base": manifiesto["base"],
+        "formato": manifiesto["formato"],
+        "compresion": manifiesto["compresion"],
+        "collections": {coll: info["docs"] for coll, info in manifiesto["colecciones"].items()},
+        "stats": stats,
+        "bytes_total": manifiesto["bytes_total"],
+        "elapsed_s": manifiesto["elapsed_s"],
         "deleted_old": deleted
     }
 
@@ -111,10 +121,21 @@ def crear_backup_en_db(keep_last: int = 3):
 
 @backup_bp.route('/generar', methods=['POST'])
 def endpoint_crear_backup():
-    """ Genera backup y lo guarda en MongoDB """
+    """
+    Genera backup y lo guarda en MongoDB
+    (?format=json|bson, ?compression=gzip|zstd, ?tipo=completo|incremental, ?media=dedup|excluir|incluir)
+    zstd necesita el paquete 'zstandard' (requirements.txt): sin él bson usa gzip por defecto y
+    ?compression=zstd responde 400.
+    """
     try:
-        res = crear_backup_en_db()
+        formato = (request.args.get("format") or "json").lower()
+        compresion = (request.args.get("compression") or "").lower() or None
+        incremental = (request.args.get("tipo") or "completo").lower() == "incremental"
+        media = (request.args.get("media") or "dedup").lower()
+        res = crear_backup_en_db(formato=formato, compresion=compresion, incremental=incremental, media=media)
         return jsonify({"ok": True, "data": res}), 200
+    except ValueError as e:
+        return jsonify({"ok": False, "message": str(e)}), 400
     except Exception as e:
         return jsonify({"ok": False, "message": str(e)}), 500
 
@@ -122,17 +143,21 @@ def endpoint_crear_backup():
 def endpoint_listar_backups():
     """ Lista los backups almacenados en GridFS """
     try:
-        fs = _get_backup_fs()
-        # Obtenemos archivos ordenados por fecha
-        files_cursor = fs.find().sort("uploadDate", -1)
-        
+        bucket = _get_backup_bucket()
         lista = []
-        for f in files_cursor:
+        for f in _backups(bucket):
+            meta = f.metadata or {}
+            manifiesto = es_manifiesto(f)
             lista.append({
                 "id": str(f._id), # Convertir ObjectId a string
-                "filename": f.filename,
-                "size": f.length,
-                "date": f.uploadDate.isoformat()
+                "filename": f"{meta['backup_id']}.zip" if manifiesto else f.filename,
+                # Para backups por partes el tamaño es la suma de las partes
+                "size": meta.get("bytes_total", f.length) if manifiesto else f.length,
+                "date": f.uploadDate.isoformat(),
+                "tipo_backup": meta.get("tipo_backup", "completo"),
+                "base": meta.get("base"),
+                "formato": meta.get("formato", "zip"),
+                "compresion": meta.get("compresion")
             })
             
         return jsonify({"ok": True, "backups": lista}), 200
@@ -149,6 +174,15 @@ def endpoint_descargar_backup(file_id):
 
         # Obtener el archivo de GridFS
         grid_out = fs.get(ObjectId(file_id))
+
+        # Backup por partes: se arma el zip al vuelo mientras se envía
+        if es_manifiesto(grid_out):
+            nombre = f"{grid_out.metadata['backup_id']}.zip"
+            return Response(
+                zip_en_streaming(_get_backup_db(), grid_out),
+                mimetype='application/zip',
+                headers={"Content-Disposition": f'attachment; filename="{nombre}"'}
+            )
         
         # Usar send_file para transmitir el archivo binario al navegador
         return send_file(
@@ -161,4 +195,51 @@ def endpoint_descargar_backup(file_id):
         return jsonify({"ok": False, "message": "Archivo no encontrado"}), 404
     except Exception as e:
         logger.error(f"Error descargando: {e}")
-        return jsonify({"ok": False, "message": str(e)}), 500
\ No newline at end of file
+        return jsonify({"ok": False, "message": str(e)}), 500
+
+@backup_bp.route('/restaurar/<file_id>', methods=['POST'])
+def endpoint_restaurar_backup(file_id):
+    """
+    Restaura un backup en segundo plano (202 + job_id; el avance se consulta en /restaurar/progreso).
+    ?db=<nombre> restaura en otra base (p. ej. para verificarlo lado a lado); por defecto la
+    base original. Si alguna colección destino tiene datos responde 409, salvo con ?drop=true.
+    """
+    try:
+        if not ObjectId.is_valid(file_id):
+            return jsonify({"ok": False, "message": "ID inválido"}), 400
+        db = get_db()
+        if db is None:
+            return jsonify({"ok": False, "message": "Error de conexión a DB"}), 500
+        bucket = _get_backup_bucket()
+        grid_file = bucket.open_download_stream(ObjectId(file_id))
+        if es_parte(grid_file):
+            return jsonify({"ok": False, "message": "El ID es una parte; usar el id del backup"}), 400
+
+        origen, esperados = colecciones_de(bucket, grid_file)
+        destino = request.args.get("db") or origen or db.name
+        if destino == BACKUP_DB_NAME:
+            return jsonify({"ok": False, "message": "No se puede restaurar sobre la base de backups"}), 400
+        drop = request.args.get("drop", "false").lower() in ("1", "true", "si")
+        if not drop:
+            ocupadas = colecciones_con_datos(db.client[destino], list(esperados))
+            if ocupadas:
+                return jsonify({"ok": False, "message": "Las colecciones destino ya tienen datos (usar ?drop=true)",
+                                "colecciones": ocupadas}), 409
+
+        job_id = iniciar_restauracion(db.client, _get_backup_db(), grid_file, destino, drop=drop)
+        return jsonify({"ok": True, "job_id": job_id, "database": destino,
+                        "totals": {c: n for c, n in esperados.items()}}), 202
+    except gridfs.errors.NoFile:
+        return jsonify({"ok": False, "message": "Archivo no encontrado"}), 404
+    except Exception as e:
+        logger.exception("Error iniciando restauración: %s", e)
+        return jsonify({"ok": False, "message": str(e)}), 500
+
+@backup_bp.route('/restaurar/progreso', methods=['GET'])
+@backup_bp.route('/restaurar/progreso/<job_id>', methods=['GET'])
+def endpoint_progreso_restauracion(job_id=None):
+    """ Avance de la restauración (la última si no se indica job_id), con el formato de /db/progreso """
+    snapshot = progreso(job_id)
+    if snapshot is None:
+        return jsonify({"ok": False, "message": "Restauración no encontrada"}), 404
+    return jsonify(snapshot), 200
@@ -0,0 +1,132 @@
+"""
+Multimedia (GridFS) en los backups, con almacenamiento por contenido.
+
+Los chunks de un bucket GridFS ('<bucket>.chunks', p. ej. multimedia.chunks) no se exportan como
+documentos: cada chunk se identifica por el sha256 de sus bytes y se guarda una sola vez en
+'media_blobs' de la base de backups ({_id: hash, data, n_bytes, backups: [backup_id]}). La parte
+del backup solo lleva las referencias {_id, files_id, n, h}; '<bucket>.files' sigue siendo una
+parte normal (metadatos pequeños). Un chunk que ya estaba en el almacén de un backup anterior no
+se vuelve a escribir: la porción multimedia crece solo con lo subido después.
+
+ - es_chunks_gridfs(coll, colecciones): la colección es el .chunks de un bucket GridFS
+ - lotes_referencias(db_backup, col, filtro, backup_id, formato): guarda los blobs nuevos y
+   genera los lotes de referencias ya codificados (json o bson), con estadísticas en 'stats'
+ - resolver_chunks(db_backup, refs): reconstruye los chunks originales desde las referencias
+ - liberar_blobs(db_backup, backup_id): quita el backup de los blobs y borra los que ya no usa nadie
+"""
+import hashlib
+
+from bson import encode, json_util
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+BLOBS = "media_blobs"
+LOTE_CHUNKS = 200          # chunks de 255 KB por lote: ~50 MB en memoria como mucho
+BATCH_CURSOR = 200
+
+
+def es_chunks_gridfs(coll, colecciones):
+    return coll.endswith(".chunks") and coll[:-len(".chunks")] + ".files" in colecciones
+
+
+def _asegurar_indices(db_backup):
+    db_backup[BLOBS].create_index("backups")
+
+
+def _upsert_blobs(db_backup, backup_id, blobs, hashes):
+    """Upsert de 'hashes' con sus bytes ($setOnInsert) y backup_id en 'backups'. Devuelve los insertados."""
+    ops = [UpdateOne({"_id": h},
+                     {"$setOnInsert": {"data": blobs[h], "n_bytes": len(blobs[h])},
+                      "$addToSet": {"backups": backup_id}},
+                     upsert=True)
+           for h in hashes]
+    try:
+        res = db_backup[BLOBS].bulk_write(ops, ordered=False)
+        return [hashes[i] for i in res.upserted_ids]
+    except BulkWriteError as e:
+        # dos upserts concurrentes del mismo hash: el perdedor (11000) se reintenta y ya encuentra el doc
+        errores = e.details.get("writeErrors", [])
+        if any(err.get("code") != 11000 for err in errores):
+            raise
+        insertados = [hashes[u["index"]] for u in e.details.get("upserted", [])]
+        reintentar = [hashes[err["index"]] for err in errores]
+        return insertados + _upsert_blobs(db_backup, backup_id, blobs, reintentar)
+
+
+def _guardar_blobs(db_backup, backup_id, blobs, stats):
+    """
+    blobs: {hash: bytes}. Marca todos como usados por backup_id e inserta los que faltan.
+    Los existentes se marcan con $addToSet sin reenviar los bytes; los que no quedaron marcados
+    (un liberar_blobs los borró entre medio) y los nuevos van por upsert, así que al terminar
+    todos existen y referencian a este backup aunque corran otros backups o podas a la vez.
+    """
+    hashes = list(blobs)
+    existentes = [d["_id"] for d in db_backup[BLOBS].find({"_id": {"$in": hashes}}, {"_id": 1})]
+    marcados = set()
+    if existentes:
+        db_backup[BLOBS].update_many({"_id": {"$in": existentes}}, {"$addToSet": {"backups": backup_id}})
+        marcados = {d["_id"] for d in db_backup[BLOBS].find({"_id": {"$in": existentes}, "backups": backup_id},
+                                                            {"_id": 1})}
+    faltantes = [h for h in hashes if h not in marcados]
+    if faltantes:
+        insertados = _upsert_blobs(db_backup, backup_id, blobs, faltantes)
+        stats["blobs_nuevos"] += len(insertados)
+        stats["bytes_nuevos"] += sum(len(blobs[h]) for h in insertados)
+
+
+def _codificar(refs, formato):
+    if formato == "bson":
+        return b"".join(encode(r) for r in refs)
+    return ("\n".join(json_util.dumps(r) for r in refs) + "\n").encode("utf-8")
+
+
+def lotes_referencias(db_backup, col, filtro, backup_id, formato, stats):
+    """
+    Recorre los chunks de 'col' (filtrados para los incrementales), guarda los blobs que no
+    estén en el almacén y devuelve (n, bytes) por lote con las referencias codificadas.
+    stats se completa con chunks, blobs_nuevos, bytes_nuevos y bytes_referenciados.
+    """
+    _asegurar_indices(db_backup)
+    stats.update({"chunks": 0, "blobs_nuevos": 0, "bytes_nuevos": 0, "bytes_referenciados": 0})
+    refs, blobs = [], {}
+    for chunk in col.find(filtro, batch_size=BATCH_CURSOR):
+        data = bytes(chunk["data"])
+        h = hashlib.sha256(data).hexdigest()
+        blobs[h] = data
+        refs.append({"_id": chunk["_id"], "files_id": chunk["files_id"], "n": chunk["n"], "h": h})
+        stats["bytes_referenciados"] += len(data)
+        if len(refs) >= LOTE_CHUNKS:
+            _guardar_blobs(db_backup, backup_id, blobs, stats)
+            stats["chunks"] += len(refs)
+            yield len(refs), _codificar(refs, formato)
+            refs, blobs = [], {}
+    if refs:
+        _guardar_blobs(db_backup, backup_id, blobs, stats)
+        stats["chunks"] += len(refs)
+        yield len(refs), _codificar(refs, formato)
+
+
+def resolver_chunks(db_backup, refs):
+    """Genera los documentos de chunk originales ({_id, files_id, n, data}) por lotes."""
+    lote = []
+
+    def _resolver(lote):
+        hashes = list({r["h"] for r in lote})
+        datos = {d["_id"]: d["data"] for d in db_backup[BLOBS].find({"_id": {"$in": hashes}})}
+        for r in lote:
+            if r["h"] not in datos:
+                raise ValueError(f"Blob {r['h']} no encontrado en {BLOBS}")
+            yield {"_id": r["_id"], "files_id": r["files_id"], "n": r["n"], "data": datos[r["h"]]}
+
+    for ref in refs:
+        lote.append(ref)
+        if len(lote) >= LOTE_CHUNKS:
+            yield from _resolver(lote)
+            lote = []
+    if lote:
+        yield from _resolver(lote)
+
+
+def liberar_blobs(db_backup, backup_id):
+    db_backup[BLOBS].update_many({"backups": backup_id}, {"$pull": {"backups": backup_id}})
+    return db_backup[BLOBS].delete_many({"backups": {"$size": 0}}).deleted_count
@@ -0,0 +1,307 @@
+"""
+Restauración de backups guardados en GridFS.
+
+ - iniciar_restauracion(client, backup_db, grid_file, destino, drop): lanza la restauración en un
+   hilo y devuelve el id del trabajo
+ - progreso(job_id=None): {counts, current, status, message} como /db/progreso (counts y current
+   en documentos por colección); sin job_id devuelve el último trabajo
+ - colecciones_con_datos(db, colecciones): colecciones del destino que ya tienen documentos
+
+Las partes se leen en streaming desde GridFS (sin descargar el backup entero) y cada colección
+se restaura en su propio hilo (RESTORE_WORKERS, por defecto 4) con insert_many(ordered=False)
+en lotes; los lotes de una misma colección se insertan en paralelo (RESTORE_INSERTS_POR_COLECCION)
+con un tope de lotes en vuelo para acotar la memoria. Los índices se crean al final de cada
+colección (tras el último paso de la cadena): construirlos una vez sobre los datos cargados es mucho más barato que mantenerlos
+documento a documento.
+
+Soporta los tres formatos: partes json.gz, partes BSON (gzip o zstd; se insertan como
+RawBSONDocument, sin decodificar) y los zips antiguos de un solo archivo.
+
+Un backup incremental se restaura con toda su cadena: primero el completo y luego cada
+incremental en orden. Las colecciones en modo "delta" se aplican con upserts por _id
+(ReplaceOne unordered); las que el incremental exportó completas se reemplazan. Los índices se
+crean una sola vez, con la especificación del último backup, al terminar la cadena.
+
+Las partes de referencias multimedia se resuelven contra media_blobs (ver backup_media).
+"""
+import gzip
+import io
+import os
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from bson import ObjectId, json_util
+from bson.raw_bson import RawBSONDocument
+from pymongo import ReplaceOne
+
+import gridfs
+
+from .backup_media import resolver_chunks
+from .backup_writer import es_manifiesto, leer_manifiesto, zstandard
+
+try:
+    RESTORE_WORKERS = max(1, int(os.environ.get("RESTORE_WORKERS", "4")))
+except ValueError:
+    RESTORE_WORKERS = 4
+try:
+    RESTORE_INSERTS_POR_COLECCION = max(1, int(os.environ.get("RESTORE_INSERTS_POR_COLECCION", "2")))
+except ValueError:
+    RESTORE_INSERTS_POR_COLECCION = 2
+
+LOTE_INSERT = 1000
+
+_lock = threading.Lock()
+_trabajos = {}          # job_id -> estado
+_ultimo = {"id": None}
+
+
+def _nuevo_estado(database, counts):
+    return {
+        "database": database,
+        "counts": dict(counts),
+        "current": {c: 0 for c in counts},
+        "status": {c: "idle" for c in counts},
+        "errores": {},
+        "indices": {},
+        "inicio": time.time(),
+        "fin": None,
+        "message": "Procesando…",
+    }
+
+
+def _sumar(estado, coll, n):
+    with _lock:
+        estado["current"][coll] = estado["current"].get(coll, 0) + n
+
+
+def _marcar(estado, coll, status):
+    with _lock:
+        estado["status"][coll] = status
+
+
+# --- Lectura de partes ---
+
+def _abrir_parte(bucket, info, compresion):
+    origen = bucket.open_download_stream(ObjectId(info["file_id"]))
+    if compresion == "zstd":
+        if zstandard is None:
+            raise RuntimeError("El backup usa zstd y el paquete 'zstandard' no está instalado")
+        return zstandard.ZstdDecompressor().stream_reader(origen)
+    return gzip.GzipFile(fileobj=origen, mode="rb")
+
+
+def _docs_json(stream):
+    for linea in io.TextIOWrapper(stream, encoding="utf-8"):
+        if linea.strip():
+            yield json_util.loads(linea)
+
+
+def _leer_exacto(stream, n):
+    partes, falta = [], n
+    while falta:
+        data = stream.read(falta)
+        if not data:
+            raise ValueError("Parte BSON truncada")
+        partes.append(data)
+        falta -= len(data)
+    return b"".join(partes)
+
+
+def _docs_bson(stream):
+    """Documentos BSON crudos: el tamaño va en los primeros 4 bytes (little endian) de cada uno."""
+    while True:
+        cabecera = stream.read(4)
+        if not cabecera:
+            return
+        if len(cabecera) < 4:
+            cabecera += _leer_exacto(stream, 4 - len(cabecera))
+        largo = int.from_bytes(cabecera, "little")
+        yield RawBSONDocument(cabecera + _leer_exacto(stream, largo - 4))
+
+
+def _lotes(docs, tam=LOTE_INSERT):
+    lote = []
+    for doc in docs:
+        lote.append(doc)
+        if len(lote) >= tam:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+# --- Carga ---
+
+def _insertar(col, docs, estado, coll, upsert=False):
+    """
+    Inserta los lotes en paralelo (unordered) con como mucho 2 lotes en vuelo por hilo.
+    upsert=True reemplaza por _id (aplicar un delta sobre lo ya restaurado).
+    """
+    en_vuelo = threading.BoundedSemaphore(RESTORE_INSERTS_POR_COLECCION * 2)
+    errores = []
+
+    def _uno(lote):
+        try:
+            if upsert:
+                col.bulk_write([ReplaceOne({"_id": d["_id"]}, d, upsert=True) for d in lote],
+                               ordered=False, bypass_document_validation=True)
+            else:
+                col.insert_many(lote, ordered=False, bypass_document_validation=True)
+            _sumar(estado, coll, len(lote))
+        except Exception as e:
+            errores.append(e)
+        finally:
+            en_vuelo.release()
+
+    with ThreadPoolExecutor(max_workers=RESTORE_INSERTS_POR_COLECCION,
+                            thread_name_prefix=f"restore_{coll}") as ex:
+        for lote in _lotes(docs):
+            if errores:
+                break
+            en_vuelo.acquire()
+            ex.submit(_uno, lote)
+    if errores:
+        raise errores[0]
+
+
+def _crear_indices(col, specs):
+    creados = []
+    for spec in specs or []:
+        opciones = {k: v for k, v in spec.items() if k not in ("key", "v", "ns", "background")}
+        col.create_index([(campo, orden) for campo, orden in spec["key"]], **opciones)
+        creados.append(spec["name"])
+    return creados
+
+
+def _restaurar_coleccion(destino, coll, abrir_docs, indices, estado, drop, upsert=False, ultimo=True):
+    with _lock:
+        if estado["status"].get(coll) == "error":
+            return  # un paso anterior de la cadena falló para esta colección
+    _marcar(estado, coll, "running")
+    try:
+        col = destino[coll]
+        if drop:
+            col.drop()
+        _insertar(col, abrir_docs(), estado, coll, upsert=upsert)
+        if ultimo:
+            creados = _crear_indices(col, indices)
+            with _lock:
+                estado["indices"][coll] = creados
+            _marcar(estado, coll, "done")
+    except Exception as e:
+        with _lock:
+            estado["errores"][coll] = str(e)
+        _marcar(estado, coll, "error")
+
+
+def _tareas_manifiesto(backup_db, bucket, manifiesto):
+    formato = manifiesto.get("formato", "json")
+    compresion = manifiesto.get("compresion", "gzip")
+    for coll, info in manifiesto["colecciones"].items():
+        def _docs(info=info):
+            stream = _abrir_parte(bucket, info, compresion)
+            docs = _docs_bson(stream) if formato == "bson" else _docs_json(stream)
+            if info.get("contenido") == "refs_gridfs":
+                return resolver_chunks(backup_db, docs)
+            return docs
+        yield coll, _docs, info.get("indices"), info.get("modo", "completa")
+
+
+def _tareas_zip(grid_file):
+    """Zip antiguo: <coleccion>.json por entrada, sin especificación de índices."""
+    zf = zipfile.ZipFile(grid_file)
+    for nombre in zf.namelist():
+        if not nombre.endswith(".json"):
+            continue
+        def _docs(nombre=nombre):
+            return _docs_json(zf.open(nombre))
+        yield nombre[:-len(".json")], _docs, None, "completa"
+
+
+def cadena_de(bucket, file_id):
+    """Manifiestos a aplicar en orden: el completo, sus incrementales y el pedido."""
+    manifiesto = leer_manifiesto(bucket, file_id)
+    return [leer_manifiesto(bucket, ObjectId(i)) for i in manifiesto.get("cadena") or []] + [manifiesto]
+
+
+def colecciones_de(bucket, grid_file):
+    """(base de origen, {coleccion: docs esperados}); None si no se conoce (zips antiguos)."""
+    if es_manifiesto(grid_file):
+        cadena = cadena_de(bucket, grid_file._id)
+        esperados = {}
+        for manifiesto in cadena:
+            for c, i in manifiesto["colecciones"].items():
+                esperados[c] = esperados.get(c, 0) + i["docs"]
+        return cadena[-1].get("database"), esperados
+    zf = zipfile.ZipFile(grid_file)
+    return None, {n[:-len(".json")]: None for n in zf.namelist() if n.endswith(".json")}
+
+
+def colecciones_con_datos(db, colecciones):
+    return [c for c in colecciones if db[c].find_one({}, {"_id": 1}) is not None]
+
+
+def _ejecutar(job_id, client, backup_db, file_id, database, drop):
+    estado = _trabajos[job_id]
+    destino = client[database]
+    bucket = gridfs.GridFSBucket(backup_db)
+    try:
+        grid_file = bucket.open_download_stream(file_id)
+        if es_manifiesto(grid_file):
+            pasos = [list(_tareas_manifiesto(backup_db, bucket, m)) for m in cadena_de(bucket, file_id)]
+        else:
+            pasos = [list(_tareas_zip(grid_file))]
+        # índices: los del último manifiesto que incluye cada colección
+        indices_finales = {coll: indices for paso in pasos for coll, _, indices, _ in paso}
+        ultimo_paso = {coll: n for n, paso in enumerate(pasos) for coll, _, _, _ in paso}
+        for n, tareas in enumerate(pasos):
+            with ThreadPoolExecutor(max_workers=RESTORE_WORKERS, thread_name_prefix="restore") as ex:
+                for coll, abrir_docs, _, modo in tareas:
+                    delta = n > 0 and modo == "delta"
+                    ex.submit(_restaurar_coleccion, destino, coll, abrir_docs, indices_finales.get(coll), estado,
+                              drop=(drop if n == 0 else not delta), upsert=delta, ultimo=ultimo_paso[coll] == n)
+    except Exception as e:
+        with _lock:
+            estado["errores"]["_backup"] = str(e)
+    with _lock:
+        estado["fin"] = time.time()
+        estado["message"] = "Restauración con errores" if estado["errores"] else "Proceso completado"
+
+
+def iniciar_restauracion(client, backup_db, grid_file, destino, drop=False):
+    """
+    Restaura el backup 'grid_file' (manifiesto o zip antiguo) en la base 'destino'.
+    drop=True borra cada colección antes de cargarla.
+    """
+    _, esperados = colecciones_de(gridfs.GridFSBucket(backup_db), grid_file)
+    job_id = uuid.uuid4().hex
+    with _lock:
+        _trabajos[job_id] = _nuevo_estado(destino, {c: n or 0 for c, n in esperados.items()})
+        _ultimo["id"] = job_id
+    threading.Thread(target=_ejecutar, args=(job_id, client, backup_db, grid_file._id, destino, drop),
+                     daemon=True, name=f"restore_{job_id[:8]}").start()
+    return job_id
+
+
+def progreso(job_id=None):
+    with _lock:
+        job_id = job_id or _ultimo["id"]
+        estado = _trabajos.get(job_id)
+        if estado is None:
+            return None
+        fin = estado["fin"] or time.time()
+        return {
+            "job_id": job_id,
+            "database": estado["database"],
+            "counts": dict(estado["counts"]),
+            "current": dict(estado["current"]),
+            "status": dict(estado["status"]),
+            "message": estado["message"],
+            "errores": dict(estado["errores"]),
+            "indices": dict(estado["indices"]),
+            "elapsed_s": round(fin - estado["inicio"], 3),
+            "docs_por_seg": round(sum(estado["current"].values()) / max(fin - estado["inicio"], 1e-6), 1),
+        }
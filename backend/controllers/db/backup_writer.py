@@ -0,0 +1,519 @@
+"""
+Escritura de backups en streaming hacia GridFS.
+
+Un backup es un conjunto de archivos en la base de backups (GridFS, bucket 'fs'):
+ - una parte por colección, comprimida mientras se sube con open_upload_stream:
+     formato "json": '<coleccion>.json.gz', extended JSON (una línea por documento)
+     formato "bson": '<db>/<coleccion>.bson.gz' (o .bson.zst), documentos BSON tal cual salen
+       del cursor (RawBSONDocument, sin decodificar ni recodificar)
+ - un manifiesto '<backup>.manifest.json' con el resumen, las partes, los conteos y los índices
+   de cada colección; su _id es el id del backup que devuelven /generar y /listar
+
+Cada colección se exporta en su propio hilo (BACKUP_WORKERS, por defecto 4): cursor propio,
+codificación por lotes y compresión directa al upload stream, sin archivos temporales.
+
+Backups incrementales (incremental=True): cada manifiesto guarda por colección una marca de agua
+y la hora de inicio del backup. La marca lleva un 'corte' (el _id máximo menos
+BACKUP_DELTA_MARGEN_S segundos, por defecto 300) y cuántos documentos había por debajo. El
+siguiente incremental exporta solo {_id >= corte} ∪ {updated_at >= inicio anterior - margen}
+(modo "delta") de las colecciones grandes (> BACKUP_INCREMENTAL_MIN_DOCS) de COLECCIONES_DELTA
+y de los buckets GridFS: solo en ellas toda escritura fija updated_at o agrega documentos
+nuevos. Las que solo agregan (logs, GridFS) no usan la rama de updated_at. El margen cubre los
+inserts que confirman tarde con un _id menor que el máximo ya visto (ObjectId de otro proceso,
+checkout en curso); si aun así el número de documentos por debajo del corte cambió (borrados o
+inserts tardíos, p. ej. lotes sembrados fuera de orden) la colección sale completa. El resto
+(rollups y reportes que se actualizan con $inc/$merge, stock de productos...) se exporta
+siempre completo, igual que las colecciones pequeñas. Los índices de updated_at los crea
+asegurar_indices_delta al arrancar (main.py), no el backup. El manifiesto enlaza la cadena
+('base' y 'cadena': ids desde el backup completo); después de BACKUP_CADENA_MAX incrementales
+se hace uno completo.
+
+Multimedia (media="dedup", por defecto): los chunks de GridFS se guardan por contenido en
+'media_blobs' y la parte solo lleva referencias por hash (ver backup_media). media="excluir"
+deja fuera los buckets GridFS y media="incluir" los exporta como cualquier colección.
+
+El zip de /descargar de un backup "bson" con gzip tiene la estructura de `mongodump --gzip`
+(<db>/<coleccion>.bson.gz + <db>/<coleccion>.metadata.json.gz), así que se puede restaurar con
+`mongorestore --gzip --dir <carpeta>`. Las partes de referencias multimedia se resuelven al armar
+el zip (los chunks salen completos, como '<bucket>.chunks'): la descarga no depende de media_blobs. zstd (si está instalado 'zstandard') comprime más rápido
+y mejor, pero mongorestore no lo lee.
+
+Funciones:
+ - crear_backup(db, backup_db, formato, compresion, incremental): exporta todas las colecciones
+   (o solo lo cambiado desde el último backup) y devuelve el manifiesto
+ - ultimo_backup(bucket): manifiesto más reciente (GridOut) o None
+ - es_parte(grid_file) / es_manifiesto(grid_file): distinguen partes y manifiestos en /listar
+ - leer_manifiesto(bucket, file_id) / borrar_backup(backup_db, grid_file): manifiesto y borrado del conjunto
+ - zip_en_streaming(backup_db, grid_file): genera un zip (partes + manifiesto) por trozos para
+   /descargar, sin armarlo en disco ni en memoria
+ - asegurar_indices_delta(db): índices de updated_at de COLECCIONES_CON_UPDATED_AT
+"""
+import gzip
+import io
+import os
+import time
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import gridfs
+from bson import ObjectId, decode_file_iter, encode, json_util
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+
+from .backup_media import es_chunks_gridfs, liberar_blobs, lotes_referencias, resolver_chunks
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    BACKUP_WORKERS = max(1, int(os.environ.get("BACKUP_WORKERS", "4")))
+except ValueError:
+    BACKUP_WORKERS = 4
+
+try:
+    INCREMENTAL_MIN_DOCS = int(os.environ.get("BACKUP_INCREMENTAL_MIN_DOCS", "10000"))
+except ValueError:
+    INCREMENTAL_MIN_DOCS = 10000
+try:
+    CADENA_MAX = max(1, int(os.environ.get("BACKUP_CADENA_MAX", "7")))
+except ValueError:
+    CADENA_MAX = 7
+try:
+    DELTA_MARGEN_S = max(0, int(os.environ.get("BACKUP_DELTA_MARGEN_S", "300")))
+except ValueError:
+    DELTA_MARGEN_S = 300
+
+# Colecciones cuyos escritores mantienen updated_at (o solo agregan): las únicas con delta
+COLECCIONES_DELTA = ("ventas", "clientes", "logs")
+# Las que además se editan: el delta incluye {updated_at >= inicio anterior} (con índice)
+COLECCIONES_CON_UPDATED_AT = ("ventas", "clientes")
+
+FORMATOS = ("json", "bson")
+MEDIA = ("dedup", "excluir", "incluir")
+COMPRESIONES = ("gzip", "zstd")
+EXTENSION = {"gzip": "gz", "zstd": "zst"}
+
+LOTE_DOCS = 1000                   # documentos por lote codificado
+CHUNK_GRIDFS = 1024 * 1024         # tamaño de chunk de las partes en GridFS
+BATCH_CURSOR = 2000
+
+_RAW = CodecOptions(document_class=RawBSONDocument)
+
+
+def compresion_por_defecto(formato):
+    """bson usa zstd si está instalado; json se queda en gzip (compatible con cualquier zip)."""
+    return "zstd" if formato == "bson" and zstandard is not None else "gzip"
+
+
+class _UploadComprimido:
+    """Comprime (gzip o zstd) y escribe en un GridIn a medida que llegan los lotes."""
+
+    def __init__(self, grid_in, compresion="gzip"):
+        self._out = grid_in
+        if compresion == "zstd":
+            self._z = zstandard.ZstdCompressor(level=3).compressobj()
+        else:
+            self._z = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> formato gzip
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def write(self, data: bytes):
+        self.bytes_in += len(data)
+        comp = self._z.compress(data)
+        if comp:
+            self.bytes_out += len(comp)
+            self._out.write(comp)
+
+    def close(self):
+        comp = self._z.flush()
+        self.bytes_out += len(comp)
+        self._out.write(comp)
+        self._out.close()
+
+
+def _indices(col):
+    """Especificación de índices (sin el de _id) para recrearlos al restaurar."""
+    specs = []
+    for nombre, info in col.index_information().items():
+        if nombre == "_id_":
+            continue
+        spec = {k: v for k, v in info.items() if k not in ("v", "ns")}
+        spec["name"] = nombre
+        specs.append(spec)
+    return specs
+
+
+def _lotes_json(col, filtro):
+    lote = []
+    for doc in col.find(filtro, batch_size=BATCH_CURSOR):
+        lote.append(json_util.dumps(doc))
+        if len(lote) >= LOTE_DOCS:
+            yield len(lote), ("\n".join(lote) + "\n").encode("utf-8")
+            lote = []
+    if lote:
+        yield len(lote), ("\n".join(lote) + "\n").encode("utf-8")
+
+
+def _lotes_bson(col, filtro):
+    lote = []
+    for doc in col.with_options(codec_options=_RAW).find(filtro, batch_size=BATCH_CURSOR):
+        lote.append(doc.raw)
+        if len(lote) >= LOTE_DOCS:
+            yield len(lote), b"".join(lote)
+            lote = []
+    if lote:
+        yield len(lote), b"".join(lote)
+
+
+def _nombre_parte(database, coll, formato, compresion, refs=False):
+    nombre = f"{coll}.refs" if refs else coll
+    if formato == "bson":
+        return f"{database}/{nombre}.bson.{EXTENSION[compresion]}"
+    return f"{nombre}.json.{EXTENSION[compresion]}"
+
+
+def asegurar_indices_delta(db):
+    """Índices de updated_at del filtro delta (sin ellos cada incremental recorre la colección)."""
+    for coll in COLECCIONES_CON_UPDATED_AT:
+        try:
+            db[coll].create_index([("updated_at", 1)], sparse=True, name=f"idx_{coll}_updated_at")
+        except Exception as e:
+            # p. ej. ya existe con otro nombre: no impide los demás
+            print(f"⚠️ No se pudo crear el índice updated_at de {coll}: {e}")
+
+
+def _corte(ultimo_id):
+    """_id desde el que exporta el siguiente delta: el máximo menos DELTA_MARGEN_S segundos."""
+    if isinstance(ultimo_id, ObjectId):
+        return ObjectId.from_datetime(ultimo_id.generation_time - timedelta(seconds=DELTA_MARGEN_S))
+    return ultimo_id
+
+
+def _marca_agua(col, delta=False):
+    ultimo = col.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+    marca = {"_id": ultimo["_id"] if ultimo else None, "docs": col.estimated_document_count()}
+    if delta and ultimo is not None:
+        marca["corte"] = _corte(ultimo["_id"])
+        # conteo exacto por el índice de _id: el próximo delta lo compara para detectar cambios
+        marca["docs_corte"] = col.count_documents({"_id": {"$lt": marca["corte"]}})
+    return marca
+
+
+def _admite_delta(coll, colecciones):
+    if coll in COLECCIONES_DELTA:
+        return True
+    bucket, _, sufijo = coll.rpartition(".")
+    return sufijo in ("files", "chunks") and f"{bucket}.files" in colecciones and f"{bucket}.chunks" in colecciones
+
+
+def _filtro_delta(col, marca, previo, desde_previo, delta=True):
+    """
+    Filtro de lo cambiado desde el backup anterior, o None si la colección va completa: no
+    admite delta (ver COLECCIONES_DELTA), es pequeña, no hay marca previa con corte o cambió el
+    número de documentos por debajo del corte (borrados o inserts tardíos con _id menor).
+    """
+    if not delta or not previo or previo.get("corte") is None or desde_previo is None:
+        return None
+    if marca["docs"] <= INCREMENTAL_MIN_DOCS:
+        return None
+    if col.count_documents({"_id": {"$lt": previo["corte"]}}) != previo.get("docs_corte"):
+        return None
+    filtro = {"_id": {"$gte": previo["corte"]}}
+    if col.name not in COLECCIONES_CON_UPDATED_AT:
+        # solo agregan (logs, GridFS): una rama sin índice haría recorrer la colección entera
+        return filtro
+    return {"$or": [filtro, {"updated_at": {"$gte": desde_previo - timedelta(seconds=DELTA_MARGEN_S)}}]}
+
+
+def _exportar_coleccion(db, backup_db, bucket, backup_name, backup_id, coll, formato, compresion,
+                        previo=None, desde_previo=None, refs=False, delta=False):
+    """
+    refs=True: chunks de GridFS guardados por contenido, la parte lleva solo las referencias.
+    delta=True: la colección admite exportar solo lo cambiado (ver _filtro_delta).
+    """
+    inicio = time.perf_counter()
+    col = db[coll]
+    marca = _marca_agua(col, delta)
+    filtro = _filtro_delta(col, marca, previo, desde_previo, delta)
+    archivo = _nombre_parte(db.name, coll, formato, compresion, refs)
+    grid_in = bucket.open_upload_stream(
+        f"{backup_name}/{archivo}",
+        chunk_size_bytes=CHUNK_GRIDFS,
+        metadata={"parte": True, "backup_id": backup_id, "coleccion": coll,
+                  "formato": formato, "compresion": compresion},
+    )
+    salida = _UploadComprimido(grid_in, compresion)
+    docs = 0
+    media = {}
+    if refs:
+        lotes = lotes_referencias(backup_db, col, filtro or {}, backup_id, formato, media)
+    elif formato == "bson":
+        lotes = _lotes_bson(col, filtro or {})
+    else:
+        lotes = _lotes_json(col, filtro or {})
+    try:
+        for n, data in lotes:
+            salida.write(data)
+            docs += n
+        salida.close()
+    except Exception:
+        grid_in.abort()
+        raise
+
+    elapsed = time.perf_counter() - inicio
+    try:
+        opciones = col.options()
+    except Exception:
+        opciones = {}
+    info = {
+        "file_id": str(grid_in._id),
+        "archivo": archivo,
+        "contenido": "refs_gridfs" if refs else "documentos",
+        "modo": "delta" if filtro else "completa",
+        "marca": marca,
+        "docs": docs,
+        "bytes": salida.bytes_in,
+        "bytes_comprimidos": salida.bytes_out,
+        "indices": _indices(col),
+        "opciones": opciones,
+        "elapsed_s": round(elapsed, 3),
+        "docs_por_seg": round(docs / elapsed, 1) if elapsed > 0 else None,
+        "mb_por_seg": round(salida.bytes_in / 1048576 / elapsed, 2) if elapsed > 0 else None,
+    }
+    if refs:
+        info["media"] = media
+    return coll, info
+
+
+def ultimo_backup(bucket):
+    for f in bucket.find({"metadata.tipo": "backup"}, sort=[("uploadDate", -1)], limit=1):
+        return f
+    return None
+
+
+def crear_backup(db, backup_db, formato="json", compresion=None, incremental=False, media="dedup",
+                 colecciones=None, workers=None):
+    """
+    Exporta las colecciones de 'db' (todas salvo system.*) a GridFS en 'backup_db'.
+    formato: "json" o "bson"; compresion: "gzip", "zstd" o None (según el formato).
+    incremental: exporta solo lo cambiado desde el último backup (si no hay uno, o la cadena ya
+    tiene BACKUP_CADENA_MAX incrementales, el backup sale completo).
+    media: "dedup", "excluir" o "incluir" (buckets GridFS, ver backup_media).
+    Si alguna parte falla se borran las ya subidas y se relanza el error.
+    Devuelve el manifiesto (incluye 'file_id' del manifiesto).
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato no soportado: {formato} (usar {', '.join(FORMATOS)})")
+    compresion = compresion or compresion_por_defecto(formato)
+    if compresion not in COMPRESIONES:
+        raise ValueError(f"Compresión no soportada: {compresion} (usar {', '.join(COMPRESIONES)})")
+    if compresion == "zstd" and zstandard is None:
+        raise ValueError("La compresión zstd requiere el paquete 'zstandard'")
+    if media not in MEDIA:
+        raise ValueError(f"Opción media no soportada: {media} (usar {', '.join(MEDIA)})")
+
+    inicio = time.perf_counter()
+    # updated_at se guarda con datetime.utcnow(); la marca de inicio usa el mismo reloj
+    inicio_utc = datetime.utcnow()
+    bucket = gridfs.GridFSBucket(backup_db)
+    # con microsegundos: borrar_backup agrupa las partes por backup_id
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    backup_name = f"backup_{timestamp}"
+    backup_id = backup_name
+
+    padre = None
+    if incremental:
+        grid_padre = ultimo_backup(bucket)
+        if grid_padre is not None:
+            padre = leer_manifiesto(bucket, grid_padre._id)
+            padre["file_id"] = str(grid_padre._id)
+            if len(padre.get("cadena") or []) >= CADENA_MAX or "inicio" not in padre:
+                padre = None
+    previos = (padre or {}).get("colecciones") or {}
+    desde_previo = (padre or {}).get("inicio")
+    if colecciones is None:
+        colecciones = [c for c in db.list_collection_names() if not c.startswith("system.")]
+    chunks = {c for c in colecciones if es_chunks_gridfs(c, colecciones)}
+    con_delta = {c for c in colecciones if _admite_delta(c, colecciones)}
+    if media == "excluir":
+        buckets = {c[:-len(".chunks")] for c in chunks}
+        colecciones = [c for c in colecciones if c.rsplit(".", 1)[0] not in buckets]
+        chunks = set()
+    elif media == "incluir":
+        chunks = set()
+
+    resultados = {}
+    with ThreadPoolExecutor(max_workers=workers or BACKUP_WORKERS, thread_name_prefix="backup") as ex:
+        futuros = [ex.submit(_exportar_coleccion, db, backup_db, bucket, backup_name, backup_id, c, formato,
+                             compresion, (previos.get(c) or {}).get("marca"), desde_previo, c in chunks,
+                             c in con_delta)
+                   for c in colecciones]
+        errores = []
+        for f in futuros:
+            try:
+                coll, info = f.result()
+                resultados[coll] = info
+            except Exception as e:
+                errores.append(e)
+    if errores:
+        for info in resultados.values():
+            try:
+                bucket.delete(ObjectId(info["file_id"]))
+            except Exception:
+                pass
+        if chunks:
+            liberar_blobs(backup_db, backup_id)
+        raise errores[0]
+
+    elapsed = time.perf_counter() - inicio
+    tipo_backup = "incremental" if padre else "completo"
+    manifiesto = {
+        "backup_id": backup_id,
+        "database": db.name,
+        "tipo_backup": tipo_backup,
+        "base": padre["file_id"] if padre else None,
+        "cadena": (padre.get("cadena") or []) + [padre["file_id"]] if padre else [],
+        "formato": formato,
+        "compresion": compresion,
+        "media": media,
+        "inicio": inicio_utc,
+        "created_at": datetime.now().isoformat(),
+        "colecciones": resultados,
+        "docs_total": sum(i["docs"] for i in resultados.values()),
+        "bytes_total": sum(i["bytes_comprimidos"] for i in resultados.values()),
+        "elapsed_s": round(elapsed, 3),
+    }
+    if chunks:
+        manifiesto["media_bytes_nuevos"] = sum(resultados[c]["media"]["bytes_nuevos"] for c in chunks)
+    grid_in = bucket.open_upload_stream(
+        f"{backup_name}.manifest.json",
+        metadata={"tipo": "backup", "backup_id": backup_id, "tipo_backup": tipo_backup, "base": manifiesto["base"],
+                  "raiz": manifiesto["cadena"][0] if manifiesto["cadena"] else None,
+                  "formato": formato, "compresion": compresion,
+                  "bytes_total": manifiesto["bytes_total"], "docs_total": manifiesto["docs_total"]},
+    )
+    with grid_in:
+        grid_in.write(json_util.dumps(manifiesto, ensure_ascii=False, indent=2).encode("utf-8"))
+    manifiesto["file_id"] = str(grid_in._id)
+    return manifiesto
+
+
+def es_parte(grid_file) -> bool:
+    return bool((getattr(grid_file, "metadata", None) or {}).get("parte"))
+
+
+def es_manifiesto(grid_file) -> bool:
+    return (getattr(grid_file, "metadata", None) or {}).get("tipo") == "backup"
+
+
+def leer_manifiesto(bucket, file_id):
+    return json_util.loads(bucket.open_download_stream(file_id).read().decode("utf-8"))
+
+
+def borrar_backup(backup_db, grid_file):
+    """
+    Borra un backup: el manifiesto, sus partes y los blobs multimedia que solo él usaba; o el
+    archivo suelto si es un zip antiguo.
+    """
+    bucket = gridfs.GridFSBucket(backup_db)
+    if es_manifiesto(grid_file):
+        backup_id = grid_file.metadata["backup_id"]
+        for parte in bucket.find({"metadata.parte": True, "metadata.backup_id": backup_id}):
+            bucket.delete(parte._id)
+        liberar_blobs(backup_db, backup_id)
+    bucket.delete(grid_file._id)
+
+
+class _SalidaZip:
+    """Destino no buscable para zipfile: acumula lo escrito hasta que el generador lo recoge."""
+
+    def __init__(self):
+        self._partes = []
+
+    def write(self, data):
+        self._partes.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def recoger(self) -> bytes:
+        data = b"".join(self._partes)
+        self._partes = []
+        return data
+
+
+def _metadata_mongodump(coll, info):
+    """Contenido de <coleccion>.metadata.json tal como lo escribe mongodump."""
+    indices = [{"v": 2, "key": {"_id": 1}, "name": "_id_"}]
+    for spec in info.get("indices", []):
+        idx = {k: v for k, v in spec.items() if k != "key"}
+        idx["key"] = dict(spec["key"])
+        idx["v"] = 2
+        indices.append(idx)
+    return json_util.dumps({"options": info.get("opciones") or {}, "indexes": indices,
+                            "collectionName": coll, "type": "collection"}).encode("utf-8")
+
+
+def _lotes_chunks_resueltos(backup_db, origen, formato, compresion):
+    """Parte de referencias -> chunks completos (desde media_blobs), codificados por lotes."""
+    if compresion == "zstd":
+        stream = zstandard.ZstdDecompressor().stream_reader(origen)
+    else:
+        stream = gzip.GzipFile(fileobj=origen, mode="rb")
+    if formato == "bson":
+        refs = decode_file_iter(stream)
+    else:
+        refs = (json_util.loads(linea) for linea in io.TextIOWrapper(stream, encoding="utf-8") if linea.strip())
+    lote = []
+    for chunk in resolver_chunks(backup_db, refs):
+        lote.append(encode(chunk) if formato == "bson" else (json_util.dumps(chunk) + "\n").encode("utf-8"))
+        if len(lote) >= LOTE_DOCS:
+            yield b"".join(lote)
+            lote = []
+    if lote:
+        yield b"".join(lote)
+
+
+def zip_en_streaming(backup_db, grid_file, trozo=CHUNK_GRIDFS):
+    """
+    Las partes de referencias multimedia se reemplazan por los chunks completos (resueltos contra
+    media_blobs y vueltos a comprimir): el zip es autosuficiente y mongorestore ve '<bucket>.chunks'.
+    """
+    bucket = gridfs.GridFSBucket(backup_db)
+    manifiesto = leer_manifiesto(bucket, grid_file._id)
+    formato = manifiesto.get("formato", "json")
+    compresion = manifiesto.get("compresion", "gzip")
+    salida = _SalidaZip()
+    with zipfile.ZipFile(salida, "w", compression=zipfile.ZIP_STORED) as zf:
+        for coll, info in manifiesto["colecciones"].items():
+            origen = bucket.open_download_stream(ObjectId(info["file_id"]))
+            if info.get("contenido") == "refs_gridfs":
+                info["archivo"] = _nombre_parte(manifiesto["database"], coll, formato, compresion)
+                info["contenido"] = "documentos"
+                destino = _UploadComprimido(zf.open(info["archivo"], "w", force_zip64=True), compresion)
+                for data in _lotes_chunks_resueltos(backup_db, origen, formato, compresion):
+                    destino.write(data)
+                    yield salida.recoger()
+                destino.close()
+            else:
+                with zf.open(info["archivo"], "w", force_zip64=True) as destino:
+                    while True:
+                        data = origen.read(trozo)
+                        if not data:
+                            break
+                        destino.write(data)
+                        yield salida.recoger()
+            if formato == "bson":
+                meta = _metadata_mongodump(coll, info)
+                nombre = f"{manifiesto['database']}/{coll}.metadata.json"
+                if manifiesto.get("compresion") == "gzip":
+                    zf.writestr(nombre + ".gz", gzip.compress(meta))
+                else:
+                    zf.writestr(nombre, meta)
+        zf.writestr("manifest.json", json_util.dumps(manifiesto, ensure_ascii=False, indent=2))
+    yield salida.recoger()
@@ -0,0 +1,110 @@
+"""
+Checkpoints y cancelación del poblamiento (crear_y_poblar_db).
+
+El trabajo en curso se guarda en la colección '_seed_job' de la misma base (un único documento
+{_id: "crear_db"}): perfil, semilla raíz, fecha de referencia, tamaño de lote, estado y, por
+etapa, los lotes ya confirmados y cuántos documentos suman. Cada lote se registra en cuanto su
+insert termina, así que si el proceso muere el trabajo se retoma desde ahí (resume=true) sin
+borrar la base: los lotes pendientes se regeneran idénticos (misma semilla y mismos _id) y un
+lote que quedó a medias se vuelve a insertar tolerando los _id duplicados. Un lote con fallos
+no se registra y una etapa con fallos no queda completa: el trabajo se cierra como "error" y
+resume=true los reintenta.
+
+La cancelación es un Event del proceso: los generadores dejan de encolar lotes y esperan a los
+que ya están en vuelo (que quedan registrados), de modo que se detiene limpio entre lotes.
+
+ - cargar(db): el trabajo guardado o None
+ - crear(db, perfil, semilla_raiz, ahora, chunk): trabajo nuevo (reemplaza al anterior)
+ - pendiente(trabajo): True si el trabajo quedó sin terminar (se puede reanudar)
+ - lotes_hechos(trabajo, etapa) / etapa_hecha(trabajo, etapa) / hechos(trabajo, etapa)
+ - registrar_lote(db, etapa, lote, n): marca un lote como confirmado con n documentos
+ - marcar_etapa(db, etapa, n=None): etapa completa (n = total confirmado si se conoce)
+ - reabrir(db): el trabajo pendiente vuelve a "en_curso" (al reanudar)
+ - cerrar(db, estado): "completado", "cancelado" o "error"
+ - solicitar_cancelacion() / cancelacion: Event que consultan los generadores
+"""
+import threading
+from datetime import datetime, timezone
+
+COLECCION = "_seed_job"
+ID_TRABAJO = "crear_db"
+ESTADOS_PENDIENTES = ("en_curso", "cancelado", "error")
+
+cancelacion = threading.Event()
+
+
+def _ahora():
+    return datetime.now(timezone.utc)
+
+
+def cargar(db):
+    trabajo = db[COLECCION].find_one({"_id": ID_TRABAJO})
+    if trabajo and trabajo["ahora"].tzinfo is None:
+        # pymongo devuelve datetimes sin tz (UTC)
+        trabajo["ahora"] = trabajo["ahora"].replace(tzinfo=timezone.utc)
+    return trabajo
+
+
+def crear(db, perfil, semilla_raiz, ahora, chunk):
+    trabajo = {
+        "_id": ID_TRABAJO,
+        "perfil": perfil,
+        # la semilla raíz puede pasar de 64 bits: se guarda como texto
+        "semilla": str(semilla_raiz),
+        "ahora": ahora,
+        "chunk": chunk,
+        "estado": "en_curso",
+        "etapas": {},
+        "inicio": _ahora(),
+        "actualizado": _ahora(),
+    }
+    db[COLECCION].replace_one({"_id": ID_TRABAJO}, trabajo, upsert=True)
+    return trabajo
+
+
+def pendiente(trabajo):
+    return trabajo is not None and trabajo.get("estado") in ESTADOS_PENDIENTES
+
+
+def _etapa(trabajo, etapa):
+    return (trabajo or {}).get("etapas", {}).get(etapa, {})
+
+
+def lotes_hechos(trabajo, etapa):
+    return set(_etapa(trabajo, etapa).get("lotes", []))
+
+
+def etapa_hecha(trabajo, etapa):
+    return bool(_etapa(trabajo, etapa).get("completa"))
+
+
+def hechos(trabajo, etapa):
+    return int(_etapa(trabajo, etapa).get("docs", 0))
+
+
+def registrar_lote(db, etapa, lote, n):
+    db[COLECCION].update_one(
+        {"_id": ID_TRABAJO},
+        {"$addToSet": {f"etapas.{etapa}.lotes": lote},
+         "$inc": {f"etapas.{etapa}.docs": int(n)},
+         "$set": {"actualizado": _ahora()}},
+    )
+
+
+def marcar_etapa(db, etapa, n=None):
+    cambios = {f"etapas.{etapa}.completa": True, "actualizado": _ahora()}
+    if n is not None:
+        cambios[f"etapas.{etapa}.docs"] = int(n)
+    db[COLECCION].update_one({"_id": ID_TRABAJO}, {"$set": cambios})
+
+
+def reabrir(db):
+    cerrar(db, "en_curso")
+
+
+def cerrar(db, estado):
+    db[COLECCION].update_one({"_id": ID_TRABAJO}, {"$set": {"estado": estado, "actualizado": _ahora()}})
+
+
+def solicitar_cancelacion():
+    cancelacion.set()
@@ -9,12 +9,15 @@ import bcrypt
 from pymongo import ASCENDING, IndexModel
 
 # --- Importaciones añadidas del script de multimedia ---
-import io
-import numpy as np
-from PIL import Image
-import cv2
 import gridfs
-import os
+import numpy as np
+
+from .backup_writer import asegurar_indices_delta
+from .generador_datos import contexto_generacion, poblar_coleccion
+from .generador_multimedia import poblar_multimedia_paralelo
+from .perfiles_datos import CHUNK_PERFIL, id_determinista, obtener_perfil, sal_bcrypt, semilla
+from . import checkpoint_seed, progreso_registro
+from .generador_datos import CHUNK_DOCS
 # ---------------------------------------------
 
 
@@ -26,6 +29,7 @@ logging.basicConfig(level=logging.INFO)
 # ---------------------------------------------
 # Este es el único lugar que necesitas editar para controlar
 # el número de registros en toda la base de datos.
+# (Para benchmarks reproducibles usar un perfil: ver perfiles_datos.PERFILES)
 
 CONFIG_REGISTROS = {
     # --- Colecciones Principales ---
@@ -57,21 +61,18 @@ DEFAULT_PASSWORD = "1234"
 # ---------------------------------------------
 # CONSTANTES DE MULTIMEDIA (#!NUEVO)
 # ---------------------------------------------
-IMG_ANCHO, IMG_ALTO = 128, 128
-VID_FPS = 10
-VID_DURACION = 5  # segundos
-
-# --- Cantidades de Multimedia ---
-# Las constantes de conteo TOTAL_... se eliminaron (#!MODIFICADO)
-# Ahora se leen desde CONFIG_REGISTROS.
+# Tamaños de imagen/video y reparto en tareas: ver generador_multimedia.
+# Las cantidades se leen desde CONFIG_REGISTROS.
 
 
 # =============================================
 # FUNCIONES AUXILIARES (Poblamiento Principal)
 # =============================================
 
-def _hash_password(password: str) -> bytes:
-    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
+def _hash_password(password: str, rng=None) -> bytes:
+    # con un perfil la sal sale del rng sembrado: mismo hash en cada poblamiento
+    sal = sal_bcrypt(rng) if rng is not None else bcrypt.gensalt()
+    return bcrypt.hashpw(password.encode("utf-8"), sal)
 
 
 def _seed_areas() -> List[Dict[str, Any]]:
@@ -142,55 +143,6 @@ def _batch_insert(collection, docs: List[Dict], batch_size: int = BATCH_SIZE) ->
     return inserted, failed
 
 
-# =============================================
-# FUNCIONES AUXILIRES DE MULTIMEDIA (#!NUEVO)
-# =============================================
-
-def _guardar_en_mongo_gridfs(fs: gridfs.GridFS, data_bytes, filename, tipo, content_type):
-    """Guarda un archivo binario directamente en MongoDB (GridFS)."""
-    fs.put(data_bytes, filename=filename, tipo=tipo, contentType=content_type)
-
-
-def _generar_imagen_color(fs: gridfs.GridFS, i: int):
-    """Genera una imagen de color sólido y la guarda en MongoDB."""
-    color = tuple(np.random.randint(0, 256, 3))
-    img = Image.new("RGB", (IMG_ANCHO, IMG_ALTO), color)
-    buffer = io.BytesIO()
-    img.save(buffer, format="PNG")
-    _guardar_en_mongo_gridfs(fs, buffer.getvalue(), f"imagen_{i:05}.png", "imagen", "image/png")
-
-
-def _generar_imagen_ruido(fs: gridfs.GridFS, i: int):
-    """Genera una imagen de ruido aleatorio y la guarda en MongoDB."""
-    ruido = np.random.randint(0, 256, (IMG_ALTO, IMG_ANCHO, 3), dtype=np.uint8)
-    img = Image.fromarray(ruido)
-    buffer = io.BytesIO()
-    img.save(buffer, format="PNG")
-    _guardar_en_mongo_gridfs(fs, buffer.getvalue(), f"foto_{i:05}.png", "foto", "image/png")
-
-
-def _generar_video(fs: gridfs.GridFS, i: int):
-    """Genera un video corto con colores aleatorios y lo guarda en MongoDB."""
-    nombre = f"video_{i:05}.mp4"
-    ruta_temporal = os.path.join(os.getcwd(), nombre)  # Ruta temporal
-
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    video = cv2.VideoWriter(ruta_temporal, fourcc, VID_FPS, (IMG_ANCHO, IMG_ALTO))
-
-    for _ in range(VID_FPS * VID_DURACION):
-        frame = np.random.randint(0, 256, (IMG_ALTO, IMG_ANCHO, 3), dtype=np.uint8)
-        video.write(frame)
-    video.release()
-
-    try:
-        with open(ruta_temporal, "rb") as f:
-            _guardar_en_mongo_gridfs(fs, f.read(), nombre, "video", "video/mp4")
-    finally:
-        # Asegurarse de borrar el archivo temporal
-        if os.path.exists(ruta_temporal):
-            os.remove(ruta_temporal)
-
-
 # =============================================
 # FUNCIONES DE CONTROL
 # =============================================
@@ -257,6 +209,8 @@ def asegurar_base(get_db_callable: Callable[[], Any]) -> Dict[str, str]:
         db["ventas"].create_indexes([ventas_idx])
     except Exception as e:
         logger.debug("Índice ventas: %s", e)
+    # updated_at: filtro de los backups incrementales (también se crean al arrancar)
+    asegurar_indices_delta(db)
     try:
         db["logs"].create_indexes([logs_idx])
     except Exception as e:
@@ -302,17 +256,20 @@ def _base_ya_poblada(db) -> Tuple[bool, int]:
 
 
 # (#!NUEVO) Función dedicada para poblar multimedia (#!MODIFICADO)
-def poblar_multimedia(db: Any, num_imagenes: int, num_fotos: int, num_videos: int) -> Dict[str, Any]:
+def poblar_multimedia(db: Any, num_imagenes: int, num_fotos: int, num_videos: int,
+                      seed=None, referencia: datetime = None, al_progresar: Callable = None,
+                      tareas_hechas=None, reanudar: bool = False) -> Dict[str, Any]:
     """
     Puebla la colección 'multimedia' (GridFS) con imágenes y videos.
-    Ahora recibe los conteos como parámetros.
+    Ahora recibe los conteos como parámetros. seed/referencia hacen la generación reproducible;
+    reanudar=True retoma un poblamiento cortado (solo las tareas fuera de 'tareas_hechas').
     """
     logger.info("Iniciando poblamiento de multimedia (GridFS)...")
     fs = gridfs.GridFS(db, collection="multimedia")
     
-    # Chequear si ya hay multimedia para no duplicar
+    # Chequear si ya hay multimedia para no duplicar (al reanudar, lo que hay es nuestro)
     try:
-        if fs.exists():
+        if not reanudar and fs.exists():
              count = db["multimedia.files"].count_documents({})
              if count > 0:
                  logger.warning("Colección 'multimedia' (GridFS) ya contiene %s archivos. Se omite poblamiento.", count)
@@ -321,42 +278,32 @@ def poblar_multimedia(db: Any, num_imagenes: int, num_fotos: int, num_videos: in
         logger.error("Error al chequear GridFS: %s", e)
         # Continuar de todos modos, pero loguear el error
 
-    # 1. Imágenes de color
-    logger.info("🎨 Generando y guardando imágenes de color...")
-    for i in range(1, num_imagenes + 1): # (#!MODIFICADO)
-        try:
-            _generar_imagen_color(fs, i)
-            if i % 1000 == 0 or i == num_imagenes:
-                logger.info("✅ %s/%s imágenes guardadas", i, num_imagenes) # (#!MODIFICADO)
-        except Exception as e:
-            logger.warning("Fallo al generar imagen color %s: %s", i, e)
-
-    # 2. Fotos de ruido
-    logger.info("📸 Generando y guardando fotos (ruido)...")
-    for i in range(1, num_fotos + 1): # (#!MODIFICADO)
-        try:
-            _generar_imagen_ruido(fs, i)
-            if i % 1000 == 0 or i == num_fotos:
-                logger.info("✅ %s/%s fotos guardadas", i, num_fotos) # (#!MODIFICADO)
-        except Exception as e:
-            logger.warning("Fallo al generar foto ruido %s: %s", i, e)
+    # Render y subida en paralelo (ver generador_multimedia); el avance por tipo se
+    # publica en el registro de progreso a medida que terminan las tareas
+    for etapa in ProgressMonitor._MULTIMEDIA:
+        progreso_registro.marcar(etapa, "running")
+    resumen = poblar_multimedia_paralelo(
+        db,
+        {"imagen": num_imagenes, "foto": num_fotos, "video": num_videos},
+        al_progresar=al_progresar or ProgressMonitor.reportar_multimedia,
+        seed=seed,
+        referencia=referencia,
+        tareas_hechas=tareas_hechas,
+        reanudar=reanudar,
+        cancelado=checkpoint_seed.cancelacion,
+    )
 
-    # 3. Videos
-    logger.info("🎥 Generando y guardando videos...")
-    for i in range(1, num_videos + 1): # (#!MODIFICADO)
-        try:
-            _generar_video(fs, i)
-            if i % 100 == 0 or i == num_videos:
-                logger.info("🎬 %s/%s videos guardados", i, num_videos) # (#!MODIFICADO)
-        except Exception as e:
-            logger.warning("Fallo al generar video %s: %s", i, e)
-    
-    logger.info("🎉 ¡Poblamiento de multimedia completo!")
+    if checkpoint_seed.cancelacion.is_set():
+        logger.info("Poblamiento de multimedia cancelado")
+    else:
+        logger.info("🎉 ¡Poblamiento de multimedia completo!")
     return {
-        "imagenes_creadas": num_imagenes, # (#!MODIFICADO)
-        "fotos_creadas": num_fotos, # (#!MODIFICADO)
-        "videos_creados": num_videos, # (#!MODIFICADO)
-        "status": "completado"
+        "imagenes_creadas": resumen.get("imagen", {}).get("hechos", 0),
+        "fotos_creadas": resumen.get("foto", {}).get("hechos", 0),
+        "videos_creados": resumen.get("video", {}).get("hechos", 0),
+        "fallidos": sum(r["fallidos"] for r in resumen.values()),
+        "por_seg_worker": {tipo: r["por_seg_worker"] for tipo, r in resumen.items()},
+        "status": "cancelado" if checkpoint_seed.cancelacion.is_set() else "completado"
     }
 
 # =============================================
@@ -364,38 +311,82 @@ def poblar_multimedia(db: Any, num_imagenes: int, num_fotos: int, num_videos: in
 # =============================================
 
 # (#!MODIFICADO) Se elimina el parámetro 'total_records'
-def crear_y_poblar_db(get_db_callable: Callable[[], Any]) -> Dict[str, Any]:
+def crear_y_poblar_db(get_db_callable: Callable[[], Any], perfil: str = None, reanudar: bool = False) -> Dict[str, Any]:
     """
     Crea/asegura colecciones e índices y luego puebla la base usando
     la configuración global 'CONFIG_REGISTROS'.
     Finalmente, puebla GridFS con archivos multimedia.
+
+    perfil: nombre de un perfil de perfiles_datos ("small", "medium", "500k", "5M"). Toma sus
+    conteos en lugar de CONFIG_REGISTROS y genera con su semilla, fecha de referencia y
+    distribución: el mismo perfil produce siempre los mismos documentos.
+
+    Cada etapa deja checkpoints (ver checkpoint_seed). reanudar=True retoma el trabajo guardado
+    (con su perfil, semilla y fecha) desde los lotes confirmados, sin borrar lo ya poblado;
+    checkpoint_seed.solicitar_cancelacion() lo detiene entre lotes (resultado con "cancelado").
     """
     db = get_db_callable()
     if db is None:
         raise RuntimeError("get_db_callable retornó None")
+    trabajo = checkpoint_seed.cargar(db)
+    if reanudar:
+        if not checkpoint_seed.pendiente(trabajo):
+            raise ValueError("No hay un poblamiento pendiente para reanudar")
+        perfil = trabajo.get("perfil")
+    nombre_perfil = perfil
+    perfil = obtener_perfil(perfil) if perfil else None
+    registros = perfil["registros"] if perfil else CONFIG_REGISTROS
+
+    ProgressMonitor.iniciar(registros)
 
     # 1) Asegurar estructura
     resultado_asegurar = asegurar_base(get_db_callable)
 
-    # 2) Comprobar si ya hay datos para evitar duplicados
-    already, total_docs = _base_ya_poblada(db)
-    if already:
-        mensaje = f"Base ya existente con {total_docs} documentos; se omite poblamiento."
-        logger.info(mensaje)
-        return {"mensaje": resultado_asegurar.get("mensaje", ""), "resumen": {"inserted_total": 0, "reason": mensaje}}
+    if reanudar:
+        checkpoint_seed.reabrir(db)
+        ahora, raiz, chunk = trabajo["ahora"], int(trabajo["semilla"]), trabajo["chunk"]
+        # lo ya confirmado cuenta desde el principio en el progreso
+        for etapa in trabajo.get("etapas", {}):
+            progreso_registro.sumar(etapa, checkpoint_seed.hechos(trabajo, etapa))
+        logger.info("Reanudando poblamiento (perfil %s) desde los checkpoints", nombre_perfil)
+    else:
+        # 2) Comprobar si ya hay datos para evitar duplicados
+        already, total_docs = _base_ya_poblada(db)
+        if already:
+            mensaje = f"Base ya existente con {total_docs} documentos; se omite poblamiento."
+            if checkpoint_seed.pendiente(trabajo):
+                mensaje += " Hay un poblamiento sin terminar: usar resume=true para continuarlo."
+            logger.info(mensaje)
+            progreso_registro.finalizar(mensaje)
+            return {"mensaje": resultado_asegurar.get("mensaje", ""), "resumen": {"inserted_total": 0, "reason": mensaje}}
+        # sin perfil la semilla raíz se sortea, pero queda guardada para poder reanudar
+        ahora = perfil["referencia"] if perfil else datetime.now(timezone.utc)
+        raiz = perfil["seed"] if perfil else np.random.SeedSequence().entropy
+        chunk = CHUNK_PERFIL if perfil else CHUNK_DOCS
+        trabajo = checkpoint_seed.crear(db, nombre_perfil, raiz, ahora, chunk)
+
+    def _semilla(etapa):
+        return semilla({"seed": raiz}, etapa)
+
+    def _rng(etapa):
+        return np.random.default_rng(_semilla(etapa))
+
+    def _id(coleccion, indice):
+        # _id deterministas siempre: un lote reintentado choca con lo ya insertado en vez de duplicar
+        return {"_id": id_determinista(ahora, coleccion, indice)}
 
     # 3) Obtener la configuración de registros (#!MODIFICADO)
     colecciones = _colecciones_necesarias()
     
-    # Usamos la configuración global 'CONFIG_REGISTROS' directamente
+    # Usamos 'CONFIG_REGISTROS' (o los registros del perfil) directamente
     # Se usan valores .get() para evitar errores si falta una clave
     counts = {
-        "usuarios": CONFIG_REGISTROS.get("usuarios", 50),
-        "areas": CONFIG_REGISTROS.get("areas", 11),
-        "productos": CONFIG_REGISTROS.get("productos", 100),
-        "clientes": CONFIG_REGISTROS.get("clientes", 1000),
-        "ventas": CONFIG_REGISTROS.get("ventas", 1000),
-        "logs": CONFIG_REGISTROS.get("logs", 1000),
+        "usuarios": registros.get("usuarios", 50),
+        "areas": registros.get("areas", 11),
+        "productos": registros.get("productos", 100),
+        "clientes": registros.get("clientes", 1000),
+        "ventas": registros.get("ventas", 1000),
+        "logs": registros.get("logs", 1000),
     }
 
     # (#!MODIFICADO) Se elimina la lógica de distribución y rebalanceo.
@@ -426,116 +417,172 @@ def crear_y_poblar_db(get_db_callable: Callable[[], Any]) -> Dict[str, Any]:
     summary = {k: 0 for k in colecciones}
     failed_summary = {k: 0 for k in colecciones}
 
+    def _rehacer(col):
+        """Etapas pequeñas: se rehacen enteras si no quedaron completas en el checkpoint."""
+        if checkpoint_seed.etapa_hecha(trabajo, col):
+            summary[col] = checkpoint_seed.hechos(trabajo, col)
+            progreso_registro.marcar(col, "done")
+            return False
+        if reanudar:
+            db[col].delete_many({})
+        return True
+
+    def _publicar(col):
+        # etapas pequeñas: se publican de una vez al terminar; con fallos no quedan completas
+        progreso_registro.sumar(col, summary[col], failed_summary[col])
+        progreso_registro.marcar(col, "done")
+        if not failed_summary[col]:
+            checkpoint_seed.marcar_etapa(db, col, summary[col])
+
+    def _al_progresar(col):
+        def _lote(ins, fail, lote):
+            progreso_registro.sumar(col, ins, fail)
+            # un lote con fallos no se registra: al reanudar se reintenta
+            if not fail:
+                checkpoint_seed.registrar_lote(db, col, lote, ins)
+        return _lote
+
+    def _cancelado():
+        if not checkpoint_seed.cancelacion.is_set():
+            return False
+        checkpoint_seed.cerrar(db, "cancelado")
+        progreso_registro.finalizar("Poblamiento cancelado; se puede reanudar con resume=true", status="cancelled")
+        logger.info("Poblamiento cancelado. Parcial: %s", summary)
+        return True
+
+    def _resultado(resumen_multimedia=None, cancelado=False):
+        return {
+            **summary,
+            "inserted_total": sum(summary.values()),
+            "failed_total": sum(failed_summary.values()),
+            "failed_details": failed_summary,
+            "multimedia_summary": resumen_multimedia,  # (#!NUEVO)
+            "perfil": {"nombre": perfil["nombre"], "seed": perfil["seed"]} if perfil else None,
+            "reanudado": reanudar,
+            "cancelado": cancelado,
+        }
+
     # Areas (upsert por _id)
-    try:
-        areas_col = db["areas"]
-        areas_docs = _seed_areas()
-        # Solo inserta las áreas necesarias hasta el conteo,
-        # pero asegura que las 11 base estén si el conteo es >= 11
-        docs_a_insertar = areas_docs[:counts["areas"]]
+    if _rehacer("areas"):
+        try:
+            areas_col = db["areas"]
+            areas_docs = _seed_areas()
+            # Solo inserta las áreas necesarias hasta el conteo,
+            # pero asegura que las 11 base estén si el conteo es >= 11
+            docs_a_insertar = areas_docs[:counts["areas"]]
         
-        if not docs_a_insertar and counts["areas"] > 0:
-            # Si el usuario pide más áreas que las 11 de seed, creamos sintéticas
-            for i in range(len(areas_docs), counts["areas"]):
-                docs_a_insertar.append({"_id": i + 1, "nombre": f"Area Sintetica {i+1}"})
+            if not docs_a_insertar and counts["areas"] > 0:
+                # Si el usuario pide más áreas que las 11 de seed, creamos sintéticas
+                for i in range(len(areas_docs), counts["areas"]):
+                    docs_a_insertar.append({"_id": i + 1, "nombre": f"Area Sintetica {i+1}"})
         
-        for a in docs_a_insertar:
-            areas_col.replace_one({"_id": a["_id"]}, a, upsert=True)
-        summary["areas"] = len(docs_a_insertar)
+            for a in docs_a_insertar:
+                areas_col.replace_one({"_id": a["_id"]}, a, upsert=True)
+            summary["areas"] = len(docs_a_insertar)
         
-    except Exception as e:
-        logger.exception("Fallo al insertar areas: %s", e)
-        failed_summary["areas"] = counts["areas"]
+        except Exception as e:
+            logger.exception("Fallo al insertar areas: %s", e)
+            failed_summary["areas"] = counts["areas"]
+        _publicar("areas")
 
     # Productos base (seed) + synthetic
-    try:
-        productos_col = db["productos"]
-        base_products = _seed_products_for_areas()
+    if _rehacer("productos"):
+        rng = _rng("productos")
+        try:
+            productos_col = db["productos"]
+            base_products = _seed_products_for_areas()
         
-        # Aseguramos que los productos base se inserten si el conteo lo permite
-        productos_a_insertar_seed = base_products[:counts["productos"]]
+            # Aseguramos que los productos base se inserten si el conteo lo permite
+            productos_a_insertar_seed = base_products[:counts["productos"]]
         
-        for p in productos_a_insertar_seed:
-            doc = {
-                **p,
-                "created_at": datetime.now(timezone.utc),
-                "activo": True,
-                "stock": random.randint(1, 500),
-                "sku": p.get("sku", f"SKU-{random.randint(1000,9999)}")
-            }
-            # (Corregido) El _id de area es un INT en tu seed, así que p["area_id"] es correcto
-            productos_col.replace_one({"nombre": p["nombre"], "area_id": p["area_id"]}, doc, upsert=True)
-        summary["productos"] += len(productos_a_insertar_seed)
-    except Exception as e:
-        logger.exception("Fallo al insertar productos seed: %s", e)
-        failed_summary["productos"] += len(productos_a_insertar_seed)
+            for k, p in enumerate(productos_a_insertar_seed):
+                doc = {
+                    **_id("productos", k),
+                    **p,
+                    "created_at": ahora,
+                    "activo": True,
+                    "stock": int(rng.integers(1, 501)),
+                    "sku": p.get("sku", f"SKU-{int(rng.integers(1000, 10000))}")
+                }
+                # (Corregido) El _id de area es un INT en tu seed, así que p["area_id"] es correcto
+                productos_col.replace_one({"nombre": p["nombre"], "area_id": p["area_id"]}, doc, upsert=True)
+            summary["productos"] += len(productos_a_insertar_seed)
+        except Exception as e:
+            logger.exception("Fallo al insertar productos seed: %s", e)
+            failed_summary["productos"] += len(productos_a_insertar_seed)
 
-    extra_products = max(0, counts["productos"] - summary["productos"])
-    if extra_products > 0:
-        synthetic_products: List[Dict] = []
-        try:
-            # (Corregido) Los _id de area son INTs
-            areas_snapshot = list(db["areas"].find({}, {"_id": 1}))
-            if not areas_snapshot:
+        extra_products = max(0, counts["productos"] - summary["productos"])
+        if extra_products > 0:
+            synthetic_products: List[Dict] = []
+            try:
+                # (Corregido) Los _id de area son INTs
+                areas_snapshot = list(db["areas"].find({}, {"_id": 1}).sort("_id", ASCENDING))
+                if not areas_snapshot:
+                    areas_snapshot = [{"_id": a["_id"]} for a in _seed_areas()[:counts["areas"]]]
+            except Exception:
                 areas_snapshot = [{"_id": a["_id"]} for a in _seed_areas()[:counts["areas"]]]
-        except Exception:
-            areas_snapshot = [{"_id": a["_id"]} for a in _seed_areas()[:counts["areas"]]]
-
-        if not areas_snapshot: # Fallback si no hay áreas
-            logger.warning("No se encontraron áreas para asignar a productos sintéticos.")
-            areas_snapshot = [{"_id": 1}]
-
-        for _ in range(extra_products):
-            prod = {
-                "nombre": f"Producto Synthetic {random.randint(1_000_000, 9_999_999)}",
-                "precio": round(random.uniform(5, 500), 2),
-                "area_id": random.choice(areas_snapshot)["_id"], # Asigna un area_id (INT)
-                "sku": f"SYN-{random.randint(100000,999999)}",
-                "stock": random.randint(0, 500),
-                "activo": True,
-                "created_at": datetime.now(timezone.utc)
-            }
-            synthetic_products.append(prod)
-        ins, fail = _batch_insert(productos_col, synthetic_products)
-        summary["productos"] += ins
-        failed_summary["productos"] += fail
+
+            if not areas_snapshot: # Fallback si no hay áreas
+                logger.warning("No se encontraron áreas para asignar a productos sintéticos.")
+                areas_snapshot = [{"_id": 1}]
+
+            for k in range(summary["productos"], summary["productos"] + extra_products):
+                prod = {
+                    **_id("productos", k),
+                    "nombre": f"Producto Synthetic {int(rng.integers(1_000_000, 10_000_000))}",
+                    "precio": round(float(rng.uniform(5, 500)), 2),
+                    "area_id": areas_snapshot[int(rng.integers(0, len(areas_snapshot)))]["_id"], # Asigna un area_id (INT)
+                    "sku": f"SYN-{int(rng.integers(100000, 1000000))}",
+                    "stock": int(rng.integers(0, 501)),
+                    "activo": True,
+                    "created_at": ahora
+                }
+                synthetic_products.append(prod)
+            ins, fail = _batch_insert(productos_col, synthetic_products)
+            summary["productos"] += ins
+            failed_summary["productos"] += fail
+        _publicar("productos")
 
     # Usuarios (seed + synthetic)
-    try:
-        usuarios_col = db["usuarios"]
-        pwd_hashed = _hash_password(DEFAULT_PASSWORD)
-        seed_users = [
-            {"usuario": "admin", "usuario_key": "admin", "rol": "administrador", "password_hash": pwd_hashed, "activo": True, "created_at": datetime.now(timezone.utc)},
-            {"usuario": "trabajador1", "usuario_key": "trabajador1", "rol": "trabajador", "password_hash": pwd_hashed, "activo": True, "created_at": datetime.now(timezone.utc)},
-            {"usuario": "cliente1", "usuario_key": "cliente1", "rol": "cliente", "password_hash": pwd_hashed, "activo": True, "created_at": datetime.now(timezone.utc)}
-        ]
+    if _rehacer("usuarios"):
+        rng = _rng("usuarios")
+        try:
+            usuarios_col = db["usuarios"]
+            pwd_hashed = _hash_password(DEFAULT_PASSWORD, rng if perfil else None)
+            seed_users = [
+                {"usuario": "admin", "usuario_key": "admin", "rol": "administrador", "password_hash": pwd_hashed, "activo": True, "created_at": ahora},
+                {"usuario": "trabajador1", "usuario_key": "trabajador1", "rol": "trabajador", "password_hash": pwd_hashed, "activo": True, "created_at": ahora},
+                {"usuario": "cliente1", "usuario_key": "cliente1", "rol": "cliente", "password_hash": pwd_hashed, "activo": True, "created_at": ahora}
+            ]
         
-        # Insertar seeds si el conteo lo permite
-        users_a_insertar_seed = seed_users[:counts["usuarios"]]
+            # Insertar seeds si el conteo lo permite
+            users_a_insertar_seed = [{**_id("usuarios", k), **u} for k, u in enumerate(seed_users[:counts["usuarios"]])]
         
-        for u in users_a_insertar_seed:
-            usuarios_col.replace_one({"usuario_key": u["usuario_key"]}, u, upsert=True)
-        summary["usuarios"] = len(users_a_insertar_seed)
-    except Exception as e:
-        logger.exception("Fallo al insertar usuarios seed: %s", e)
-        failed_summary["usuarios"] += len(users_a_insertar_seed)
-
-    extra_users = max(0, counts["usuarios"] - summary["usuarios"])
-    if extra_users > 0:
-        synthetic_users: List[Dict] = []
-        for _ in range(extra_users):
-            key = f"user{random.randint(1000000,9999999)}"
-            synthetic_users.append({
-                "usuario": f"User {key}",
-                "usuario_key": key,
-                "password_hash": pwd_hashed,
-                "rol": random.choice(ROLES),
-                "activo": True,
-                "created_at": datetime.now(timezone.utc)
-            })
-        ins, fail = _batch_insert(usuarios_col, synthetic_users)
-        summary["usuarios"] += ins
-        failed_summary["usuarios"] += fail
+            for u in users_a_insertar_seed:
+                usuarios_col.replace_one({"usuario_key": u["usuario_key"]}, u, upsert=True)
+            summary["usuarios"] = len(users_a_insertar_seed)
+        except Exception as e:
+            logger.exception("Fallo al insertar usuarios seed: %s", e)
+            failed_summary["usuarios"] += len(users_a_insertar_seed)
+
+        extra_users = max(0, counts["usuarios"] - summary["usuarios"])
+        if extra_users > 0:
+            synthetic_users: List[Dict] = []
+            for k in range(summary["usuarios"], summary["usuarios"] + extra_users):
+                key = f"user{int(rng.integers(1000000, 10000000))}"
+                synthetic_users.append({
+                    **_id("usuarios", k),
+                    "usuario": f"User {key}",
+                    "usuario_key": key,
+                    "password_hash": pwd_hashed,
+                    "rol": ROLES[int(rng.integers(0, len(ROLES)))],
+                    "activo": True,
+                    "created_at": ahora
+                })
+            ins, fail = _batch_insert(usuarios_col, synthetic_users)
+            summary["usuarios"] += ins
+            failed_summary["usuarios"] += fail
+        _publicar("usuarios")
 
     # --- (#!NUEVO) Creación de Lookups para Clientes y Ventas ---
     try:
@@ -543,7 +590,7 @@ def crear_y_poblar_db(get_db_callable: Callable[[], Any]) -> Dict[str, Any]:
         products_snapshot = list(db["productos"].find(
             {"activo": True}, # Solo vender productos activos
             {"_id": 1, "nombre": 1, "precio": 1, "area_id": 1} # Pedimos los 4 campos
-        ))
+        ).sort("_id", ASCENDING))  # orden estable: la popularidad del perfil se asigna por posición
         if not products_snapshot:
             logger.warning("No se encontraron productos en la BD, usando seeds como fallback...")
             # Fallback simple si 'productos' falló
@@ -564,191 +611,173 @@ def crear_y_poblar_db(get_db_callable: Callable[[], Any]) -> Dict[str, Any]:
     # --- Fin de Lookups ---
 
 
-    # Clientes (#!MODIFICADO para usar la estructura correcta)
+    # Clientes, ventas y logs: lotes vectorizados con NumPy, insertados a medida que se generan
+    # y repartidos en un pool de procesos (ver generador_datos)
+    # Con perfil: semilla por colección, lote fijo (CHUNK_PERFIL) y fechas desde la referencia
+    contexto = contexto_generacion(products_snapshot, area_lookup, perfil=perfil, n_clientes=counts["clientes"],
+                                   referencia=ahora)
+    opciones = {"ahora": ahora, "chunk": chunk, "cancelado": checkpoint_seed.cancelacion}
     try:
-        clientes_col = db["clientes"]
-        clientes_needed = counts["clientes"]
-        clientes_docs: List[Dict] = []
-        
-        for _ in range(clientes_needed):
-            num_productos = random.randint(1, 5)
-            seleccion = random.choices(products_snapshot, k=num_productos)
-            productos_finales = []
-            total_price = 0.0
-            
-            for prod in seleccion:
-                precio = float(prod.get("precio", 0))
-                cantidad = random.randint(1, 5)
-                subtotal = precio * cantidad
-                total_price += subtotal
-                
-                # --- NUEVA ESTRUCTURA ---
-                area_id = prod.get("area_id")
-                area_nombre = area_lookup.get(area_id, "Area Desconocida")
-                
-                productos_finales.append({
-                    "producto_id": prod.get("_id"), # ObjectId o Int
-                    "nombre": prod.get("nombre"),
-                    "precio": precio,
-                    "cantidad": cantidad,
-                    "subtotal": subtotal,
-                    "area_id": str(area_id), # Guardar como string
-                    "area_nombre": area_nombre
-                })
-                # --- FIN NUEVA ESTRUCTURA ---
-
-            fecha_creacion = _random_datetime_within_last_days(90)
-            cliente_doc = {
-                "nombre": f"Cliente {random.randint(1_000_000, 9_999_999)}",
-                "contacto": {"telefono": f"55{random.randint(10000000,99999999)}"},
-                "productos": productos_finales, # <-- ¡Ahora con estructura completa!
-                "total": round(total_price, 2),
-                "fecha": fecha_creacion.isoformat(),
-                "created_at": fecha_creacion
-            }
-            clientes_docs.append(cliente_doc)
-
-        if clientes_docs:
-            ins, fail = _batch_insert(clientes_col, clientes_docs)
-            summary["clientes"] += ins
-            failed_summary["clientes"] += fail
+        progreso_registro.marcar("clientes", "running")
+        ins, fail = poblar_coleccion(db, "clientes", counts["clientes"], contexto, seed=_semilla("clientes"),
+                                     al_progresar=_al_progresar("clientes"),
+                                     lotes_hechos=checkpoint_seed.lotes_hechos(trabajo, "clientes"), **opciones)
+        summary["clientes"] += checkpoint_seed.hechos(trabajo, "clientes") + ins
+        failed_summary["clientes"] += fail
+        if not checkpoint_seed.cancelacion.is_set():
+            if not fail:
+                checkpoint_seed.marcar_etapa(db, "clientes")
+            progreso_registro.marcar("clientes", "done")
     except Exception as e:
         logger.exception("Fallo al poblar clientes: %s", e)
         failed_summary["clientes"] += counts.get("clientes", 0)
+        progreso_registro.marcar("clientes", "error")
+    if _cancelado():
+        return _resultado(cancelado=True)
 
-    # Ventas (#!MODIFICADO para usar la estructura correcta)
     try:
-        ventas_col = db["ventas"]
-        ventas_needed = counts["ventas"]
-        ventas_docs: List[Dict] = []
-        
-        try:
-            sample_client_ids = [d["_id"] for d in db["clientes"].find({}, {"_id": 1}).limit(1000)]
-        except Exception:
-            sample_client_ids = []
-
-        # (Usamos products_snapshot y area_lookup de la sección anterior)
-
-        for i in range(ventas_needed):
-            seleccion = random.choices(products_snapshot, k=random.randint(1, 5))
-            productos_finales = []
-            total_price = 0.0
-            
-            for prod in seleccion:
-                precio = float(prod.get("precio", 0))
-                cantidad = random.randint(1, 5)
-                subtotal = precio * cantidad
-                total_price += subtotal
-                
-                # --- NUEVA ESTRUCTURA (igual que en Clientes) ---
-                area_id = prod.get("area_id")
-                area_nombre = area_lookup.get(area_id, "Area Desconocida")
-                
-                productos_finales.append({
-                    "producto_id": prod.get("_id"),
-                    "nombre": prod.get("nombre"),
-                    "precio": precio,
-                    "cantidad": cantidad,
-                    "subtotal": subtotal,
-                    "area_id": str(area_id),
-                    "area_nombre": area_nombre
-                })
-                # --- FIN NUEVA ESTRUCTURA ---
-            
-            # (#!NUEVO) Fechas consistentes
-            fecha_venta = _random_datetime_within_last_days(200_000)
-
-            venta = {
-                "cliente_ref": random.choice(sample_client_ids) if sample_client_ids else None,
-                "productos": productos_finales, # <-- ¡Ahora con estructura completa!
-                "total": round(total_price, 2),
-                "vendedor_key": random.choice(["admin", "trabajador1"]),
-                "metodo_pago": random.choice(["efectivo", "tarjeta", "transferencia"]),
-                "fecha": fecha_venta.isoformat(), # <-- Fecha aleatoria
-                "created_at": fecha_venta,        # <-- Misma fecha aleatoria (como objeto Date)
-                "estado": random.choice(["completada", "anulada"])
-            }
-            ventas_docs.append(venta)
-
-        if ventas_docs:
-            ins, fail = _batch_insert(ventas_col, ventas_docs)
-            summary["ventas"] += ins
-            failed_summary["ventas"] += fail
+        if not perfil:
+            try:
+                contexto["cliente_ids"] = [d["_id"] for d in db["clientes"].find({}, {"_id": 1}).sort("_id", ASCENDING).limit(1000)]
+            except Exception:
+                contexto["cliente_ids"] = []
+        progreso_registro.marcar("ventas", "running")
+        ins, fail = poblar_coleccion(db, "ventas", counts["ventas"], contexto, seed=_semilla("ventas"),
+                                     al_progresar=_al_progresar("ventas"),
+                                     lotes_hechos=checkpoint_seed.lotes_hechos(trabajo, "ventas"), **opciones)
+        summary["ventas"] += checkpoint_seed.hechos(trabajo, "ventas") + ins
+        failed_summary["ventas"] += fail
+        if not checkpoint_seed.cancelacion.is_set():
+            if not fail:
+                checkpoint_seed.marcar_etapa(db, "ventas")
+            progreso_registro.marcar("ventas", "done")
     except Exception as e:
         logger.exception("Fallo al poblar ventas: %s", e)
         failed_summary["ventas"] += counts.get("ventas", 0)
+        progreso_registro.marcar("ventas", "error")
+    if _cancelado():
+        return _resultado(cancelado=True)
 
-    # Logs
     try:
-        logs_col = db["logs"]
-        logs_needed = counts["logs"]
-        logs_docs: List[Dict] = []
-        for _ in range(logs_needed):
-            logs_docs.append({
-                "nivel": random.choice(["INFO", "WARNING", "ERROR"]),
-                "servicio": random.choice(["init", "seed", "venta", "auth", "productos"]),
-                "mensaje": f"Log synthetic {random.randint(1000000,9999999)}",
-                "meta": {},
-                "created_at": _random_datetime_within_last_days(180)
-            })
-        if logs_docs:
-            ins, fail = _batch_insert(logs_col, logs_docs)
-            summary["logs"] += ins
-            failed_summary["logs"] += fail
+        progreso_registro.marcar("logs", "running")
+        ins, fail = poblar_coleccion(db, "logs", counts["logs"], contexto, seed=_semilla("logs"),
+                                     al_progresar=_al_progresar("logs"),
+                                     lotes_hechos=checkpoint_seed.lotes_hechos(trabajo, "logs"), **opciones)
+        summary["logs"] += checkpoint_seed.hechos(trabajo, "logs") + ins
+        failed_summary["logs"] += fail
+        if not checkpoint_seed.cancelacion.is_set():
+            if not fail:
+                checkpoint_seed.marcar_etapa(db, "logs")
+            progreso_registro.marcar("logs", "done")
     except Exception as e:
         logger.exception("Fallo al poblar logs: %s", e)
         failed_summary["logs"] += counts.get("logs", 0)
+        progreso_registro.marcar("logs", "error")
+    if _cancelado():
+        return _resultado(cancelado=True)
 
 
     # 5) (#!NUEVO) Poblar Multimedia (GridFS)
     # Esto se ejecuta DESPUÉS de poblar las colecciones principales
+    etapas_multimedia = ProgressMonitor._MULTIMEDIA
+
+    multimedia_fallidos = set()
+
+    def _multimedia_tarea(tipo, hechos, fallidos, segundos, clave):
+        ProgressMonitor.reportar_multimedia(tipo, hechos, fallidos, segundos)
+        etapa = ProgressMonitor._ETAPA_MULTIMEDIA[tipo]
+        if fallidos:
+            multimedia_fallidos.add(etapa)
+        else:
+            checkpoint_seed.registrar_lote(db, etapa, clave, hechos)
+
     try:
-        # (#!MODIFICADO) Pasamos los contadores desde la configuración
-        resumen_multimedia = poblar_multimedia(
-            db,
-            num_imagenes=CONFIG_REGISTROS.get("imagenes_color", 0),
-            num_fotos=CONFIG_REGISTROS.get("fotos_ruido", 0),
-            num_videos=CONFIG_REGISTROS.get("videos", 0)
-        )
+        if all(checkpoint_seed.etapa_hecha(trabajo, m) for m in etapas_multimedia):
+            resumen_multimedia = {"status": "completado", "reanudado": True}
+        else:
+            # (#!MODIFICADO) Pasamos los contadores desde la configuración
+            resumen_multimedia = poblar_multimedia(
+                db,
+                num_imagenes=registros.get("imagenes_color", 0),
+                num_fotos=registros.get("fotos_ruido", 0),
+                num_videos=registros.get("videos", 0),
+                seed=_semilla("multimedia"),
+                referencia=ahora,
+                al_progresar=_multimedia_tarea,
+                tareas_hechas=set().union(*(checkpoint_seed.lotes_hechos(trabajo, m) for m in etapas_multimedia)),
+                reanudar=reanudar
+            )
+            if not checkpoint_seed.cancelacion.is_set():
+                for m in etapas_multimedia:
+                    if m not in multimedia_fallidos:
+                        checkpoint_seed.marcar_etapa(db, m)
         logger.info("Resumen de multimedia: %s", resumen_multimedia)
     except Exception as e:
         logger.exception("Fallo catastrófico al poblar multimedia: %s", e)
         resumen_multimedia = {"status": "fallido", "error": str(e)}
+        multimedia_fallidos.update(etapas_multimedia)
+    if _cancelado():
+        return _resultado(resumen_multimedia, cancelado=True)
 
 
     # 6) Resultado final
-    inserted_total = sum(summary.values())
-    failed_total = sum(failed_summary.values())
-
-    result = {
-        **summary,
-        "inserted_total": inserted_total,
-        "failed_total": failed_total,
-        "failed_details": failed_summary,
-        "multimedia_summary": resumen_multimedia  # (#!NUEVO)
-    }
+    result = _resultado(resumen_multimedia)
+    if result["failed_total"] or multimedia_fallidos:
+        # queda pendiente: resume=true reintenta los lotes y etapas con fallos
+        checkpoint_seed.cerrar(db, "error")
+        logger.warning("Poblamiento terminado con fallos. Resumen: %s", result)
+        progreso_registro.finalizar("Proceso completado con fallos; se puede reanudar con resume=true")
+        return result
+    checkpoint_seed.cerrar(db, "completado")
     logger.info("Poblamiento completo. Resumen: %s", result)
+    progreso_registro.finalizar("Proceso completado")
     return result
 
 # ---------------------------------------------
 # MONITOR DE PROGRESO (para /db/progreso)
 # ---------------------------------------------
 class ProgressMonitor:
+    """
+    Avance para /db/progreso. Mientras haya un poblamiento lanzado en este proceso se lee del
+    registro en memoria (progreso_registro), sin consultar la base; solo si no se lanzó
+    ninguno (p. ej. tras reiniciar el servidor) se cuenta en las colecciones.
+    """
+    # Etapa del registro para cada tipo de archivo multimedia
+    _ETAPA_MULTIMEDIA = {"imagen": "imagenes_color", "foto": "fotos_ruido", "video": "videos"}
+    _MULTIMEDIA = ("imagenes_color", "fotos_ruido", "videos")
+
+    # Registros del último poblamiento (CONFIG_REGISTROS o los de su perfil)
+    registros: Dict[str, int] = CONFIG_REGISTROS
+
+    @staticmethod
+    def iniciar(registros: Dict[str, int] = None) -> None:
+        """Abre un trabajo nuevo en el registro con los totales por colección y multimedia."""
+        ProgressMonitor.registros = registros or CONFIG_REGISTROS
+        totales = {c: ProgressMonitor.registros.get(c, 0) for c in _colecciones_necesarias()}
+        totales.update({m: ProgressMonitor.registros.get(m, 0) for m in ProgressMonitor._MULTIMEDIA})
+        progreso_registro.iniciar(totales)
+
+    @staticmethod
+    def reportar_multimedia(tipo: str, hechos: int, fallidos: int, segundos: float, clave: str = None) -> None:
+        """Callback de poblar_multimedia_paralelo: suma una tarea terminada a su etapa."""
+        progreso_registro.sumar(ProgressMonitor._ETAPA_MULTIMEDIA.get(tipo, tipo), hechos, fallidos)
+
     @staticmethod
-    def counts_from_config() -> Dict[str, int]:
-        """Totales esperados por etapa, tomados de CONFIG_REGISTROS."""
+    def counts_from_config(registros: Dict[str, int] = None) -> Dict[str, int]:
+        """Totales esperados por etapa, tomados de 'registros' (por defecto los del último poblamiento)."""
+        registros = registros or ProgressMonitor.registros
         return {
             "populate": sum([
-                CONFIG_REGISTROS.get("usuarios", 0),
-                CONFIG_REGISTROS.get("areas", 0),
-                CONFIG_REGISTROS.get("productos", 0),
-                CONFIG_REGISTROS.get("clientes", 0),
-                CONFIG_REGISTROS.get("ventas", 0),
-                CONFIG_REGISTROS.get("logs", 0),
+                registros.get("usuarios", 0),
+                registros.get("areas", 0),
+                registros.get("productos", 0),
+                registros.get("clientes", 0),
+                registros.get("ventas", 0),
+                registros.get("logs", 0),
             ]),
-            "imagenes_color": CONFIG_REGISTROS.get("imagenes_color", 0),
-            "fotos_ruido": CONFIG_REGISTROS.get("fotos_ruido", 0),
-            "videos": CONFIG_REGISTROS.get("videos", 0),
+            "imagenes_color": registros.get("imagenes_color", 0),
+            "fotos_ruido": registros.get("fotos_ruido", 0),
+            "videos": registros.get("videos", 0),
         }
 
     @staticmethod
@@ -800,19 +829,65 @@ class ProgressMonitor:
         }
 
     @staticmethod
-    def snapshot(db) -> Dict[str, Dict[str, int]]:
+    def _agrupar(etapas: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Junta las colecciones en 'populate' (las etapas que espera el frontend)."""
+        partes = [etapas[c] for c in _colecciones_necesarias() if c in etapas]
+        estados = {p["status"] for p in partes}
+        if "error" in estados:
+            status = "error"
+        elif estados <= {"done"}:
+            status = "done"
+        elif estados == {"idle"}:
+            status = "idle"
+        else:
+            status = "running"
+        total = sum(p["total"] for p in partes)
+        current = sum(p["current"] for p in partes)
+        restante = max(0, total - current - sum(p["fallidos"] for p in partes))
+        # las colecciones se llenan una tras otra: velocidad del grupo = docs / tiempo sumado
+        elapsed = sum(p["elapsed_s"] for p in partes)
+        por_seg = current / elapsed if elapsed > 0 else None
+        grupos = {"populate": {
+            "total": total, "current": current, "status": status,
+            "por_seg": round(por_seg, 1) if por_seg else None,
+            "eta_s": 0 if status in ("done", "error") else (round(restante / por_seg, 1) if por_seg else None),
+        }}
+        for m in ProgressMonitor._MULTIMEDIA:
+            if m in etapas:
+                grupos[m] = etapas[m]
+        return grupos
+
+    @staticmethod
+    def snapshot(db) -> Dict[str, Any]:
         """Devuelve el paquete completo para el endpoint."""
-        counts = ProgressMonitor.counts_from_config()
-        current = ProgressMonitor.current_from_db(db)
-        status = ProgressMonitor.status(counts, current)
-        message = "Procesando…"
-        if all(s == "done" for s in status.values()):
-            message = "Proceso completado"
+        registro = progreso_registro.snapshot()
+        if registro is None:
+            # ningún poblamiento en este proceso: se cuenta en la base (una vez por consulta)
+            counts = ProgressMonitor.counts_from_config()
+            current = ProgressMonitor.current_from_db(db)
+            status = ProgressMonitor.status(counts, current)
+            message = "Procesando…"
+            if all(s == "done" for s in status.values()):
+                message = "Proceso completado"
+            return {
+                "counts": counts,
+                "current": current,
+                "status": status,
+                "message": message
+            }
+
+        grupos = ProgressMonitor._agrupar(registro["etapas"])
         return {
-            "counts": counts,
-            "current": current,
-            "status": status,
-            "message": message
+            "counts": {k: g["total"] for k, g in grupos.items()},
+            "current": {k: g["current"] for k, g in grupos.items()},
+            "status": {k: g["status"] for k, g in grupos.items()},
+            "message": registro["message"],
+            "por_seg": {k: g["por_seg"] for k, g in grupos.items()},
+            "eta_s": {k: g["eta_s"] for k, g in grupos.items()},
+            "etapas": registro["etapas"],
+            "activo": registro["activo"],
+            "elapsed_s": registro["elapsed_s"],
+            "version": registro["version"],
         }
 
 # ---------------------------------------------
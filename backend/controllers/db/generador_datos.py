@@ -0,0 +1,352 @@
+"""
+Generador de datos sintéticos por lotes para crear_y_poblar_db (clientes, ventas y logs).
+
+Cada lote de SEED_CHUNK_DOCS documentos se genera con sorteos vectorizados de NumPy (cantidad
+de líneas, productos, cantidades, fechas, nombres...) y se inserta enseguida con
+insert_many(ordered=False): nunca hay más de un lote por worker en memoria. Los lotes se
+reparten en un pool de procesos (SEED_PROCESOS, por defecto los núcleos disponibles).
+
+ - poblar_coleccion(db, tipo, total, contexto, seed=None, ahora=None, al_progresar=None,
+   lotes_hechos=None, cancelado=None): genera e inserta 'total' documentos de 'tipo' ("clientes",
+   "ventas" o "logs") salteando los lotes ya hechos; devuelve (insertados, fallidos).
+   al_progresar(insertados, fallidos, lote) se llama en el proceso padre por cada lote
+ - contexto_generacion(productos, area_lookup, cliente_ids, perfil, n_clientes): catálogo
+   compartido por los workers y, con un perfil (ver perfiles_datos), su distribución
+ - generar_lote(tipo, n, rng, contexto, ahora, inicio): los documentos de un lote (sin insertar);
+   'inicio' es el índice del primer documento en la colección (para los _id deterministas)
+ - pool_workers(db, procesos, inicializar, *args): pool de procesos (o hilos) cuyos workers
+   reciben su propia conexión en inicializar(db, *args); lo usa también generador_multimedia
+ - ejecutar_acotado(ex, claves, enviar, al_terminar, limite, cancelado): encola las tareas de a
+   poco (como mucho 'limite' en vuelo) y deja de encolar si se pide cancelar
+
+Los procesos se crean con 'fork' (los hijos abren su propio MongoClient vía get_client, que
+detecta el cambio de pid; db.conexion rehace sus locks en el hijo con os.register_at_fork, así
+que no importa en qué estado los dejaron los demás hilos del servidor). Donde no hay fork (Windows) se usa un pool de hilos: NumPy y el
+insert liberan el GIL la mayor parte del tiempo. Cada lote tiene su propia semilla derivada
+(SeedSequence.spawn), así que el reparto entre workers no cambia qué se genera.
+
+Los _id se derivan del índice de cada documento (perfiles_datos.id_determinista): reinsertar
+un lote que quedó a medias (al reanudar, ver checkpoint_seed) solo choca con los ya insertados,
+que cuentan como confirmados. Sin perfil los productos y las fechas se sortean uniformes. Con
+perfil: popularidad Zipf de productos, estacionalidad por hora y día de la semana y clientes
+frecuentes en las ventas (mismo perfil y tamaño de lote = mismos datos).
+"""
+import logging
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from functools import lru_cache
+
+import numpy as np
+from pymongo.errors import BulkWriteError
+
+from .perfiles_datos import id_determinista, pesos_popularidad, semilla
+
+logger = logging.getLogger(__name__)
+
+try:
+    CHUNK_DOCS = max(100, int(os.environ.get("SEED_CHUNK_DOCS", "10000")))
+except ValueError:
+    CHUNK_DOCS = 10000
+try:
+    SEED_PROCESOS = max(1, int(os.environ.get("SEED_PROCESOS", str(os.cpu_count() or 1))))
+except ValueError:
+    SEED_PROCESOS = os.cpu_count() or 1
+
+# Ventanas de fechas (días hacia atrás), las mismas que usaba el generador original
+DIAS_CLIENTES = 90
+DIAS_VENTAS = 200_000
+DIAS_LOGS = 180
+
+NIVELES = np.array(["INFO", "WARNING", "ERROR"], dtype=object)
+SERVICIOS = np.array(["init", "seed", "venta", "auth", "productos"], dtype=object)
+VENDEDORES = np.array(["admin", "trabajador1"], dtype=object)
+METODOS_PAGO = np.array(["efectivo", "tarjeta", "transferencia"], dtype=object)
+ESTADOS = np.array(["completada", "anulada"], dtype=object)
+
+# Estado de cada worker (lo fija _iniciar_worker)
+_worker = {"db": None, "contexto": None}
+
+
+def contexto_generacion(productos, area_lookup, cliente_ids=None, perfil=None, n_clientes=0, referencia=None):
+    """
+    Catálogo en arrays (una sola vez por worker) para sortear líneas de venta. Con 'perfil'
+    agrega la distribución (popularidad, estacionalidad, recompra); n_clientes es el total de
+    clientes del perfil, a los que apuntan las ventas. referencia: fecha base de los _id
+    deterministas (la del perfil si hay perfil).
+    """
+    ctx = {
+        "ids": [p.get("_id") for p in productos],
+        "nombres": [p.get("nombre") for p in productos],
+        "precios": np.array([float(p.get("precio", 0)) for p in productos], dtype=np.float64),
+        "area_ids": [str(p.get("area_id")) for p in productos],
+        "area_nombres": [area_lookup.get(p.get("area_id"), "Area Desconocida") for p in productos],
+        "cliente_ids": list(cliente_ids or []),
+        "popularidad": None,
+        "estacionalidad": None,
+        "referencia": referencia,
+    }
+    if perfil:
+        dist = perfil["distribucion"]
+        rng = np.random.default_rng(semilla(perfil, "popularidad"))
+        ctx["popularidad"] = pesos_popularidad(rng, len(productos), dist["popularidad_zipf"])
+        horas = np.asarray(dist["horas"], dtype=np.float64)
+        ctx["estacionalidad"] = {"horas": horas / horas.sum(), "dias_semana": tuple(dist["dias_semana"])}
+        ctx["recompra"] = float(dist["recompra"])
+        ctx["n_clientes"] = int(n_clientes)
+        ctx["n_frecuentes"] = max(1, int(n_clientes * dist["clientes_frecuentes"]))
+        ctx["referencia"] = perfil["referencia"]
+    return ctx
+
+
+@lru_cache(maxsize=8)
+def _pesos_dias(dias, dia_semana_ref, dias_semana):
+    """Probabilidad de cada día hacia atrás (1..dias+1) según el peso de su día de la semana."""
+    pesos = np.asarray(dias_semana, dtype=np.float64)[(dia_semana_ref - np.arange(1, dias + 2)) % 7]
+    return pesos / pesos.sum()
+
+
+def _fechas(rng, n, dias, ahora, ctx=None):
+    """n fechas UTC en los últimos 'dias' días (datetime sin tz, como las guarda pymongo)."""
+    base = np.datetime64(ahora.replace(tzinfo=None), "us")
+    estacionalidad = (ctx or {}).get("estacionalidad")
+    if estacionalidad is None:
+        segundos = rng.integers(0, dias * 86400 + 86400, n)
+        return (base - segundos.astype("timedelta64[s]")).astype(object)
+    # día (ponderado por día de la semana) + hora (ponderada) + segundo dentro de la hora
+    dia = np.datetime64(ahora.replace(tzinfo=None).date(), "us")
+    atras = 1 + rng.choice(dias + 1, n, p=_pesos_dias(dias, ahora.weekday(), estacionalidad["dias_semana"]))
+    segundos = rng.choice(24, n, p=estacionalidad["horas"]) * 3600 + rng.integers(0, 3600, n)
+    return (dia - (atras * 86400 - segundos).astype("timedelta64[s]")).astype(object)
+
+
+def _lineas(rng, n, ctx):
+    """Líneas de producto de n documentos: (lista de líneas por documento, totales)."""
+    por_doc = rng.integers(1, 6, n)
+    total_lineas = int(por_doc.sum())
+    if ctx["popularidad"] is not None:
+        idx = rng.choice(len(ctx["ids"]), total_lineas, p=ctx["popularidad"])
+    else:
+        idx = rng.integers(0, len(ctx["ids"]), total_lineas)
+    cantidades = rng.integers(1, 6, total_lineas)
+    precios = ctx["precios"][idx]
+    subtotales = precios * cantidades
+    inicios = np.concatenate(([0], np.cumsum(por_doc)[:-1]))
+    totales = np.round(np.add.reduceat(subtotales, inicios), 2)
+
+    ids, nombres = ctx["ids"], ctx["nombres"]
+    area_ids, area_nombres = ctx["area_ids"], ctx["area_nombres"]
+    idx_l, cant_l, precio_l, sub_l = idx.tolist(), cantidades.tolist(), precios.tolist(), subtotales.tolist()
+    docs, j = [], 0
+    for k in por_doc.tolist():
+        lineas = []
+        for m in range(j, j + k):
+            p = idx_l[m]
+            lineas.append({
+                "producto_id": ids[p],
+                "nombre": nombres[p],
+                "precio": precio_l[m],
+                "cantidad": cant_l[m],
+                "subtotal": sub_l[m],
+                "area_id": area_ids[p],
+                "area_nombre": area_nombres[p],
+            })
+        docs.append(lineas)
+        j += k
+    return docs, totales.tolist()
+
+
+def _iso(fecha):
+    return fecha.isoformat() + "+00:00"
+
+
+def _lote_clientes(rng, n, ctx, ahora):
+    lineas, totales = _lineas(rng, n, ctx)
+    fechas = _fechas(rng, n, DIAS_CLIENTES, ahora, ctx)
+    nombres = rng.integers(1_000_000, 10_000_000, n).tolist()
+    telefonos = rng.integers(10_000_000, 100_000_000, n).tolist()
+    return [
+        {
+            "nombre": f"Cliente {nombres[i]}",
+            "contacto": {"telefono": f"55{telefonos[i]}"},
+            "productos": lineas[i],
+            "total": totales[i],
+            "fecha": _iso(fechas[i]),
+            "created_at": fechas[i],
+        }
+        for i in range(n)
+    ]
+
+
+def _clientes_de_ventas(rng, n, ctx):
+    if ctx.get("n_clientes"):
+        # con prob. 'recompra' la venta es de un cliente frecuente; si no, de cualquiera
+        frecuente = rng.random(n) < ctx["recompra"]
+        idx = np.where(frecuente, rng.integers(0, ctx["n_frecuentes"], n), rng.integers(0, ctx["n_clientes"], n))
+        return [id_determinista(ctx["referencia"], "clientes", i) for i in idx.tolist()]
+    clientes = ctx["cliente_ids"]
+    return [clientes[i] for i in rng.integers(0, len(clientes), n).tolist()] if clientes else [None] * n
+
+
+def _lote_ventas(rng, n, ctx, ahora):
+    lineas, totales = _lineas(rng, n, ctx)
+    fechas = _fechas(rng, n, DIAS_VENTAS, ahora, ctx)
+    refs = _clientes_de_ventas(rng, n, ctx)
+    vendedores = VENDEDORES[rng.integers(0, len(VENDEDORES), n)].tolist()
+    metodos = METODOS_PAGO[rng.integers(0, len(METODOS_PAGO), n)].tolist()
+    estados = ESTADOS[rng.integers(0, len(ESTADOS), n)].tolist()
+    return [
+        {
+            "cliente_ref": refs[i],
+            "productos": lineas[i],
+            "total": totales[i],
+            "vendedor_key": vendedores[i],
+            "metodo_pago": metodos[i],
+            "fecha": _iso(fechas[i]),
+            "created_at": fechas[i],
+            "estado": estados[i],
+        }
+        for i in range(n)
+    ]
+
+
+def _lote_logs(rng, n, ctx, ahora):
+    fechas = _fechas(rng, n, DIAS_LOGS, ahora, ctx)
+    niveles = NIVELES[rng.integers(0, len(NIVELES), n)].tolist()
+    servicios = SERVICIOS[rng.integers(0, len(SERVICIOS), n)].tolist()
+    numeros = rng.integers(1_000_000, 10_000_000, n).tolist()
+    return [
+        {
+            "nivel": niveles[i],
+            "servicio": servicios[i],
+            "mensaje": f"Log synthetic {numeros[i]}",
+            "meta": {},
+            "created_at": fechas[i],
+        }
+        for i in range(n)
+    ]
+
+
+_GENERADORES = {"clientes": _lote_clientes, "ventas": _lote_ventas, "logs": _lote_logs}
+
+
+def generar_lote(tipo, n, rng, contexto, ahora=None, inicio=0):
+    docs = _GENERADORES[tipo](rng, n, contexto, ahora or datetime.now(timezone.utc))
+    if contexto.get("referencia") is not None:
+        for k, doc in enumerate(docs, start=inicio):
+            doc["_id"] = id_determinista(contexto["referencia"], tipo, k)
+    return docs
+
+
+def _abrir_db(db_o_nombre):
+    if isinstance(db_o_nombre, str):
+        # proceso hijo: cliente propio (el hook de fork de db.conexion descarta el heredado)
+        from db.conexion import get_client
+        return get_client()[db_o_nombre]
+    return db_o_nombre
+
+
+def _inicializar(inicializar, db_o_nombre, *args):
+    inicializar(_abrir_db(db_o_nombre), *args)
+
+
+def pool_workers(db, procesos, inicializar, *args):
+    """Procesos con 'fork' si hay más de uno y la plataforma lo permite; si no, hilos."""
+    if procesos > 1 and "fork" in multiprocessing.get_all_start_methods():
+        return ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context("fork"),
+                                   initializer=_inicializar, initargs=(inicializar, db.name) + args)
+    return ThreadPoolExecutor(max_workers=procesos, thread_name_prefix="seed",
+                              initializer=_inicializar, initargs=(inicializar, db) + args)
+
+
+def ejecutar_acotado(ex, claves, enviar, al_terminar, limite, cancelado=None):
+    """
+    Envía enviar(clave) al pool con como mucho 'limite' tareas en vuelo y llama a
+    al_terminar(clave, resultado) en este hilo a medida que terminan. Si 'cancelado'
+    (threading.Event) se activa no encola más y espera a las que ya estaban en vuelo.
+    Devuelve False si se canceló antes de encolar todas.
+    """
+    cola = iter(claves)
+    en_vuelo = {}
+    agotada = False
+
+    def _encolar():
+        nonlocal agotada
+        while len(en_vuelo) < limite and not (cancelado is not None and cancelado.is_set()):
+            clave = next(cola, None)
+            if clave is None:
+                agotada = True
+                return
+            en_vuelo[enviar(clave)] = clave
+
+    _encolar()
+    while en_vuelo:
+        listos, _ = wait(list(en_vuelo), return_when=FIRST_COMPLETED)
+        for f in listos:
+            al_terminar(en_vuelo.pop(f), f.result())
+        _encolar()
+    return agotada or next(cola, None) is None
+
+
+def _iniciar_worker(db, contexto):
+    _worker["db"] = db
+    _worker["contexto"] = contexto
+
+
+def _generar_e_insertar(tipo, n, semilla_lote, ahora, inicio):
+    docs = generar_lote(tipo, n, np.random.default_rng(semilla_lote), _worker["contexto"], ahora, inicio)
+    try:
+        res = _worker["db"][tipo].insert_many(docs, ordered=False)
+        return len(res.inserted_ids), 0
+    except BulkWriteError as e:
+        # _id duplicados = documentos que ya estaban (lote reintentado al reanudar)
+        errores = e.details.get("writeErrors", [])
+        duplicados = sum(1 for err in errores if err.get("code") == 11000)
+        if duplicados < len(errores):
+            logger.warning("Lote de %s con %s errores de escritura", tipo, len(errores) - duplicados)
+        return e.details.get("nInserted", 0) + duplicados, len(errores) - duplicados
+    except Exception as e:
+        logger.warning("Lote de %s falló: %s", tipo, e)
+        return 0, n
+
+
+def poblar_coleccion(db, tipo, total, contexto, seed=None, procesos=None, chunk=None, ahora=None,
+                     al_progresar=None, lotes_hechos=None, cancelado=None):
+    """
+    Genera e inserta 'total' documentos de 'tipo' en lotes repartidos entre los workers.
+    seed: entero o SeedSequence (None = aleatorio); ahora: fecha desde la que se generan las
+    fechas hacia atrás (None = ahora). lotes_hechos: índices de lote que no se regeneran
+    (reanudación); cancelado: threading.Event para parar entre lotes. Devuelve (insertados,
+    fallidos) de los lotes procesados en esta llamada.
+    """
+    if total <= 0:
+        return 0, 0
+    chunk = chunk or CHUNK_DOCS
+    tamanos = [min(chunk, total - i) for i in range(0, total, chunk)]
+    secuencia = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    semillas = secuencia.spawn(len(tamanos))
+    ahora = ahora or datetime.now(timezone.utc)
+    pendientes = [k for k in range(len(tamanos)) if k not in (lotes_hechos or ())]
+    if not pendientes:
+        return 0, 0
+    procesos = min(procesos or SEED_PROCESOS, len(pendientes))
+
+    insertados = fallidos = 0
+
+    def _terminado(k, resultado):
+        nonlocal insertados, fallidos
+        ins, fail = resultado
+        insertados += ins
+        fallidos += fail
+        if al_progresar:
+            al_progresar(ins, fail, k)
+
+    # a lo sumo dos lotes por worker en vuelo: memoria acotada y cancelación entre lotes
+    with pool_workers(db, procesos, _iniciar_worker, contexto) as ex:
+        ejecutar_acotado(ex, pendientes,
+                         lambda k: ex.submit(_generar_e_insertar, tipo, tamanos[k], semillas[k], ahora, k * chunk),
+                         _terminado, procesos * 2, cancelado)
+    logger.info("%s: %s insertados, %s fallidos (%s de %s lotes, %s workers)", tipo, insertados, fallidos,
+                len(pendientes), len(tamanos), procesos)
+    return insertados, fallidos
@@ -0,0 +1,182 @@
+"""
+Poblamiento en paralelo de la multimedia de prueba (GridFS, bucket 'multimedia').
+
+Imágenes de color, fotos de ruido y videos se reparten en tareas de MEDIA_TAREA[tipo]
+archivos que procesan los workers de un pool de procesos (SEED_MEDIA_PROCESOS, por defecto
+los núcleos disponibles). Cada worker renderiza y sube por streaming a GridFS con su propia
+conexión:
+ - PNG: cv2.imencode en memoria, sin PIL ni BytesIO intermedios
+ - MP4: cv2.VideoWriter necesita una ruta, así que cada tarea usa su propio directorio temporal
+   en /dev/shm (tmpfs) cuando existe; el archivo se sube por trozos y se borra al terminar
+
+Los archivos conservan el nombre (imagen_00001.png, foto_..., video_....mp4) y los campos
+'tipo' y 'contentType' en el documento de multimedia.files que consultan las rutas. Por eso se
+sube con GridFS.new_file (GridIn en streaming, igual que GridFSBucket.open_upload_stream pero
+con campos propios en el documento).
+
+ - poblar_multimedia_paralelo(db, conteos, al_progresar=None, seed=None, referencia=None,
+   tareas_hechas=None, reanudar=False, cancelado=None): conteos {"imagen": n, "foto": n, "video": n};
+   al_progresar(tipo, hechos, fallidos, segundos, clave) se llama al terminar cada tarea. Con
+   'referencia' (perfiles_datos) los _id de los archivos son deterministas
+
+Al reanudar (reanudar=True; tareas_hechas, claves "tipo:desde") solo se ejecutan las tareas que
+faltan, y cada una borra primero sus archivos por _id: una tarea cortada a medias no deja duplicados.
+"""
+import logging
+import os
+import shutil
+import tempfile
+import time
+import cv2
+import gridfs
+import numpy as np
+
+from .generador_datos import ejecutar_acotado, pool_workers
+from .perfiles_datos import id_determinista
+
+logger = logging.getLogger(__name__)
+
+try:
+    SEED_MEDIA_PROCESOS = max(1, int(os.environ.get("SEED_MEDIA_PROCESOS", str(os.cpu_count() or 1))))
+except ValueError:
+    SEED_MEDIA_PROCESOS = os.cpu_count() or 1
+
+IMG_ANCHO, IMG_ALTO = 128, 128
+VID_FPS = 10
+VID_DURACION = 5  # segundos
+
+MEDIA_TAREA = {"imagen": 500, "foto": 500, "video": 25}
+TROZO_SUBIDA = 255 * 1024   # igual al chunk por defecto de GridFS
+_TMPFS = "/dev/shm"
+
+_worker = {"fs": None}
+
+
+def _iniciar_worker(db):
+    _worker["fs"] = gridfs.GridFS(db, collection="multimedia")
+
+
+def _subir_bytes(fs, data, filename, tipo, content_type, extra):
+    with fs.new_file(filename=filename, tipo=tipo, contentType=content_type, **extra) as destino:
+        destino.write(data)
+
+
+def _subir_archivo(fs, ruta, filename, tipo, content_type, extra):
+    with fs.new_file(filename=filename, tipo=tipo, contentType=content_type, **extra) as destino, \
+            open(ruta, "rb") as origen:
+        while True:
+            data = origen.read(TROZO_SUBIDA)
+            if not data:
+                break
+            destino.write(data)
+
+
+def _png(arr):
+    ok, buf = cv2.imencode(".png", arr)
+    if not ok:
+        raise RuntimeError("cv2.imencode falló")
+    return buf.tobytes()
+
+
+def _imagen(fs, rng, i, _tmp, extra):
+    color = rng.integers(0, 256, 3, dtype=np.uint8)
+    arr = np.empty((IMG_ALTO, IMG_ANCHO, 3), dtype=np.uint8)
+    arr[:] = color
+    _subir_bytes(fs, _png(arr), f"imagen_{i:05}.png", "imagen", "image/png", extra)
+
+
+def _foto(fs, rng, i, _tmp, extra):
+    arr = rng.integers(0, 256, (IMG_ALTO, IMG_ANCHO, 3), dtype=np.uint8)
+    _subir_bytes(fs, _png(arr), f"foto_{i:05}.png", "foto", "image/png", extra)
+
+
+def _video(fs, rng, i, tmp, extra):
+    nombre = f"video_{i:05}.mp4"
+    ruta = os.path.join(tmp, nombre)
+    video = cv2.VideoWriter(ruta, cv2.VideoWriter_fourcc(*"mp4v"), VID_FPS, (IMG_ANCHO, IMG_ALTO))
+    try:
+        frames = rng.integers(0, 256, (VID_FPS * VID_DURACION, IMG_ALTO, IMG_ANCHO, 3), dtype=np.uint8)
+        for frame in frames:
+            video.write(frame)
+    finally:
+        video.release()
+    try:
+        _subir_archivo(fs, ruta, nombre, "video", "video/mp4", extra)
+    finally:
+        os.remove(ruta)
+
+
+_RENDER = {"imagen": _imagen, "foto": _foto, "video": _video}
+
+
+def _tarea(tipo, desde, hasta, semilla, referencia=None, limpiar=False):
+    """
+    Genera y sube los archivos [desde, hasta) de 'tipo'. limpiar=True borra antes cada archivo
+    por su _id (reintento de una tarea). Devuelve (tipo, hechos, fallidos, segundos).
+    """
+    inicio = time.perf_counter()
+    rng = np.random.default_rng(semilla)
+    tmp = tempfile.mkdtemp(prefix="seed_media_", dir=_TMPFS if os.path.isdir(_TMPFS) else None) \
+        if tipo == "video" else None
+    hechos = fallidos = 0
+    try:
+        for i in range(desde, hasta):
+            try:
+                extra = {"_id": id_determinista(referencia, tipo, i)} if referencia else {}
+                if limpiar and extra:
+                    _worker["fs"].delete(extra["_id"])
+                _RENDER[tipo](_worker["fs"], rng, i, tmp, extra)
+                hechos += 1
+            except Exception as e:
+                logger.warning("Fallo al generar %s %s: %s", tipo, i, e)
+                fallidos += 1
+    finally:
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+    return tipo, hechos, fallidos, time.perf_counter() - inicio
+
+
+def poblar_multimedia_paralelo(db, conteos, al_progresar=None, seed=None, procesos=None, referencia=None,
+                               tareas_hechas=None, reanudar=False, cancelado=None):
+    """
+    Reparte la generación en tareas y las ejecuta en el pool. Los videos se encolan primero:
+    son los más lentos y así no quedan solos al final. cancelado: threading.Event para dejar
+    de encolar tareas. Devuelve {tipo: {hechos, fallidos, segundos_worker, por_seg_worker}}.
+    """
+    tareas = []
+    for tipo in ("video", "imagen", "foto"):
+        total, paso = int(conteos.get(tipo, 0)), MEDIA_TAREA[tipo]
+        tareas += [(tipo, i, min(i + paso, total + 1)) for i in range(1, total + 1, paso)]
+    if not tareas:
+        return {}
+    secuencia = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    semillas = secuencia.spawn(len(tareas))
+    pendientes = [k for k, (tipo, desde, _) in enumerate(tareas) if f"{tipo}:{desde}" not in (tareas_hechas or ())]
+    resumen = {t: {"hechos": 0, "fallidos": 0, "segundos_worker": 0.0} for t in conteos}
+    if not pendientes:
+        return resumen
+    procesos = min(procesos or SEED_MEDIA_PROCESOS, len(pendientes))
+
+    def _enviar(k):
+        tipo, desde, hasta = tareas[k]
+        return ex.submit(_tarea, tipo, desde, hasta, semillas[k], referencia, reanudar)
+
+    def _terminada(k, resultado):
+        tipo, hechos, fallidos, segundos = resultado
+        r = resumen[tipo]
+        r["hechos"] += hechos
+        r["fallidos"] += fallidos
+        r["segundos_worker"] += segundos
+        if al_progresar:
+            al_progresar(tipo, hechos, fallidos, segundos, f"{tipo}:{tareas[k][1]}")
+
+    inicio = time.perf_counter()
+    with pool_workers(db, procesos, _iniciar_worker) as ex:
+        ejecutar_acotado(ex, pendientes, _enviar, _terminada, procesos * 2, cancelado)
+    elapsed = time.perf_counter() - inicio
+    for r in resumen.values():
+        # archivos por segundo de un worker; multiplicar por 'procesos' da el agregado aproximado
+        r["por_seg_worker"] = round(r["hechos"] / r["segundos_worker"], 1) if r["segundos_worker"] else None
+        r["segundos_worker"] = round(r["segundos_worker"], 2)
+    logger.info("Multimedia generada en %.1fs con %s workers: %s", elapsed, procesos, resumen)
+    return resumen
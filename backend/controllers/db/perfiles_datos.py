@@ -0,0 +1,113 @@
+"""
+Perfiles de datos con semilla para poblar la base de forma reproducible (benchmarks).
+
+Cada perfil fija los conteos por colección, una semilla, la fecha de referencia (las fechas
+se generan hacia atrás desde ella, no desde 'ahora') y la distribución de los datos:
+ - popularidad_zipf: exponente s de la popularidad de productos (peso del k-ésimo más
+   popular ∝ 1/k^s; 0 = uniforme). El orden de popularidad se sortea con la semilla
+ - horas / dias_semana: pesos relativos por hora del día (0-23) y día de la semana (lunes=0)
+ - recompra: fracción de ventas hechas por clientes frecuentes, que son la fracción
+   'clientes_frecuentes' de los clientes; el resto se reparte entre todos
+
+Con un perfil, todos los _id se derivan del índice del documento (id_determinista), así que
+dos poblamientos con el mismo perfil producen los mismos documentos byte a byte. Solo
+cambian lo que asigna GridFS al escribir (uploadDate en multimedia.files y el _id de cada
+documento de multimedia.chunks) y el orden físico de inserción: comparar ordenando por _id
+(los chunks, por files_id y n, sin su _id).
+
+ - obtener_perfil(nombre): el perfil (copia) o ValueError si no existe
+ - semilla(perfil, etapa): SeedSequence estable para una etapa ("productos", "ventas"...)
+ - id_determinista(referencia, coleccion, indice): ObjectId reproducible
+ - pesos_popularidad(rng, n, s): probabilidades de venta por producto
+ - sal_bcrypt(rng): sal de bcrypt sorteada con rng
+"""
+import copy
+from datetime import datetime, timezone
+
+import numpy as np
+from bson import ObjectId
+
+FECHA_REFERENCIA = datetime(2025, 1, 1, tzinfo=timezone.utc)
+CHUNK_PERFIL = 10000   # fijo: el tamaño de lote determina qué semilla recibe cada documento
+
+# Semana típica de supermercado: picos a mediodía y al salir del trabajo, fin de semana fuerte
+_HORAS = [0.2, 0.1, 0.1, 0.1, 0.1, 0.2, 0.5, 1.0, 1.6, 2.0, 2.4, 2.8,
+          3.2, 3.0, 2.6, 2.4, 2.6, 3.2, 3.6, 3.4, 2.6, 1.6, 0.8, 0.4]
+_DIAS_SEMANA = [0.9, 0.85, 0.9, 0.95, 1.15, 1.4, 1.25]
+
+DISTRIBUCION_BASE = {
+    "popularidad_zipf": 1.1,
+    "horas": _HORAS,
+    "dias_semana": _DIAS_SEMANA,
+    "recompra": 0.6,
+    "clientes_frecuentes": 0.2,
+}
+
+PERFILES = {
+    "small": {
+        "seed": 20250101,
+        "registros": {"usuarios": 20, "areas": 11, "productos": 200, "clientes": 5_000, "ventas": 10_000,
+                      "logs": 5_000, "imagenes_color": 100, "fotos_ruido": 100, "videos": 10},
+    },
+    "medium": {
+        "seed": 20250102,
+        "registros": {"usuarios": 50, "areas": 11, "productos": 1000, "clientes": 50_000, "ventas": 100_000,
+                      "logs": 50_000, "imagenes_color": 1000, "fotos_ruido": 1000, "videos": 100},
+    },
+    "500k": {
+        "seed": 20250103,
+        "registros": {"usuarios": 100, "areas": 11, "productos": 2000, "clientes": 100_000, "ventas": 500_000,
+                      "logs": 100_000, "imagenes_color": 5000, "fotos_ruido": 5000, "videos": 500},
+    },
+    "5M": {
+        "seed": 20250104,
+        "registros": {"usuarios": 200, "areas": 11, "productos": 5000, "clientes": 1_000_000,
+                      "ventas": 5_000_000, "logs": 1_000_000, "imagenes_color": 10_000, "fotos_ruido": 10_000,
+                      "videos": 1000},
+        "distribucion": {"popularidad_zipf": 1.2},
+    },
+}
+
+# Etapas con semilla propia: agregar al final para no cambiar las semillas de las existentes
+ETAPAS = ("productos", "usuarios", "clientes", "ventas", "logs", "multimedia", "popularidad")
+_CODIGO_COLECCION = {"usuarios": 1, "productos": 2, "clientes": 3, "ventas": 4, "logs": 5,
+                     "imagen": 6, "foto": 7, "video": 8}
+
+_ALFABETO_BCRYPT = "./ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+
+
+def obtener_perfil(nombre):
+    if nombre not in PERFILES:
+        raise ValueError(f"Perfil desconocido: {nombre}. Opciones: {', '.join(PERFILES)}")
+    base = copy.deepcopy(PERFILES[nombre])
+    return {
+        "nombre": nombre,
+        "seed": base["seed"],
+        "registros": base["registros"],
+        "referencia": base.get("referencia", FECHA_REFERENCIA),
+        "distribucion": {**copy.deepcopy(DISTRIBUCION_BASE), **base.get("distribucion", {})},
+    }
+
+
+def semilla(perfil, etapa):
+    return np.random.SeedSequence(perfil["seed"], spawn_key=(ETAPAS.index(etapa),))
+
+
+def id_determinista(referencia, coleccion, indice):
+    """Timestamp de la referencia (4 bytes) + código de colección (1) + índice (7)."""
+    ts = int(referencia.timestamp())
+    return ObjectId(ts.to_bytes(4, "big") + bytes([_CODIGO_COLECCION[coleccion]]) + int(indice).to_bytes(7, "big"))
+
+
+def pesos_popularidad(rng, n, s):
+    if n <= 0:
+        return None
+    pesos = 1.0 / np.arange(1, n + 1, dtype=np.float64) ** s
+    pesos = pesos[rng.permutation(n)]
+    return pesos / pesos.sum()
+
+
+def sal_bcrypt(rng, rondas=12):
+    # 22 caracteres en la base64 de bcrypt; el último solo aporta 2 bits (.Oeu)
+    cuerpo = "".join(_ALFABETO_BCRYPT[i] for i in rng.integers(0, 64, 21).tolist())
+    return f"$2b${rondas:02d}${cuerpo}{'.Oeu'[int(rng.integers(0, 4))]}".encode("ascii")
@@ -0,0 +1,162 @@
+"""
+Registro en memoria del avance del poblamiento (lo lee /db/progreso en lugar de contar en la BD).
+
+El proceso que ejecuta el poblamiento publica aquí cada lote confirmado: los workers de
+generador_datos y generador_multimedia devuelven sus conteos al proceso padre, que los suma al
+terminar cada tarea. Todas las operaciones toman un mismo Condition, así que se puede leer
+desde los hilos de Flask mientras el hilo del poblamiento escribe; esperar_cambio() despierta
+a los streams SSE en cada actualización.
+
+Por etapa: total, current (confirmados), fallidos, status (idle/running/done/error), por_seg
+(ventana de las últimas muestras) y eta_s. El registro vive en el proceso que corre el
+poblamiento: con varios workers de gunicorn, /db/progreso solo lo ve el que lanzó el trabajo.
+
+ - iniciar(totales): nuevo trabajo con {etapa: total}; reinicia el registro
+ - sumar(etapa, n, fallidos=0): suma documentos confirmados (y fallidos) a la etapa
+ - marcar(etapa, status): cambia el estado de la etapa
+ - finalizar(message, status="done"): fin del trabajo; las etapas sin terminar pasan a 'status'
+   ("done", o "error" si el trabajo se interrumpió)
+ - snapshot(): copia del estado; None si no se inició ningún trabajo en este proceso
+ - version(): número de versión actual (cambia con cada actualización)
+ - esperar_cambio(version, timeout): bloquea hasta que la versión cambie (o timeout)
+"""
+import time
+import threading
+from collections import deque
+
+MUESTRAS_RATE = 20     # muestras (t, current) por etapa para la velocidad reciente
+
+_cond = threading.Condition()
+_estado = {"version": 0, "trabajo": None}
+
+
+def _nueva_etapa(total):
+    return {"total": int(total), "current": 0, "fallidos": 0, "status": "idle",
+            "inicio": None, "fin": None, "muestras": deque(maxlen=MUESTRAS_RATE)}
+
+
+def _cambio():
+    _estado["version"] += 1
+    _cond.notify_all()
+
+
+def iniciar(totales):
+    with _cond:
+        _estado["trabajo"] = {
+            "inicio": time.time(),
+            "fin": None,
+            "message": "Procesando…",
+            "etapas": {e: _nueva_etapa(t) for e, t in totales.items()},
+        }
+        _cambio()
+
+
+def _etapa(etapa):
+    trabajo = _estado["trabajo"]
+    if trabajo is None:
+        return None
+    return trabajo["etapas"].setdefault(etapa, _nueva_etapa(0))
+
+
+def sumar(etapa, n, fallidos=0):
+    ahora = time.time()
+    with _cond:
+        e = _etapa(etapa)
+        if e is None:
+            return
+        if e["inicio"] is None:
+            e["inicio"] = ahora
+            e["muestras"].append((ahora, 0))
+        e["status"] = "running" if e["status"] == "idle" else e["status"]
+        e["current"] += int(n)
+        e["fallidos"] += int(fallidos)
+        e["muestras"].append((ahora, e["current"]))
+        _cambio()
+
+
+def marcar(etapa, status):
+    ahora = time.time()
+    with _cond:
+        e = _etapa(etapa)
+        if e is None:
+            return
+        if status == "running" and e["inicio"] is None:
+            e["inicio"] = ahora
+            e["muestras"].append((ahora, e["current"]))
+        if status in ("done", "error"):
+            e["fin"] = ahora
+        e["status"] = status
+        _cambio()
+
+
+def finalizar(message, status="done"):
+    ahora = time.time()
+    with _cond:
+        trabajo = _estado["trabajo"]
+        if trabajo is None:
+            return
+        for e in trabajo["etapas"].values():
+            if e["status"] in ("idle", "running"):
+                e["status"] = status
+                e["fin"] = e["fin"] or ahora
+        trabajo["fin"] = ahora
+        trabajo["message"] = message
+        _cambio()
+
+
+def _velocidad(e, ahora):
+    """Documentos/s en la ventana de muestras; si la ventana es muy corta, desde el inicio."""
+    muestras = e["muestras"]
+    if len(muestras) >= 2 and muestras[-1][0] - muestras[0][0] > 0.5:
+        (t0, c0), (t1, c1) = muestras[0], muestras[-1]
+        return (c1 - c0) / (t1 - t0)
+    if e["inicio"] is None:
+        return None
+    transcurrido = (e["fin"] or ahora) - e["inicio"]
+    return e["current"] / transcurrido if transcurrido > 0 else None
+
+
+def _resumen_etapa(e, ahora):
+    por_seg = _velocidad(e, ahora)
+    restante = max(0, e["total"] - e["current"] - e["fallidos"])
+    eta = None
+    if e["status"] == "running" and por_seg:
+        eta = round(restante / por_seg, 1)
+    elif e["status"] in ("done", "error"):
+        eta = 0
+    return {
+        "total": e["total"],
+        "current": e["current"],
+        "fallidos": e["fallidos"],
+        "status": e["status"],
+        "por_seg": round(por_seg, 1) if por_seg is not None else None,
+        "eta_s": eta,
+        "elapsed_s": round((e["fin"] or ahora) - e["inicio"], 3) if e["inicio"] else 0,
+    }
+
+
+def snapshot():
+    ahora = time.time()
+    with _cond:
+        trabajo = _estado["trabajo"]
+        if trabajo is None:
+            return None
+        return {
+            "version": _estado["version"],
+            "activo": trabajo["fin"] is None,
+            "message": trabajo["message"],
+            "elapsed_s": round((trabajo["fin"] or ahora) - trabajo["inicio"], 3),
+            "etapas": {n: _resumen_etapa(e, ahora) for n, e in trabajo["etapas"].items()},
+        }
+
+
+def version():
+    with _cond:
+        return _estado["version"]
+
+
+def esperar_cambio(version_vista, timeout=None):
+    """Espera a que la versión sea distinta de 'version_vista'; devuelve la versión actual."""
+    with _cond:
+        _cond.wait_for(lambda: _estado["version"] != version_vista, timeout=timeout)
+        return _estado["version"]
@@ -0,0 +1,117 @@
+"""
+Benchmark de throughput del checkout con descuento de stock (checkout.registrar_venta_con_stock).
+
+Lanza N workers concurrentes que registran ventas sobre un conjunto pequeño de productos
+(contención alta a propósito) en una base separada, y al final comprueba que el stock vendido
+cuadre con las ventas insertadas y que ningún producto quede con stock negativo.
+
+Uso (desde backend/):
+    python -m controllers.puntoVenta.benchmark_checkout --workers 8 --ventas 200 --productos 20 --lineas 5
+
+La base de --db se vacía y se borra al terminar: se rechaza la de la aplicación (MONGO_DB_NAME).
+"""
+import argparse
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from .checkout import StockInsuficiente, registrar_venta_con_stock, soporta_transacciones
+
+
+def preparar(db, n_productos, stock):
+    db["productos"].drop()
+    db["ventas"].drop()
+    ids = db["productos"].insert_many([
+        {"nombre": f"bench_{i}", "precio": 10.0 + i, "stock": stock, "area_id": 1}
+        for i in range(n_productos)
+    ]).inserted_ids
+    return list(ids)
+
+
+def _worker(db, ids, n_ventas, n_lineas, semilla, latencias, contadores, lock):
+    rnd = random.Random(semilla)
+    for _ in range(n_ventas):
+        elegidos = rnd.sample(ids, min(n_lineas, len(ids)))
+        descuentos = {pid: rnd.randint(1, 3) for pid in elegidos}
+        venta = {
+            "productos": [{"producto_id": pid, "cantidad": c} for pid, c in descuentos.items()],
+            "total": 0.0,
+            "vendedor_key": "bench",
+            "created_at": datetime.utcnow(),
+            "estado": "completada",
+        }
+        inicio = time.perf_counter()
+        try:
+            registrar_venta_con_stock(db, venta, descuentos)
+            clave = "ok"
+        except StockInsuficiente:
+            clave = "sin_stock"
+        except Exception:
+            clave = "error"
+        ms = (time.perf_counter() - inicio) * 1000
+        with lock:
+            latencias.append(ms)
+            contadores[clave] += 1
+
+
+def ejecutar(db, workers=8, ventas=200, productos=20, lineas=5, stock=1000):
+    ids = preparar(db, productos, stock)
+    latencias = []
+    contadores = {"ok": 0, "sin_stock": 0, "error": 0}
+    lock = threading.Lock()
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        for w in range(workers):
+            ex.submit(_worker, db, ids, ventas, lineas, w, latencias, contadores, lock)
+    elapsed = time.perf_counter() - inicio
+
+    # Consistencia: stock inicial - stock final == unidades en ventas insertadas
+    vendidas = sum(
+        linea["cantidad"] for v in db["ventas"].find({}, {"productos.cantidad": 1}) for linea in v["productos"]
+    )
+    stock_final = sum(p["stock"] for p in db["productos"].find({}, {"stock": 1}))
+    negativos = db["productos"].count_documents({"stock": {"$lt": 0}})
+    latencias.sort()
+    total = len(latencias)
+    return {
+        "modo": "transaccion" if soporta_transacciones(db) else "compensacion",
+        "workers": workers,
+        "intentos": total,
+        **contadores,
+        "elapsed_s": round(elapsed, 3),
+        "ventas_por_seg": round(contadores["ok"] / elapsed, 1) if elapsed > 0 else None,
+        "latencia_ms": {
+            "p50": round(statistics.median(latencias), 2) if latencias else None,
+            "p95": round(latencias[int(total * 0.95) - 1], 2) if total else None,
+            "max": round(latencias[-1], 2) if latencias else None,
+        },
+        "consistente": (productos * stock - stock_final) == vendidas and negativos == 0,
+    }
+
+
+if __name__ == "__main__":
+    from db.conexion import MONGO_DB_NAME, get_client
+
+    parser = argparse.ArgumentParser(description="Benchmark de checkouts concurrentes con descuento de stock.")
+    parser.add_argument("--db", default="superpancho_bench", help="Base de datos desechable para el benchmark")
+    parser.add_argument("--workers", "-w", type=int, nargs="+", default=[1, 4, 8, 16],
+                        help="Número de workers concurrentes (uno o varios valores)")
+    parser.add_argument("--ventas", type=int, default=200, help="Ventas por worker")
+    parser.add_argument("--productos", type=int, default=20, help="Productos distintos (menos = más contención)")
+    parser.add_argument("--lineas", type=int, default=5, help="Líneas por venta")
+    parser.add_argument("--stock", type=int, default=1000, help="Stock inicial por producto")
+    args = parser.parse_args()
+    if args.db == MONGO_DB_NAME:
+        # preparar() borra productos y ventas y al final se borra la base entera
+        parser.error(f"--db no puede ser la base de la aplicación ({MONGO_DB_NAME})")
+
+    bench_db = get_client()[args.db]
+    for w in args.workers:
+        res = ejecutar(bench_db, workers=w, ventas=args.ventas, productos=args.productos,
+                       lineas=args.lineas, stock=args.stock)
+        print(res)
+    bench_db.client.drop_database(args.db)
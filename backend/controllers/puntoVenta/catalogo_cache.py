@@ -0,0 +1,211 @@
+"""
+Caché en memoria del proceso para el catálogo que el punto de venta consulta constantemente.
+
+ - nombres_areas(db, ids): {area_id: nombre} desde un mapa de todas las áreas (la colección es
+   pequeña), recargado cada AREAS_CACHE_TTL segundos o cuando se pide un id que no está.
+ - catalogo_areas(db) / catalogo_productos(db, area_id, area_id_num): respuesta ya serializada
+   de /api/areas y /api/productos/<area_id> con su ETag (hash del contenido, igual en todos los
+   workers), servida sin ir a MongoDB mientras no se invalide.
+ - invalidar_areas() / invalidar_productos(): los llaman AreaModel y ProductoModel al escribir.
+ - aplicar_descuentos(descuentos): descarta solo las listas que contienen esos productos (tras
+   una venta o anulación); el resto del catálogo sigue cacheado.
+ - actualizar_stock(cambios): parchea el stock absoluto leído de MongoDB (faltantes de una venta,
+   eventos del change stream) en las listas cacheadas.
+ - iniciar_change_stream(db): opcional (CATALOGO_CHANGE_STREAM=1, requiere replica set); invalida
+   o parchea ante escrituras hechas por otros procesos.
+
+Toda escritura sube la generación del tipo: una carga que empezó antes no se guarda (podría
+traer el stock previo a la venta). CATALOGO_CACHE_TTL (por defecto 300 s) acota lo que puede
+durar una entrada sin invalidación. Sin change stream las ventas de otros workers no se ven, así
+que las listas de productos duran CATALOGO_STOCK_TTL (por defecto 5 s).
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+try:
+    AREAS_CACHE_TTL = int(os.environ.get("AREAS_CACHE_TTL", "60"))
+except ValueError:
+    AREAS_CACHE_TTL = 60
+try:
+    CATALOGO_CACHE_TTL = int(os.environ.get("CATALOGO_CACHE_TTL", "300"))
+except ValueError:
+    CATALOGO_CACHE_TTL = 300
+try:
+    CATALOGO_STOCK_TTL = int(os.environ.get("CATALOGO_STOCK_TTL", "5"))
+except ValueError:
+    CATALOGO_STOCK_TTL = 5
+
+_lock = threading.Lock()
+_areas = {"expira": 0.0, "cargado": 0.0, "nombres": {}}
+# Recarga por id desconocido como mucho una vez por este intervalo (ids inválidos repetidos)
+_RECARGA_MIN_S = 1.0
+
+_catalogo = {}          # clave -> {"data", "body", "etag", "expira"}
+_claves_producto = {}   # producto_id (str) -> set de claves "productos:<area_id>" que lo contienen
+_generacion = {"areas": 0, "productos": 0}  # evita guardar una carga que empezó antes de invalidar
+_change_stream = {"activo": False}  # con el stream activo el stock de otros workers llega por eventos
+
+
+def _cargar_areas(db):
+    nombres = {a["_id"]: a.get("nombre") for a in db["areas"].find({}, {"nombre": 1})}
+    _areas["nombres"] = nombres
+    ahora = time.time()
+    _areas["cargado"] = ahora
+    _areas["expira"] = ahora + AREAS_CACHE_TTL
+    return nombres
+
+
+def nombres_areas(db, ids):
+    """
+    Devuelve {id: nombre} para los ids pedidos que existen en 'areas'.
+    Un id desconocido fuerza una sola recarga (p. ej. un área recién creada).
+    """
+    with _lock:
+        nombres = _areas["nombres"]
+        ahora = time.time()
+        faltan = any(i not in nombres for i in ids)
+        if ahora >= _areas["expira"] or (faltan and ahora - _areas["cargado"] >= _RECARGA_MIN_S):
+            nombres = _cargar_areas(db)
+        return {i: nombres[i] for i in ids if i in nombres}
+
+
+def _ttl(tipo):
+    if tipo == "productos" and not _change_stream["activo"]:
+        return min(CATALOGO_CACHE_TTL, CATALOGO_STOCK_TTL)
+    return CATALOGO_CACHE_TTL
+
+
+def _entrada(data, tipo):
+    body = json.dumps({"success": True, "data": data}, ensure_ascii=False).encode("utf-8")
+    return {"data": data, "body": body, "etag": hashlib.sha1(body).hexdigest(),
+            "expira": time.time() + _ttl(tipo)}
+
+
+def _obtener(clave, tipo, cargar):
+    with _lock:
+        e = _catalogo.get(clave)
+        if e is not None and e["expira"] > time.time():
+            return e
+        gen = _generacion[tipo]
+    data = cargar()  # fuera del lock: la consulta no bloquea al resto del catálogo
+    e = _entrada(data, tipo)
+    with _lock:
+        if _generacion[tipo] == gen:
+            _catalogo[clave] = e
+            if tipo == "productos":
+                for p in data:
+                    _claves_producto.setdefault(p["_id"], set()).add(clave)
+    return e
+
+
+def catalogo_areas(db):
+    def _cargar():
+        return [{"_id": str(a["_id"]), "nombre": a["nombre"]}
+                for a in db["areas"].find({}, {"nombre": 1}).sort("nombre")]
+    return _obtener("areas", "areas", _cargar)
+
+
+def catalogo_productos(db, area_id, area_id_num):
+    """area_id: el string recibido en la URL (se devuelve tal cual); area_id_num: el _id numérico."""
+    def _cargar():
+        return [
+            {
+                "_id": str(p["_id"]),
+                "nombre": p["nombre"],
+                "precio": p.get("precio", 0),
+                "stock": p.get("stock", 0),
+                "area_id": area_id,
+            }
+            for p in db["productos"].find({"area_id": area_id_num},
+                                          {"nombre": 1, "precio": 1, "stock": 1}).sort("nombre")
+        ]
+    return _obtener(f"productos:{area_id}", "productos", _cargar)
+
+
+def invalidar_areas():
+    with _lock:
+        _areas["expira"] = 0.0
+        _generacion["areas"] += 1
+        _catalogo.pop("areas", None)
+
+
+def invalidar_productos():
+    with _lock:
+        _generacion["productos"] += 1
+        for clave in [c for c in _catalogo if c.startswith("productos:")]:
+            del _catalogo[clave]
+        _claves_producto.clear()
+
+
+def actualizar_stock(cambios):
+    """cambios: {producto_id: stock nuevo}. Reescribe solo las listas que contienen esos productos."""
+    with _lock:
+        _generacion["productos"] += 1
+        tocadas = set()
+        for pid, stock in cambios.items():
+            for clave in _claves_producto.get(str(pid), ()):
+                e = _catalogo.get(clave)
+                if e is None:
+                    continue
+                for p in e["data"]:
+                    if p["_id"] == str(pid):
+                        p["stock"] = stock
+                tocadas.add(clave)
+        for clave in tocadas:
+            viejo = _catalogo[clave]
+            nuevo = _entrada(viejo["data"], "productos")
+            nuevo["expira"] = viejo["expira"]
+            _catalogo[clave] = nuevo
+
+
+def aplicar_descuentos(descuentos):
+    """
+    descuentos: {producto_id: unidades} ya aplicados en MongoDB. Descarta las listas que contienen
+    esos productos en vez de restarles la cantidad: una lista cargada mientras la venta se
+    confirmaba puede traer ya el stock nuevo, y restarle otra vez lo descontaría dos veces.
+    """
+    with _lock:
+        _generacion["productos"] += 1
+        for pid in descuentos:
+            for clave in _claves_producto.pop(str(pid), ()):
+                _catalogo.pop(clave, None)
+
+
+def iniciar_change_stream(db, logger=None):
+    """
+    Hilo que escucha 'productos' y 'areas' y mantiene el catálogo al día con escrituras de otros
+    procesos. Los updates que solo tocan stock parchean; el resto invalida. Si el servidor no
+    soporta change streams (standalone) el hilo registra el error y termina.
+    """
+    log = logger.warning if logger else print
+
+    def _run():
+        pipeline = [{"$match": {"ns.coll": {"$in": ["productos", "areas"]}}}]
+        try:
+            with db.watch(pipeline) as stream:
+                _change_stream["activo"] = True
+                invalidar_productos()  # lo cargado antes del stream vive con el TTL corto
+                for ev in stream:
+                    coll = ev.get("ns", {}).get("coll")
+                    if coll == "areas":
+                        invalidar_areas()
+                        continue
+                    campos = (ev.get("updateDescription") or {}).get("updatedFields") or {}
+                    if ev.get("operationType") == "update" and campos and \
+                            all(c == "stock" or c.startswith("reservas_venta") for c in campos):
+                        if "stock" in campos:
+                            actualizar_stock({str(ev["documentKey"]["_id"]): campos["stock"]})
+                        continue
+                    invalidar_productos()
+        except Exception as e:
+            log(f"Change stream del catálogo detenido: {e}")
+        finally:
+            _change_stream["activo"] = False
+            invalidar_productos()
+
+    t = threading.Thread(target=_run, daemon=True, name="catalogo_change_stream")
+    t.start()
+    return t
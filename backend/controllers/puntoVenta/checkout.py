@@ -0,0 +1,250 @@
+"""
+Confirmación de una venta del punto de venta con descuento atómico de stock.
+
+ - registrar_venta_con_stock(db, venta, descuentos): descuenta stock e inserta la venta
+ - anular_venta(db, venta_id): marca la venta como anulada, devuelve el stock y descuenta los agregados
+ - reconciliar_reservas(db, antiguedad_s): devuelve el stock de ventas que quedaron a medias (solo
+   standalone); antiguedad_s no puede bajar de POS_RESERVA_MIN_S (por defecto 60)
+ - iniciar_reconciliador(db): hilo que llama a reconciliar_reservas al arrancar y cada
+   POS_RECONCILIAR_S segundos (por defecto 300; 0 lo desactiva). También se puede lanzar a
+   mano con POST /api/ventas/reservas/reconciliar
+
+El stock de todas las líneas se descuenta con un único bulk_write de updates condicionales
+({_id, stock >= cantidad} -> $inc -cantidad): la condición y el descuento son atómicos por
+documento, así que dos cajas concurrentes nunca dejan stock negativo y no hay lecturas previas.
+
+ - Replica set / mongos: bulk_write, insert de 'ventas' y el bucket de ventas_diarias van en la
+   misma transacción; si alguna línea no tiene stock se aborta y no queda nada aplicado.
+ - Standalone (sin transacciones): cada update deja una reserva {v: venta_id, c: cantidad} en
+   el producto. Si falta stock o falla el insert, se devuelven solo las líneas que llevan la
+   reserva; si todo sale bien las reservas se quitan. Si el proceso muere a mitad,
+   reconciliar_reservas() devuelve el stock de las reservas cuya venta no existe.
+
+POS_TRANSACCIONES=auto|si|no fuerza el modo (por defecto auto, según la topología).
+"""
+import datetime
+import os
+import threading
+
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+
+from ..spark.rollups import registrar_venta_rollups
+from .catalogo_cache import invalidar_productos
+from .reportes import registrar_venta_reportes
+from .ventas_diarias import registrar_venta_dia
+
+RESERVAS = "reservas_venta"
+MODO_TRANSACCIONES = os.environ.get("POS_TRANSACCIONES", "auto").strip().lower()
+try:
+    RECONCILIAR_S = int(os.environ.get("POS_RECONCILIAR_S", "300"))
+except ValueError:
+    RECONCILIAR_S = 300
+# Antigüedad mínima de una reserva para darla por huérfana: muy por encima de lo que tarda un
+# checkout entre el descuento y el insert (si no, se devolvería el stock de una venta en curso)
+try:
+    RESERVA_MIN_S = int(os.environ.get("POS_RESERVA_MIN_S", "60"))
+except ValueError:
+    RESERVA_MIN_S = 60
+
+
+class StockInsuficiente(Exception):
+    def __init__(self, faltantes):
+        super().__init__("Stock insuficiente")
+        self.faltantes = faltantes
+
+
+def soporta_transacciones(db) -> bool:
+    if MODO_TRANSACCIONES in ("si", "true", "1"):
+        return True
+    if MODO_TRANSACCIONES in ("no", "false", "0"):
+        return False
+    try:
+        tipo = db.client.topology_description.topology_type_name
+    except Exception:
+        return False
+    return tipo in ("ReplicaSetWithPrimary", "Sharded")
+
+
+def _faltantes(db, descuentos, session=None):
+    """Productos cuyo stock actual no alcanza para la cantidad pedida."""
+    actuales = {
+        p["_id"]: p.get("stock", 0)
+        for p in db["productos"].find({"_id": {"$in": list(descuentos)}}, {"stock": 1}, session=session)
+    }
+    return [
+        {"producto_id": str(pid), "solicitado": cant, "disponible": actuales.get(pid, 0)}
+        for pid, cant in descuentos.items()
+        if actuales.get(pid, 0) < cant
+    ]
+
+
+def _fecha(venta):
+    return venta.get("created_at") or datetime.datetime.utcnow()
+
+
+def registrar_agregados(db, venta, signo=1, session=None):
+    """
+    Bucket diario, totales de reportes y rollups de /api/analisis de la venta (signo=-1 para
+    anularla). Los rollups solo cambian si la venta ya estaba incorporada (ver spark/rollups).
+    """
+    registrar_venta_dia(db, _fecha(venta), venta.get("total", 0), session=session, signo=signo)
+    registrar_venta_reportes(db, venta, signo=signo, session=session)
+    registrar_venta_rollups(db, venta, signo=signo, session=session)
+
+
+def _con_transaccion(db, venta, descuentos):
+    ops = [UpdateOne({"_id": pid, "stock": {"$gte": cant}}, {"$inc": {"stock": -cant}})
+           for pid, cant in descuentos.items()]
+
+    def _tx(session):
+        if ops:
+            res = db["productos"].bulk_write(ops, ordered=False, session=session)
+            if res.matched_count < len(ops):
+                # la excepción aborta la transacción; with_transaction la vuelve a lanzar
+                raise StockInsuficiente(None)
+        venta_id = db["ventas"].insert_one(venta, session=session).inserted_id
+        registrar_agregados(db, venta, session=session)
+        return venta_id
+
+    with db.client.start_session() as session:
+        try:
+            return session.with_transaction(_tx)
+        except StockInsuficiente:
+            raise StockInsuficiente(_faltantes(db, descuentos))
+
+
+def _devolver(db, descuentos, venta_id):
+    """Devuelve el stock de las líneas que llevan la reserva de venta_id."""
+    ops = [UpdateOne({"_id": pid, f"{RESERVAS}.v": venta_id},
+                     {"$inc": {"stock": cant}, "$pull": {RESERVAS: {"v": venta_id}}})
+           for pid, cant in descuentos.items()]
+    if ops:
+        db["productos"].bulk_write(ops, ordered=False)
+
+
+def _con_compensacion(db, venta, descuentos):
+    venta_id = venta.setdefault("_id", ObjectId())
+    ops = [UpdateOne({"_id": pid, "stock": {"$gte": cant}},
+                     {"$inc": {"stock": -cant}, "$push": {RESERVAS: {"v": venta_id, "c": cant}}})
+           for pid, cant in descuentos.items()]
+    if ops:
+        res = db["productos"].bulk_write(ops, ordered=False)
+        if res.matched_count < len(ops):
+            _devolver(db, descuentos, venta_id)
+            raise StockInsuficiente(_faltantes(db, descuentos))
+    try:
+        db["ventas"].insert_one(venta)
+    except Exception:
+        _devolver(db, descuentos, venta_id)
+        raise
+    if ops:
+        db["productos"].update_many({"_id": {"$in": list(descuentos)}},
+                                    {"$pull": {RESERVAS: {"v": venta_id}}})
+    try:
+        registrar_agregados(db, venta)
+    except Exception as e:
+        # la venta ya está guardada; los agregados se corrigen con reconstruir_ventas_diarias()
+        # y reconstruir_reportes()
+        print(f"⚠️ No se pudieron actualizar los agregados para la venta {venta_id}: {e}")
+    return venta_id
+
+
+def registrar_venta_con_stock(db, venta, descuentos):
+    """
+    descuentos: {producto_id (ObjectId): cantidad total} de las líneas con stock controlado.
+    Devuelve el _id de la venta insertada; lanza StockInsuficiente (con .faltantes) si alguna
+    línea no alcanza, sin dejar stock descontado.
+    """
+    if soporta_transacciones(db):
+        return _con_transaccion(db, venta, descuentos)
+    return _con_compensacion(db, venta, descuentos)
+
+
+def anular_venta(db, venta_id):
+    """
+    Pasa la venta a estado 'anulada' (una sola vez: el filtro excluye las ya anuladas), devuelve
+    el stock de sus líneas y resta la venta de los agregados. Devuelve {producto_id: unidades
+    devueltas} o None si la venta no existe o ya estaba anulada.
+    """
+    filtro = {"_id": venta_id, "estado": {"$ne": "anulada"}}
+    ahora = datetime.datetime.utcnow()
+    # updated_at: la anulación entra en el siguiente backup incremental
+    cambio = {"$set": {"estado": "anulada", "anulada_at": ahora, "updated_at": ahora}}
+
+    def _anular(session=None):
+        venta = db["ventas"].find_one_and_update(filtro, cambio, return_document=ReturnDocument.BEFORE,
+                                                 session=session)
+        if venta is None:
+            return None
+        devueltos = {}
+        for linea in venta.get("productos") or []:
+            pid = linea.get("producto_id")
+            if isinstance(pid, ObjectId):
+                devueltos[pid] = devueltos.get(pid, 0) + int(linea.get("cantidad") or 0)
+        if devueltos:
+            db["productos"].bulk_write([
+                UpdateOne({"_id": pid, "stock": {"$type": "number"}}, {"$inc": {"stock": cant}})
+                for pid, cant in devueltos.items()
+            ], ordered=False, session=session)
+        registrar_agregados(db, venta, signo=-1, session=session)
+        return devueltos
+
+    if soporta_transacciones(db):
+        with db.client.start_session() as session:
+            return session.with_transaction(_anular)
+    return _anular()
+
+
+def reconciliar_reservas(db, antiguedad_s=300):
+    """
+    Devuelve el stock de reservas con más de 'antiguedad_s' segundos cuya venta no existe
+    (proceso caído entre el descuento y el insert). Devuelve cuántas reservas se liberaron.
+    Lanza ValueError si antiguedad_s es menor que POS_RESERVA_MIN_S.
+    """
+    if antiguedad_s < RESERVA_MIN_S:
+        raise ValueError(f"antiguedad_s debe ser al menos {RESERVA_MIN_S}")
+    limite = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=antiguedad_s)
+    liberadas = 0
+    for prod in db["productos"].find({f"{RESERVAS}.0": {"$exists": True}}, {RESERVAS: 1}):
+        for r in prod.get(RESERVAS, []):
+            venta_id = r.get("v")
+            if not isinstance(venta_id, ObjectId) or venta_id.generation_time > limite:
+                continue
+            if db["ventas"].count_documents({"_id": venta_id}, limit=1):
+                db["productos"].update_one({"_id": prod["_id"]}, {"$pull": {RESERVAS: {"v": venta_id}}})
+                continue
+            res = db["productos"].update_one(
+                {"_id": prod["_id"], f"{RESERVAS}.v": venta_id},
+                {"$inc": {"stock": r.get("c", 0)}, "$pull": {RESERVAS: {"v": venta_id}}},
+            )
+            liberadas += res.modified_count
+    return liberadas
+
+
+def iniciar_reconciliador(db, logger=None, intervalo=None):
+    """
+    Hilo que libera las reservas huérfanas al arrancar (las que dejó un proceso caído) y luego
+    cada 'intervalo' segundos (POS_RECONCILIAR_S). Si libera stock invalida el catálogo cacheado.
+    """
+    intervalo = RECONCILIAR_S if intervalo is None else intervalo
+    if intervalo <= 0:
+        return None
+    log = logger.warning if logger else print
+    parar = threading.Event()
+
+    def _run():
+        while True:
+            try:
+                liberadas = reconciliar_reservas(db, max(300, RESERVA_MIN_S))
+                if liberadas:
+                    invalidar_productos()
+                    log(f"Reservas de stock huérfanas liberadas: {liberadas}")
+            except Exception as e:
+                log(f"Error al reconciliar reservas de stock: {e}")
+            if parar.wait(intervalo):
+                return
+
+    t = threading.Thread(target=_run, daemon=True, name="reconciliar_reservas")
+    t.start()
+    return t
@@ -1,26 +1,35 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request
 from bson import ObjectId
 from datetime import datetime, timedelta # Importar timedelta
 from db.conexion import get_db
+from .catalogo_cache import (actualizar_stock, aplicar_descuentos, catalogo_areas, catalogo_productos,
+                             invalidar_productos, nombres_areas)
+from .checkout import StockInsuficiente, anular_venta, reconciliar_reservas, registrar_venta_con_stock
+from .reportes import reconstruir_reportes, top_areas, top_productos
+from .ventas_diarias import leer_dias, reconstruir_ventas_diarias
 
 punto_venta = Blueprint("punto_venta", __name__)
 db = get_db()
 
+
+def _respuesta_catalogo(entrada):
+    """Respuesta cacheada con ETag; 304 si el cliente ya tiene esa versión (If-None-Match)."""
+    if entrada["etag"] in request.if_none_match:
+        resp = Response(status=304)
+    else:
+        resp = Response(entrada["body"], mimetype="application/json")
+    resp.set_etag(entrada["etag"])
+    resp.headers["Cache-Control"] = "no-cache"  # el navegador revalida siempre con If-None-Match
+    return resp
+
 # ===============================
 # GET /api/areas
 # ===============================
 @punto_venta.route("/areas", methods=["GET"])
 def obtener_areas():
     try:
-        areas_cursor = db["areas"].find().sort("nombre")
-        
-        # Asumiendo que _id en 'areas' puede ser un número, lo convertimos a string
-        # Si _id es ObjectId, str() también funciona. Esto es seguro.
-        areas = [
-            {"_id": str(a["_id"]), "nombre": a["nombre"]} 
-            for a in areas_cursor
-        ]
-        return jsonify({"success": True, "data": areas})
+        # Lista en memoria (ver catalogo_cache.py); _id se devuelve como string
+        return _respuesta_catalogo(catalogo_areas(db))
     except Exception as e:
         return jsonify({"success": False, "error": f"Error en obtener_areas: {str(e)}"}), 500
 
@@ -39,23 +48,8 @@ def obtener_productos(area_id):
         except ValueError:
             return jsonify({"success": False, "error": "ID de área debe ser un número"}), 400
 
-        # Buscamos en la colección 'productos' usando el NÚMERO
-        productos_cursor = db["productos"].find({"area_id": area_id_num}).sort("nombre")
-        # --- FIN DEL CAMBIO ---
-        
-        productos = [
-            {
-                "_id": str(p["_id"]),
-                "nombre": p["nombre"],
-                "precio": p.get("precio", 0),
-                "stock": p.get("stock", 0),  # <--- ¡Línea agregada aquí!
-                # Devolvemos el area_id original (string) que recibimos
-                # Esto es lo que el frontend usará
-                "area_id": area_id 
-            }
-            for p in productos_cursor
-        ]
-        return jsonify({"success": True, "data": productos})
+        # Lista en memoria por área (incluye stock; se invalida al escribir productos)
+        return _respuesta_catalogo(catalogo_productos(db, area_id, area_id_num))
     except Exception as e:
         return jsonify({"success": False, "error": f"Error en obtener_productos: {str(e)}"}), 500
 
@@ -77,40 +71,59 @@ def registrar_venta():
         if not productos_in:
             return jsonify({"success": False, "error": "Debe incluir al menos un producto"}), 400
 
-        productos_procesados = []
-        total_calculado = 0.0
-
+        # 1. Validar IDs de todas las líneas (sin tocar la BD)
+        lineas = []
         for item in productos_in:
-            # 1. Validar producto (esto usa ObjectId, lo cual parece correcto para _id de producto)
             try:
                 producto_id_obj = ObjectId(item["producto_id"])
             except Exception:
-                 return jsonify({"success": False, "error": f"ID de producto inválido: {item['producto_id']}"}), 400
-            
-            producto_db = db["productos"].find_one({"_id": producto_id_obj})
-            if not producto_db:
-                return jsonify({"success": False, "error": f"Producto no encontrado: {item['producto_id']}"}), 404
-
-            # --- INICIO DEL CAMBIO (area_id es un NÚMERO) ---
-            # 2. Encontrar el área para guardar el nombre
-            # item["area_id"] es un string (ej: "1") que envió el frontend
+                producto_id_obj = None
             try:
                 area_id_num = int(item["area_id"])
             except Exception:
-                return jsonify({"success": False, "error": f"ID de área inválido en el item: {item['area_id']}"}), 400
+                area_id_num = None
+            lineas.append((item, producto_id_obj, area_id_num))
+
+        # 2. Resolver todos los productos con una sola consulta $in y las áreas desde la caché
+        ids_validos = list({p for _, p, _ in lineas if p is not None})
+        productos_db = {
+            p["_id"]: p
+            for p in db["productos"].find({"_id": {"$in": ids_validos}}, {"nombre": 1, "precio": 1, "stock": 1})
+        } if ids_validos else {}
+        areas_nombres = nombres_areas(db, {a for _, _, a in lineas if a is not None})
+
+        productos_procesados = []
+        total_calculado = 0.0
+        descuentos = {}  # producto_id -> unidades a descontar (solo productos con stock numérico)
 
-            # Asumimos que la colección 'areas' usa NÚMEROS para su _id
-            area_db = db["areas"].find_one({"_id": area_id_num})
-            area_nombre = area_db["nombre"] if area_db else "Area Desconocida"
-            # --- FIN DEL CAMBIO ---
+        # 3. Recorrer en orden para conservar los mismos errores que la validación línea a línea
+        for item, producto_id_obj, area_id_num in lineas:
+            if producto_id_obj is None:
+                return jsonify({"success": False, "error": f"ID de producto inválido: {item.get('producto_id')}"}), 400
 
-            # 3. Calcular subtotal en el servidor
+            producto_db = productos_db.get(producto_id_obj)
+            if not producto_db:
+                return jsonify({"success": False, "error": f"Producto no encontrado: {item['producto_id']}"}), 404
+
+            # item["area_id"] es un string (ej: "1"); la colección 'areas' usa NÚMEROS como _id
+            if area_id_num is None:
+                return jsonify({"success": False, "error": f"ID de área inválido en el item: {item.get('area_id')}"}), 400
+            area_nombre = areas_nombres.get(area_id_num) or "Area Desconocida"
+
+            # 4. Calcular subtotal en el servidor
             precio_real = float(producto_db.get("precio", 0))
-            cantidad = int(item.get("cantidad", 1))
+            try:
+                cantidad = int(item.get("cantidad", 1))
+            except (TypeError, ValueError):
+                cantidad = 0
+            if cantidad <= 0:
+                return jsonify({"success": False, "error": f"Cantidad inválida: {item.get('cantidad')}"}), 400
             subtotal = precio_real * cantidad
             total_calculado += subtotal
+            if isinstance(producto_db.get("stock"), (int, float)):
+                descuentos[producto_id_obj] = descuentos.get(producto_id_obj, 0) + cantidad
 
-            # 4. Construir el objeto que SÍ se guardará en la venta
+            # 5. Construir el objeto que SÍ se guardará en la venta
             productos_procesados.append({
                 "producto_id": producto_id_obj,
                 "nombre": producto_db["nombre"],
@@ -145,54 +158,94 @@ def registrar_venta():
             "fecha_ordinal": fecha_ordinal
         }
 
-        result = db["ventas"].insert_one(venta)
+        # Descuento de stock e insert de la venta como una sola operación (ver checkout.py)
+        try:
+            venta_id = registrar_venta_con_stock(db, venta, descuentos)
+        except StockInsuficiente as e:
+            for f in e.faltantes:
+                f["nombre"] = productos_db[ObjectId(f["producto_id"])]["nombre"]
+            # de paso, el catálogo en memoria refleja el stock real de esos productos
+            actualizar_stock({f["producto_id"]: f["disponible"] for f in e.faltantes})
+            return jsonify({"success": False, "error": "Stock insuficiente", "faltantes": e.faltantes}), 409
+        aplicar_descuentos(descuentos)
 
         return jsonify({
             "success": True,
             "mensaje": "Venta registrada exitosamente",
-            "venta_id": str(result.inserted_id)
+            "venta_id": str(venta_id)
         })
     except Exception as e:
         # Añadimos f-string para ver el error específico
         return jsonify({"success": False, "error": f"Error en registrar_venta: {str(e)}"}), 500
     
+# ===============================
+# POST /api/ventas/<venta_id>/anular
+# ===============================
+@punto_venta.route("/ventas/<venta_id>/anular", methods=["POST"])
+def anular(venta_id):
+    try:
+        try:
+            venta_id_obj = ObjectId(venta_id)
+        except Exception:
+            return jsonify({"success": False, "error": f"ID de venta inválido: {venta_id}"}), 400
+
+        devueltos = anular_venta(db, venta_id_obj)
+        if devueltos is None:
+            return jsonify({"success": False, "error": "Venta no encontrada o ya anulada"}), 404
+        aplicar_descuentos({pid: -cant for pid, cant in devueltos.items()})
+
+        return jsonify({"success": True, "mensaje": "Venta anulada", "venta_id": venta_id})
+    except Exception as e:
+        return jsonify({"success": False, "error": f"Error en anular venta: {str(e)}"}), 500
+
+
+# ===============================
+# POST /api/ventas/reservas/reconciliar
+# Devuelve el stock de reservas huérfanas (ver checkout.reconciliar_reservas); ?antiguedad_s=
+# ===============================
+@punto_venta.route("/ventas/reservas/reconciliar", methods=["POST"])
+def reconciliar():
+    try:
+        try:
+            antiguedad_s = int(request.args.get("antiguedad_s", 300))
+        except ValueError:
+            return jsonify({"success": False, "error": "antiguedad_s debe ser un número"}), 400
+        try:
+            liberadas = reconciliar_reservas(db, antiguedad_s)
+        except ValueError as e:
+            # por debajo del mínimo devolvería el stock de checkouts todavía en curso
+            return jsonify({"success": False, "error": str(e)}), 400
+        if liberadas:
+            invalidar_productos()
+        return jsonify({"success": True, "liberadas": liberadas})
+    except Exception as e:
+        return jsonify({"success": False, "error": f"Error al reconciliar reservas: {str(e)}"}), 500
+
+
+def _rango_fechas():
+    """Lee ?desde=&hasta= (YYYY-MM-DD, ambos inclusive). Lanza ValueError si el formato no es válido."""
+    desde = request.args.get("desde")
+    hasta = request.args.get("hasta")
+    return (datetime.strptime(desde, "%Y-%m-%d") if desde else None,
+            datetime.strptime(hasta, "%Y-%m-%d") if hasta else None)
+
 # ===============================
 # GET /api/reportes/top-productos
-# (Esta ruta no necesita cambios)
+# Totales acumulados (ver reportes.py); con ?desde=&hasta= usa los buckets diarios
 # ===============================
 @punto_venta.route("/reportes/top-productos", methods=["GET"])
 def get_top_productos():
     try:
-        pipeline = [
-            {
-                "$unwind": "$productos" # Desenrolla el array de productos
-            },
-            {
-                "$group": {
-                    "_id": "$productos.nombre", 
-                    "totalIngresos": {"$sum": "$productos.subtotal"},
-                    "totalUnidades": {"$sum": "$productos.cantidad"}
-                }
-            },
-            {
-                "$sort": {"totalIngresos": -1} # Ordena por ingresos descendente
-            },
-            {
-                "$limit": 5 # Obtiene el Top 5
-            },
-            {
-                "$project": {
-                    "_id": 0,
-                    "id": "$_id", 
-                    "label": "$_id",
-                    "valueRaw": "$totalIngresos",
-                    "ventas": "$totalUnidades"
-                }
-            }
+        try:
+            desde, hasta = _rango_fechas()
+        except ValueError:
+            return jsonify({"success": False, "error": "desde/hasta deben tener formato YYYY-MM-DD"}), 400
+
+        resultados = [
+            {"id": nombre, "label": nombre, "valueRaw": ingresos, "ventas": unidades}
+            for nombre, ingresos, unidades in top_productos(db, 5, desde, hasta)
         ]
         
-        resultados = list(db["ventas"].aggregate(pipeline))
-        
         if not resultados:
             return jsonify({"success": True, "data": []})
 
@@ -212,42 +265,21 @@ def get_top_productos():
         return jsonify({"success": False, "error": f"Error en top-productos: {str(e)}"}), 500
 
 # ===============================
-# NUEVA RUTA /api/reportes/ventas-por-area
-# (Esta ruta no necesita cambios)
+# GET /api/reportes/ventas-por-area
+# Totales acumulados por área; con ?desde=&hasta= usa los buckets diarios
 # ===============================
 @punto_venta.route("/reportes/ventas-por-area", methods=["GET"])
 def get_ventas_por_area():
     try:
-        pipeline = [
-            {
-                "$unwind": "$productos"
-            },
-            {
-                "$group": {
-                    "_id": "$productos.area_nombre", 
-                    "totalVentas": {"$sum": "$productos.subtotal"}
-                }
-            },
-            {
-                "$sort": {"totalVentas": -1}
-            },
-            {
-                "$limit": 5 # Top 5 áreas
-            },
-            {
-                "$project": {
-                    "_id": 0,
-                    "id": "$_id",
-                    "label": "$_id",
-                    "valueRaw": "$totalVentas"
-                }
-            }
-        ]
-        
-        resultados = list(db["ventas"].aggregate(pipeline))
+        try:
+            desde, hasta = _rango_fechas()
+        except ValueError:
+            return jsonify({"success": False, "error": "desde/hasta deben tener formato YYYY-MM-DD"}), 400
 
-        if not resultados:
-            return jsonify({"success": True, "data": []})
+        resultados = [
+            {"id": area, "label": area, "valueRaw": total}
+            for area, total in top_areas(db, 5, desde, hasta)
+        ]
 
         return jsonify({"success": True, "data": resultados})
 
@@ -255,6 +287,15 @@ def get_ventas_por_area():
         return jsonify({"success": False, "error": f"Error en ventas-por-area: {str(e)}"}), 500
 
 
+# POST /api/reportes/reconstruir
+@punto_venta.route("/reportes/reconstruir", methods=["POST"])
+def reconstruir_reportes_pos():
+    try:
+        return jsonify({"success": True, "data": reconstruir_reportes(db)})
+    except Exception as e:
+        return jsonify({"success": False, "error": f"Error al reconstruir reportes: {str(e)}"}), 500
+
+
 # GET /api/ventas/resumen-30-dias
 @punto_venta.route("/ventas/resumen-30-dias", methods=["GET"])
 def resumen_grafica_30_dias():
@@ -264,49 +305,28 @@ def resumen_grafica_30_dias():
         fecha_fin = hoy + timedelta(days=1)      # Mañana a las 00:00
         fecha_inicio = hoy - timedelta(days=30)  # Hace 30 días
 
-        # 2. Creamos el pipeline de agregación
-        pipeline = [
-            # Etapa 1: Filtrar solo las ventas de los últimos 30 días
-            {
-                "$match": {
-                    "created_at": {
-                        "$gte": fecha_inicio,
-                        "$lt": fecha_fin
-                    }
-                }
-            },
-            # Etapa 2: Agrupar por día y sumar el total
-            {
-                "$group": {
-                    "_id": { 
-                        "$dateToString": { "format": "%Y-%m-%d", "date": "$created_at" } 
-                    },
-                    "total": { "$sum": "$total" }
-                }
-            },
-            # Etapa 3: Ordenar por fecha (ascendente)
-            {
-                "$sort": { "_id": 1 }
-            },
-            # Etapa 4: Dar el formato final (renombrar _id a fecha)
-            {
-                "$project": {
-                    "_id": 0,             # Ocultar el _id original
-                    "fecha": "$_id",      # Asignar el valor de _id a "fecha"
-                    "total": 1            # Mostrar el total
-                }
-            }
+        # 2. Leemos los buckets diarios (≤ 31 documentos) en lugar de agrupar 'ventas'
+        resultados = [
+            {"fecha": d["_id"], "total": d.get("total", 0)}
+            for d in leer_dias(db, fecha_inicio, fecha_fin)
+            if d.get("transacciones", 0) > 0
         ]
 
-        # Ejecutamos la consulta
-        resultados = list(db["ventas"].aggregate(pipeline))
-
         # Retornamos la lista directa como pediste
         return jsonify(resultados)
 
     except Exception as e:
         print(f"Error: {e}")
         return jsonify({"error": "Error al procesar la gráfica"}), 500
+
+
+# POST /api/ventas/diarias/reconstruir
+@punto_venta.route("/ventas/diarias/reconstruir", methods=["POST"])
+def reconstruir_diarias():
+    try:
+        return jsonify({"success": True, "data": reconstruir_ventas_diarias(db)})
+    except Exception as e:
+        return jsonify({"success": False, "error": f"Error al reconstruir ventas_diarias: {str(e)}"}), 500
     
 # ===============================
 # GET /api/dashboard/resumen
@@ -318,47 +338,16 @@ def obtener_resumen_dashboard():
         hoy_inicio = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
         hoy_fin = hoy_inicio + timedelta(days=1)
 
-        # 2. Calcular Ventas, Transacciones y Ticket Promedio de HOY
-        pipeline_ventas = [
-            {
-                "$match": {
-                    "created_at": {
-                        "$gte": hoy_inicio,
-                        "$lt": hoy_fin
-                    }
-                }
-            },
-            {
-                "$group": {
-                    "_id": None,
-                    "totalVentas": {"$sum": "$total"},
-                    "numTransacciones": {"$sum": 1}
-                }
-            }
-        ]
-        
-        res_ventas = list(db["ventas"].aggregate(pipeline_ventas))
-        
-        if res_ventas:
-            ventas_hoy = res_ventas[0]["totalVentas"]
-            transacciones_hoy = res_ventas[0]["numTransacciones"]
-            ticket_promedio = ventas_hoy / transacciones_hoy if transacciones_hoy > 0 else 0
-        else:
-            ventas_hoy = 0
-            transacciones_hoy = 0
-            ticket_promedio = 0
-
-        # 3. Contar nuevos clientes de HOY
-        # (Asumiendo que tienes colección 'clientes' con campo created_at o createdAt)
-        nuevos_clientes = db["clientes"].count_documents({
-            "$or": [
-                {"created_at": {"$gte": hoy_inicio, "$lt": hoy_fin}},
-                {"createdAt": {"$gte": hoy_inicio, "$lt": hoy_fin}}
-            ]
-        })
+        # 2. Ventas, transacciones y nuevos clientes de HOY salen del bucket del día
+        dias = leer_dias(db, hoy_inicio, hoy_fin)
+        bucket = dias[0] if dias else {}
+        ventas_hoy = bucket.get("total", 0)
+        transacciones_hoy = bucket.get("transacciones", 0)
+        ticket_promedio = ventas_hoy / transacciones_hoy if transacciones_hoy > 0 else 0
+        nuevos_clientes = bucket.get("nuevos_clientes", 0)
 
-        # 4. Contar Total de Productos
-        total_productos = db["productos"].count_documents({})
+        # 3. Total de productos (sin filtro: basta el conteo de metadatos)
+        total_productos = db["productos"].estimated_document_count()
 
         return jsonify({
             "success": True,
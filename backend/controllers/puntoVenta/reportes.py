@@ -0,0 +1,162 @@
+"""
+Totales acumulados para los reportes top-N del punto de venta.
+
+Colecciones (se actualizan al registrar o anular una venta):
+ - reporte_productos:     _id = nombre       -> totalIngresos, totalUnidades, lineas
+ - reporte_areas:         _id = area_nombre  -> totalVentas, lineas
+ - reporte_productos_dia: _id = {d, p, a}    -> dia, nombre, area, ingresos, unidades, lineas
+   (un documento por día, producto y área; respalda los reportes con ?desde=&hasta=)
+
+Funciones:
+ - registrar_venta_reportes(db, venta, signo=1, session=None): suma (o resta con signo=-1) las
+   líneas de la venta
+ - reconstruir_reportes(db): recalcula todo desde 'ventas' (datos sembrados o cargados por fuera)
+ - asegurar_reportes(db): si nunca se construyeron, los reconstruye en segundo plano (main.py
+   la llama al arrancar); mientras tanto los top-N salen de lo que haya
+ - top_productos(db, n, desde=None, hasta=None) / top_areas(db, n, desde=None, hasta=None)
+
+Los totales se agrupan por las mismas claves que los $unwind originales (productos.nombre y
+productos.area_nombre), así que el resultado coincide con recorrer todas las líneas. 'lineas'
+cuenta las líneas vivas: una clave cuyas ventas se anularon todas (lineas = 0) no se reporta.
+"""
+import datetime
+import threading
+
+from pymongo import UpdateOne
+
+from .ventas_diarias import META, dia_clave, reconstruir_en_segundo_plano
+
+PRODUCTOS = "reporte_productos"
+AREAS = "reporte_areas"
+PRODUCTOS_DIA = "reporte_productos_dia"
+META_ID = "reportes_pos"
+
+_listo = threading.Event()
+
+
+def _indices(db):
+    db[PRODUCTOS].create_index([("totalIngresos", -1)])
+    db[AREAS].create_index([("totalVentas", -1)])
+    db[PRODUCTOS_DIA].create_index([("dia", 1)])
+
+
+def registrar_venta_reportes(db, venta, signo=1, session=None):
+    dia = dia_clave(venta.get("created_at") or datetime.datetime.utcnow())
+    por_producto, por_area, por_dia = {}, {}, {}
+    for linea in venta.get("productos") or []:
+        nombre = linea.get("nombre")
+        area = linea.get("area_nombre")
+        subtotal = float(linea.get("subtotal") or 0) * signo
+        cantidad = int(linea.get("cantidad") or 0) * signo
+        for acum in (por_producto.setdefault(nombre, [0.0, 0, 0]),
+                     por_area.setdefault(area, [0.0, 0, 0]),
+                     por_dia.setdefault((nombre, area), [0.0, 0, 0])):
+            acum[0] += subtotal
+            acum[1] += cantidad
+            acum[2] += signo
+    if not por_producto:
+        return
+
+    db[PRODUCTOS].bulk_write([
+        UpdateOne({"_id": nombre}, {"$inc": {"totalIngresos": v[0], "totalUnidades": v[1], "lineas": v[2]}}, upsert=True)
+        for nombre, v in por_producto.items()
+    ], ordered=False, session=session)
+    db[AREAS].bulk_write([
+        UpdateOne({"_id": area}, {"$inc": {"totalVentas": v[0], "lineas": v[2]}}, upsert=True)
+        for area, v in por_area.items()
+    ], ordered=False, session=session)
+    db[PRODUCTOS_DIA].bulk_write([
+        UpdateOne({"_id": {"d": dia, "p": nombre, "a": area}},
+                  {"$inc": {"ingresos": v[0], "unidades": v[1], "lineas": v[2]},
+                   "$setOnInsert": {"dia": dia, "nombre": nombre, "area": area}},
+                  upsert=True)
+        for (nombre, area), v in por_dia.items()
+    ], ordered=False, session=session)
+
+
+def reconstruir_reportes(db):
+    """
+    Recalcula las tres colecciones desde 'ventas' sin las anuladas (las reemplaza con $out).
+    Las ventas que entren mientras corre pueden perderse del total; lanzarla con el POS quieto.
+    """
+    inicio = datetime.datetime.utcnow()
+    lineas = [
+        {"$match": {"estado": {"$ne": "anulada"}}},
+        {"$unwind": "$productos"},
+    ]
+    db["ventas"].aggregate(lineas + [
+        {"$group": {"_id": "$productos.nombre",
+                    "totalIngresos": {"$sum": "$productos.subtotal"},
+                    "totalUnidades": {"$sum": "$productos.cantidad"},
+                    "lineas": {"$sum": 1}}},
+        {"$out": PRODUCTOS},
+    ], allowDiskUse=True)
+    db["ventas"].aggregate(lineas + [
+        {"$group": {"_id": "$productos.area_nombre", "totalVentas": {"$sum": "$productos.subtotal"},
+                    "lineas": {"$sum": 1}}},
+        {"$out": AREAS},
+    ], allowDiskUse=True)
+    db["ventas"].aggregate([
+        {"$match": {"estado": {"$ne": "anulada"}, "created_at": {"$type": "date"}}},
+        {"$unwind": "$productos"},
+        {"$group": {
+            "_id": {"d": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}},
+                    "p": "$productos.nombre", "a": "$productos.area_nombre"},
+            "ingresos": {"$sum": "$productos.subtotal"},
+            "unidades": {"$sum": "$productos.cantidad"},
+            "lineas": {"$sum": 1},
+        }},
+        {"$set": {"dia": "$_id.d", "nombre": "$_id.p", "area": "$_id.a"}},
+        {"$out": PRODUCTOS_DIA},
+    ], allowDiskUse=True)
+    _indices(db)
+    fin = datetime.datetime.utcnow()
+    db[META].update_one({"_id": META_ID}, {"$set": {"reconstruido_at": fin}}, upsert=True)
+    _listo.set()
+    return {"ok": True, "productos": db[PRODUCTOS].estimated_document_count(),
+            "areas": db[AREAS].estimated_document_count(),
+            "elapsed_s": round((fin - inicio).total_seconds(), 3)}
+
+
+def asegurar_reportes(db):
+    """Como asegurar_ventas_diarias: si nunca se construyeron, reconstrucción en segundo plano."""
+    if _listo.is_set():
+        return True
+    if reconstruir_en_segundo_plano(db, META_ID, _listo, reconstruir_reportes):
+        _indices(db)
+        return True
+    return False
+
+
+def _top_ventana(db, campo, n, desde, hasta, con_unidades):
+    grupo = {"_id": f"${campo}", "ingresos": {"$sum": "$ingresos"}, "lineas": {"$sum": "$lineas"}}
+    if con_unidades:
+        grupo["unidades"] = {"$sum": "$unidades"}
+    return list(db[PRODUCTOS_DIA].aggregate([
+        {"$match": {"dia": {"$gte": dia_clave(desde) if desde else "0000-00-00",
+                            "$lte": dia_clave(hasta) if hasta else "9999-12-31"}}},
+        {"$group": grupo},
+        {"$match": {"lineas": {"$gt": 0}}},
+        {"$sort": {"ingresos": -1}},
+        {"$limit": int(n)},
+    ]))
+
+
+def top_productos(db, n=5, desde=None, hasta=None):
+    """[(nombre, ingresos, unidades)] ordenado por ingresos; con desde/hasta usa los buckets diarios."""
+    asegurar_reportes(db)
+    if desde or hasta:
+        filas = _top_ventana(db, "nombre", n, desde, hasta, True)
+        return [(f["_id"], f["ingresos"], f["unidades"]) for f in filas]
+    return [(f["_id"], f.get("totalIngresos", 0), f.get("totalUnidades", 0))
+            for f in db[PRODUCTOS].find({"lineas": {"$gt": 0}}).sort("totalIngresos", -1).limit(int(n))]
+
+
+def top_areas(db, n=5, desde=None, hasta=None):
+    """[(area_nombre, ventas)] ordenado por ventas; con desde/hasta usa los buckets diarios."""
+    asegurar_reportes(db)
+    if desde or hasta:
+        filas = _top_ventana(db, "area", n, desde, hasta, False)
+        return [(f["_id"], f["ingresos"]) for f in filas]
+    return [(f["_id"], f.get("totalVentas", 0))
+            for f in db[AREAS].find({"lineas": {"$gt": 0}}).sort("totalVentas", -1).limit(int(n))]
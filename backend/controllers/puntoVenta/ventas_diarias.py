@@ -0,0 +1,140 @@
+"""
+Buckets diarios de ventas para las gráficas y el resumen del dashboard.
+
+Colección 'ventas_diarias', un documento por día (UTC):
+    {_id: "YYYY-MM-DD", total, transacciones, nuevos_clientes}
+
+ - registrar_venta_dia(db, created_at, total, session=None, signo=1): $inc al insertar (o anular)
+   una venta
+ - registrar_cliente_nuevo(db, created_at): $inc al crear un cliente
+ - reconstruir_ventas_diarias(db): recalcula todos los buckets desde 'ventas' y 'clientes'
+   (datos sembrados o cargados por fuera de la API)
+ - asegurar_ventas_diarias(db): si los buckets nunca se construyeron lanza la reconstrucción en
+   segundo plano y vuelve enseguida (main.py la llama al arrancar)
+ - leer_dias(db, desde, hasta): buckets en [desde, hasta) ordenados por día, tal como estén
+ - reconstruir_en_segundo_plano(db, meta_id, listo, reconstruir): reconstrucción inicial en un
+   hilo, una sola vez entre todos los workers (lease en analisis_meta); la usa también reportes
+
+El _id es la misma clave que $dateToString "%Y-%m-%d" sobre created_at, así que un rango de días
+es un scan del índice de _id de como mucho 31 documentos.
+"""
+import datetime
+import logging
+import threading
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+COLECCION = "ventas_diarias"
+META = "analisis_meta"
+META_ID = "ventas_diarias"
+LEASE_S = 900   # si el worker que reconstruye muere, otro puede retomarla pasado este tiempo
+
+_construido = threading.Event()
+
+
+def dia_clave(fecha: datetime.datetime) -> str:
+    return fecha.strftime("%Y-%m-%d")
+
+
+def registrar_venta_dia(db, created_at, total, session=None, signo=1):
+    """signo=-1 descuenta la venta (anulación)."""
+    db[COLECCION].update_one(
+        {"_id": dia_clave(created_at)},
+        {"$inc": {"total": float(total) * signo, "transacciones": signo}},
+        upsert=True,
+        session=session,
+    )
+
+
+def registrar_cliente_nuevo(db, created_at):
+    db[COLECCION].update_one(
+        {"_id": dia_clave(created_at)},
+        {"$inc": {"nuevos_clientes": 1}},
+        upsert=True,
+    )
+
+
+def _dia_expr(campo):
+    return {"$dateToString": {"format": "%Y-%m-%d", "date": campo}}
+
+
+def _merge():
+    return {"$merge": {"into": COLECCION, "on": "_id", "whenMatched": "merge", "whenNotMatched": "insert"}}
+
+
+def reconstruir_ventas_diarias(db):
+    """
+    Recalcula total/transacciones desde 'ventas' (sin las anuladas) y nuevos_clientes desde
+    'clientes' ($merge sobrescribe esos campos por día). Las ventas que entren durante la reconstrucción pueden
+    contarse dos veces en su día; conviene lanzarla con el POS quieto.
+    """
+    inicio = datetime.datetime.utcnow()
+    db["ventas"].aggregate([
+        {"$match": {"created_at": {"$type": "date"}, "estado": {"$ne": "anulada"}}},
+        {"$group": {"_id": _dia_expr("$created_at"), "total": {"$sum": "$total"}, "transacciones": {"$sum": 1}}},
+        _merge(),
+    ], allowDiskUse=True)
+    db["clientes"].aggregate([
+        {"$project": {"d": {"$ifNull": ["$created_at", "$createdAt"]}}},
+        {"$match": {"d": {"$type": "date"}}},
+        {"$group": {"_id": _dia_expr("$d"), "nuevos_clientes": {"$sum": 1}}},
+        _merge(),
+    ], allowDiskUse=True)
+    fin = datetime.datetime.utcnow()
+    db[META].update_one({"_id": META_ID}, {"$set": {"reconstruido_at": fin}}, upsert=True)
+    _construido.set()
+    return {"ok": True, "dias": db[COLECCION].estimated_document_count(),
+            "elapsed_s": round((fin - inicio).total_seconds(), 3)}
+
+
+def _tomar_reconstruccion(db, meta_id):
+    """True si este proceso se queda con la reconstrucción (nadie la hizo ni la tiene en curso)."""
+    ahora = datetime.datetime.utcnow()
+    try:
+        db[META].update_one(
+            {"_id": meta_id, "reconstruido_at": {"$exists": False},
+             "$or": [{"reconstruyendo_hasta": {"$exists": False}}, {"reconstruyendo_hasta": {"$lt": ahora}}]},
+            {"$set": {"reconstruyendo_hasta": ahora + datetime.timedelta(seconds=LEASE_S)}},
+            upsert=True,
+        )
+        return True
+    except DuplicateKeyError:
+        # el documento existe: ya reconstruido o con el lease tomado por otro worker
+        return False
+
+
+def reconstruir_en_segundo_plano(db, meta_id, listo, reconstruir):
+    """
+    Devuelve True si ya está construido. Si no, lanza 'reconstruir(db)' en un hilo (solo si
+    ningún otro worker la está haciendo) y devuelve False sin esperar.
+    """
+    if listo.is_set():
+        return True
+    meta = db[META].find_one({"_id": meta_id}, {"reconstruido_at": 1})
+    if meta and meta.get("reconstruido_at"):
+        listo.set()
+        return True
+    if not _tomar_reconstruccion(db, meta_id):
+        return False
+
+    def _run():
+        try:
+            reconstruir(db)
+        except Exception as e:
+            logger.exception("Error en la reconstrucción inicial de %s: %s", meta_id, e)
+        finally:
+            db[META].update_one({"_id": meta_id}, {"$unset": {"reconstruyendo_hasta": ""}})
+
+    threading.Thread(target=_run, daemon=True, name=f"reconstruir_{meta_id}").start()
+    return False
+
+
+def asegurar_ventas_diarias(db):
+    return reconstruir_en_segundo_plano(db, META_ID, _construido, reconstruir_ventas_diarias)
+
+
+def leer_dias(db, desde: datetime.datetime, hasta: datetime.datetime):
+    asegurar_ventas_diarias(db)
+    return list(db[COLECCION].find({"_id": {"$gte": dia_clave(desde), "$lt": dia_clave(hasta)}}).sort("_id", 1))
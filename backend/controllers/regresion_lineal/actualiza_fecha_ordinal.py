@@ -2,24 +2,39 @@
 """
 Script/módulo para poblar campo `fecha_ordinal` en colecciones que tengan `fecha`.
 Funciones:
- - run_migration(get_db_fn, collections_filter=None, batch_size=1000, create_index=False, dry_run=False)
+ - run_migration(get_db_fn, collections_filter=None, batch_size=1000, create_index=False, dry_run=False,
+                 use_server_pipeline=True, resume=True)
+ - reset_checkpoints(get_db_fn, collections_filter=None)
  - ejecución directa cuando se llama como __main__ (usa db.conexion.get_db)
 
 Notas:
  - Está diseñado para correr en background desde main.py o manualmente en CLI.
  - Maneja distintos formatos de fecha (datetime, epoch numérico, ISO string). Usa dateutil si está disponible.
+ - Escribe por lotes (bulk_write de UpdateOne) y, cuando el formato lo permite, convierte en el servidor
+   con un update por pipeline ($dateFromString/$toLong).
+ - Guarda un checkpoint por colección (último _id procesado) para retomar sin reescanear.
 """
-from datetime import datetime
+from datetime import datetime, timezone
 import time
 import traceback
+from pymongo import UpdateOne
 
 try:
     from dateutil import parser as _dateutil_parser
 except Exception:
     _dateutil_parser = None
 
+def _epoch_utc(dt):
+    """Epoch de dt; un datetime sin zona (los que devuelve pymongo, o ISO sin offset) es UTC."""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
 def _parse_to_epoch(value):
-    """Intento robusto de convertir value a epoch (segundos). Devuelve int o None."""
+    """
+    Intento robusto de convertir value a epoch (segundos). Devuelve int o None.
+    Fechas y strings sin zona se toman como UTC, igual que $dateFromString en el servidor.
+    """
     if value is None:
         return None
     # ya es numérico (epoch en segundos o ms)
@@ -35,7 +50,7 @@ def _parse_to_epoch(value):
     # datetime
     if isinstance(value, datetime):
         try:
-            return int(value.timestamp())
+            return _epoch_utc(value)
         except Exception:
             return None
     # string: intentar ISO / parse leniente
@@ -43,18 +58,17 @@ def _parse_to_epoch(value):
         s = value.strip()
         if not s:
             return None
-        # quitar Z final para fromisoformat
-        s2 = s[:-1] if s.endswith('Z') else s
+        # Z final -> +00:00 (fromisoformat no acepta el sufijo Z antes de py3.11)
+        s2 = s[:-1] + "+00:00" if s.endswith('Z') else s
         try:
-            # fromisoformat maneja offsets en py>=3.7 salvo sufijo Z
             dt = datetime.fromisoformat(s2)
-            return int(dt.timestamp())
+            return _epoch_utc(dt)
         except Exception:
             # fallback dateutil si disponible
             if _dateutil_parser:
                 try:
                     dt = _dateutil_parser.isoparse(s)
-                    return int(dt.timestamp())
+                    return _epoch_utc(dt)
                 except Exception:
                     pass
             # intento heurístico: parsear como int
@@ -67,17 +81,84 @@ def _parse_to_epoch(value):
                 return None
     return None
 
-def run_migration(get_db_fn, collections_filter=None, batch_size=1000, create_index=False, dry_run=False, logger=None):
+# Colección donde se guardan los checkpoints por colección migrada
+CHECKPOINT_COLLECTION = "migraciones"
+CHECKPOINT_PREFIX = "fecha_ordinal:"
+
+# Strings ISO con zona horaria explícita (Z o ±HH:MM): se convierten con $dateFromString en el
+# servidor. Ambos caminos dan el mismo epoch: el servidor toma las fechas BSON y los strings sin
+# zona como UTC, y _parse_to_epoch hace lo mismo (no depende de la TZ del host).
+# Los strings sin zona (naive) se convierten en el cliente (formatos que $dateFromString no lee).
+_ISO_CON_ZONA_REGEX = r"(Z|[+-]\d{2}:?\d{2})$"
+
+# Pipeline de actualización server-side: fecha (date o string ISO con zona) -> epoch en segundos.
+# Si $dateFromString falla, el campo no se escribe ($$REMOVE) y el documento queda para el pase en cliente.
+_PIPELINE_FECHA_ORDINAL = [
+    {"$set": {
+        "fecha_ordinal": {
+            "$let": {
+                "vars": {
+                    "d": {
+                        "$switch": {
+                            "branches": [
+                                {"case": {"$eq": [{"$type": "$fecha"}, "date"]}, "then": "$fecha"},
+                                {"case": {"$eq": [{"$type": "$fecha"}, "string"]},
+                                 "then": {"$dateFromString": {"dateString": "$fecha", "onError": None, "onNull": None}}},
+                            ],
+                            "default": None,
+                        }
+                    }
+                },
+                "in": {
+                    "$cond": [
+                        {"$eq": ["$$d", None]},
+                        "$$REMOVE",
+                        {"$toLong": {"$trunc": {"$divide": [{"$toLong": "$$d"}, 1000]}}},
+                    ]
+                },
+            }
+        }
+    }}
+]
+
+def _load_checkpoint(db, coll):
+    doc = db[CHECKPOINT_COLLECTION].find_one({"_id": CHECKPOINT_PREFIX + coll})
+    return doc.get("last_id") if doc else None
+
+def _save_checkpoint(db, coll, last_id, **extra):
+    db[CHECKPOINT_COLLECTION].update_one(
+        {"_id": CHECKPOINT_PREFIX + coll},
+        {"$set": {"last_id": last_id, "updated_at": datetime.utcnow(), **extra}},
+        upsert=True,
+    )
+
+def reset_checkpoints(get_db_fn, collections_filter=None):
+    """Borra los checkpoints guardados para forzar un reescaneo completo."""
+    db = get_db_fn()
+    if db is None:
+        return 0
+    if collections_filter:
+        ids = [CHECKPOINT_PREFIX + c for c in collections_filter]
+        res = db[CHECKPOINT_COLLECTION].delete_many({"_id": {"$in": ids}})
+    else:
+        res = db[CHECKPOINT_COLLECTION].delete_many({"_id": {"$regex": "^" + CHECKPOINT_PREFIX}})
+    return res.deleted_count
+
+def run_migration(get_db_fn, collections_filter=None, batch_size=1000, create_index=False, dry_run=False, logger=None,
+                  use_server_pipeline=True, resume=True):
     """
     Ejecuta la migración que añade fecha_ordinal donde exista 'fecha' y no exista 'fecha_ordinal'.
     Parámetros:
       - get_db_fn: callable que devuelve la conexión a la DB (ej: app.config['GET_DB'] o db.conexion.get_db)
       - collections_filter: iterable de nombres de colecciones a procesar (None = todas)
-      - batch_size: tamaño de batch para cursores y reporting
+      - batch_size: tamaño de batch para cursores y para cada bulk_write
       - create_index: si True, crea index {fecha_ordinal:1} en cada colección procesada al final
       - dry_run: si True, no escribe en la DB; solo cuenta y reporta
       - logger: objeto con .info/.warning/.error; si None usa print
-    Retorna un dict resumen.
+      - use_server_pipeline: si True, convierte en el servidor (update_many con pipeline) las fechas
+        tipo date y los strings ISO con zona horaria; el resto se convierte en el cliente
+      - resume: si True, retoma desde el checkpoint (_id) guardado en la colección 'migraciones'
+    Retorna un dict resumen (incluye docs/segundo por colección y total).
     """
     log = logger or None
     def _info(*args):
@@ -107,54 +188,109 @@ def run_migration(get_db_fn, collections_filter=None, batch_size=1000, create_in
         _err("DB getter devolvió None")
         return {"ok": False, "error": "DB no disponible"}
 
-    coll_names = list(db.list_collection_names())
+    coll_names = [c for c in db.list_collection_names()
+                  if c != CHECKPOINT_COLLECTION and not c.startswith("system.")]
     if collections_filter:
         coll_names = [c for c in coll_names if c in collections_filter]
 
     summary = {"ok": True, "total_updated": 0, "details": {}}
+    started_all = time.time()
+    total_processed = 0
 
     for coll in coll_names:
         try:
-            query = {"fecha": {"$exists": True}, "fecha_ordinal": {"$exists": False}}
-            count_candidates = db[coll].count_documents(query)
-            if count_candidates == 0:
-                _info(f"{coll}: no hay documentos pendientes ({count_candidates})")
+            started = time.time()
+            col = db[coll]
+
+            # Límite superior fijo: lo insertado durante la migración queda para la próxima ejecución
+            last_doc = col.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+            if last_doc is None:
+                continue
+            high_id = last_doc["_id"]
+            checkpoint = _load_checkpoint(db, coll) if resume else None
+            if checkpoint is not None and checkpoint >= high_id:
+                _info(f"{coll}: sin documentos nuevos desde el checkpoint")
                 continue
 
-            _info(f"{coll}: candidatos a actualizar = {count_candidates}")
+            id_range = {"$lte": high_id}
+            if checkpoint is not None:
+                id_range["$gt"] = checkpoint
+            query = {"_id": id_range, "fecha": {"$exists": True}, "fecha_ordinal": {"$exists": False}}
+
             updated = 0
             processed = 0
+            server_updated = 0
+
+            # 1) Pase server-side: sin round-trips por documento
+            if use_server_pipeline and not dry_run:
+                server_query = {**query, "$or": [
+                    {"fecha": {"$type": "date"}},
+                    {"fecha": {"$type": "string", "$regex": _ISO_CON_ZONA_REGEX}},
+                ]}
+                try:
+                    res = col.update_many(server_query, _PIPELINE_FECHA_ORDINAL)
+                    server_updated = res.modified_count
+                    updated += server_updated
+                    processed += server_updated
+                    _info(f"{coll}: actualizados en servidor = {server_updated}")
+                except Exception as e:
+                    # servidores < 4.2 no aceptan pipelines en update; seguimos con el pase en cliente
+                    _warn(f"{coll}: update con pipeline no disponible, se usa bulk_write: {e}")
+
+            # 2) Pase en cliente con bulk_write por lotes y checkpoint por _id
+            ops = []
+            batch_last_id = None
+
+            def _flush():
+                nonlocal updated, ops
+                if ops and not dry_run:
+                    res = col.bulk_write(ops, ordered=False)
+                    updated += res.modified_count
+                if batch_last_id is not None and not dry_run:
+                    _save_checkpoint(db, coll, batch_last_id)
+                ops = []
 
-            cursor = db[coll].find(query, {"fecha": 1}).batch_size(batch_size)
+            cursor = col.find(query, {"fecha": 1}).sort("_id", 1).batch_size(batch_size)
             for doc in cursor:
                 processed += 1
+                batch_last_id = doc["_id"]
                 try:
                     epoch = _parse_to_epoch(doc.get("fecha"))
                     if epoch is None:
-                        # no se puede parsear, lo registramos y saltamos
+                        # no se puede parsear, lo registramos y saltamos (el checkpoint evita reintentarlo)
                         _warn(f"{coll}: no parseable fecha en _id={doc.get('_id')}, valor={doc.get('fecha')}")
-                        continue
-                    if dry_run:
+                    elif dry_run:
                         updated += 1
                     else:
-                        res = db[coll].update_one({"_id": doc["_id"]}, {"$set": {"fecha_ordinal": int(epoch)}})
-                        if res.modified_count:
-                            updated += 1
+                        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"fecha_ordinal": int(epoch)}}))
                 except Exception:
                     _err(f"{coll}: error procesando doc _id={doc.get('_id')}\n{traceback.format_exc()}")
-                    continue
 
-                # logging periódico para procesos largos
                 if processed % batch_size == 0:
+                    _flush()
+                    # logging periódico para procesos largos
                     _info(f"{coll}: procesados {processed}, actualizados {updated}")
+            _flush()
 
-            _info(f"{coll}: finalizados processed={processed}, updated={updated}")
-            summary["details"][coll] = {"processed": processed, "updated": updated}
+            if not dry_run:
+                _save_checkpoint(db, coll, high_id, finished_at=datetime.utcnow())
+
+            elapsed = time.time() - started
+            rate = (processed / elapsed) if elapsed > 0 else 0.0
+            total_processed += processed
+            _info(f"{coll}: finalizados processed={processed}, updated={updated}, {rate:.0f} docs/s")
+            summary["details"][coll] = {
+                "processed": processed,
+                "updated": updated,
+                "server_updated": server_updated,
+                "elapsed_s": round(elapsed, 3),
+                "docs_per_sec": round(rate, 1),
+            }
             summary["total_updated"] += updated
 
             if create_index and not dry_run and updated > 0:
                 try:
-                    db[coll].create_index([("fecha_ordinal", 1)])
+                    col.create_index([("fecha_ordinal", 1)])
                     _info(f"{coll}: índice fecha_ordinal creado")
                 except Exception as e:
                     _warn(f"{coll}: no se pudo crear índice fecha_ordinal: {e}")
@@ -163,6 +299,9 @@ def run_migration(get_db_fn, collections_filter=None, batch_size=1000, create_in
             _err(f"{coll}: error general en migración:\n{traceback.format_exc()}")
             summary["details"][coll] = {"error": "exception", "trace": traceback.format_exc()}
 
+    elapsed_all = time.time() - started_all
+    summary["elapsed_s"] = round(elapsed_all, 3)
+    summary["docs_per_sec"] = round(total_processed / elapsed_all, 1) if elapsed_all > 0 else 0.0
     return summary
 
 # Permitir ejecución directa desde CLI (usa db.conexion.get_db)
@@ -179,11 +318,17 @@ if __name__ == "__main__":
     parser.add_argument("--batch", "-b", type=int, default=1000, help="Tamaño de batch para cursor")
     parser.add_argument("--index", action="store_true", help="Crear índice {fecha_ordinal:1} al final en colecciones procesadas")
     parser.add_argument("--dry-run", action="store_true", help="No escribir en la DB, solo contar y reportar")
+    parser.add_argument("--no-server", action="store_true", help="No usar el update por pipeline en el servidor")
+    parser.add_argument("--reset", action="store_true", help="Borrar checkpoints y reescanear desde el inicio")
     args = parser.parse_args()
 
+    if args.reset:
+        print("Checkpoints borrados:", reset_checkpoints(get_db, collections_filter=args.collections))
+
     print("Iniciando migración fecha_ordinal (CLI)...")
     start = time.time()
-    res = run_migration(get_db, collections_filter=args.collections, batch_size=args.batch, create_index=args.index, dry_run=args.dry_run, logger=None)
+    res = run_migration(get_db, collections_filter=args.collections, batch_size=args.batch, create_index=args.index, dry_run=args.dry_run, logger=None,
+                        use_server_pipeline=not args.no_server)
     elapsed = time.time() - start
     print("Resultado:", res)
     print(f"Tiempo transcurrido: {elapsed:.2f}s")
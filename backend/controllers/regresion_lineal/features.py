@@ -0,0 +1,91 @@
+# controllers/regresion_lineal/features.py
+"""
+Extracción de features para regresión compilada a un pipeline de agregación de MongoDB.
+Funciones:
+ - expr_feature(f) -> expresión de agregación para la feature 'f'
+ - pipeline_features(features, target, limit=None, match=None) -> pipeline
+
+Cada documento sale como {"v": [f0, f1, ..., y]} (solo números, o null si el valor no es
+convertible), así que el cliente recibe un lote plano y no recorre 'productos' en Python.
+Semántica igual a la extracción anterior en Python:
+ - items_count: cantidad de elementos en productos
+ - sum_precio: suma de precio * cantidad (cantidad por defecto 1; items no numéricos suman 0)
+ - avg_precio: sum_precio / items_count (0 si no hay productos)
+ - productos.FIELD: suma de FIELD en los productos (se ignoran nulos / no numéricos)
+ - campo simple: valor numérico; ausente o null -> 0; no convertible -> fila omitida
+ - target: ausente -> 0; null o no convertible -> fila omitida
+"""
+from typing import Any, Dict, List, Optional
+
+_PRODUCTOS = {"$ifNull": ["$productos", []]}
+
+
+def _num(expr, to="double", on_null=None):
+    return {"$convert": {"input": expr, "to": to, "onError": None, "onNull": on_null}}
+
+
+def _sum_precio():
+    termino = {
+        "$let": {
+            "vars": {
+                "p": _num("$$this.precio", on_null=0),
+                "c": _num("$$this.cantidad", to="long", on_null=1),
+            },
+            "in": {"$cond": [
+                {"$or": [{"$eq": ["$$p", None]}, {"$eq": ["$$c", None]}]},
+                0,
+                {"$multiply": ["$$p", "$$c"]},
+            ]},
+        }
+    }
+    return {"$reduce": {
+        "input": _PRODUCTOS,
+        "initialValue": 0.0,
+        "in": {"$add": ["$$value", termino]},
+    }}
+
+
+def expr_feature(f: str) -> Dict[str, Any]:
+    """Expresión de agregación que calcula la feature 'f' para un documento."""
+    if f == "items_count":
+        return {"$size": _PRODUCTOS}
+    if f == "sum_precio":
+        return _sum_precio()
+    if f == "avg_precio":
+        return {"$let": {
+            "vars": {"n": {"$size": _PRODUCTOS}},
+            "in": {"$cond": [{"$eq": ["$$n", 0]}, 0.0, {"$divide": [_sum_precio(), "$$n"]}]},
+        }}
+    if f.startswith("productos."):
+        fld = f.split(".", 1)[1]
+        return {"$reduce": {
+            "input": _PRODUCTOS,
+            "initialValue": 0.0,
+            "in": {"$add": ["$$value", {"$ifNull": [_num(f"$$this.{fld}"), 0]}]},
+        }}
+    return _num(f"${f}", on_null=0.0)
+
+
+def expr_target(target: str) -> Dict[str, Any]:
+    campo = f"${target}"
+    return {"$cond": [{"$eq": [{"$type": campo}, "missing"]}, 0.0, _num(campo)]}
+
+
+def pipeline_features(features: List[str], target: str, limit: Optional[int] = None,
+                      match: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Pipeline que devuelve {"v": [features..., target]} por documento."""
+    pipeline: List[Dict[str, Any]] = []
+    if match:
+        pipeline.append({"$match": match})
+    if limit:
+        pipeline.append({"$limit": int(limit)})
+    pipeline.append({"$project": {"_id": 0, "v": [expr_feature(f) for f in features] + [expr_target(target)]}})
+    return pipeline
+
+
+def fila_desde_v(doc):
+    """Convierte {"v": [...]} en (x, y) para extraer_columnas; None si algún valor es null."""
+    v = doc.get("v")
+    if not v or any(val is None for val in v):
+        return None
+    return v[:-1], v[-1]
@@ -0,0 +1,186 @@
+# controllers/regresion_lineal/modelos.py
+"""
+Caché de modelos de regresión ajustados.
+Funciones:
+ - spec_modelo(tipo, collection, features, target, filtro, alcance) -> dict que identifica el ajuste
+ - version_coleccion(col) -> marca de versión de los datos de origen
+ - buscar(db, spec, version) -> modelo o None (memoria y luego MongoDB)
+ - guardar(db, spec, version, modelo) -> modelo_id
+ - obtener(db, modelo_id) / ultimo(db, spec) -> modelo guardado o None
+ - predecir(modelo, X) -> array de predicciones
+
+Dos niveles: un LRU en memoria del proceso con TTL (REGRESION_CACHE_MAX, REGRESION_CACHE_TTL) y
+la colección 'regresion_modelos' en MongoDB (índice TTL sobre expires_at), compartida entre
+workers. La clave es un hash de (spec, versión); la versión es el último _id de la colección y
+su conteo estimado, así que insertar o borrar documentos invalida el modelo. Las ediciones en
+sitio no cambian la versión: las cubre el TTL.
+"""
+import datetime
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from bson import json_util
+
+COLECCION_MODELOS = "regresion_modelos"
+
+try:
+    CACHE_MAX = max(1, int(os.environ.get("REGRESION_CACHE_MAX", "128")))
+except ValueError:
+    CACHE_MAX = 128
+try:
+    CACHE_TTL = int(os.environ.get("REGRESION_CACHE_TTL", "3600"))
+except ValueError:
+    CACHE_TTL = 3600
+
+_lock = threading.Lock()
+_lru: "OrderedDict[str, tuple]" = OrderedDict()   # modelo_id -> (expires_at, modelo)
+_indices_listos = False
+
+
+def _json_estable(obj) -> str:
+    return json_util.dumps(obj, sort_keys=True)
+
+
+def spec_modelo(tipo: str, collection: str, features: List[str], target: str,
+                filtro: Optional[Dict[str, Any]] = None, alcance: Any = None) -> Dict[str, Any]:
+    """alcance: limit usado en el ajuste, o "todo" en modo stream."""
+    return {
+        "tipo": tipo,
+        "collection": collection,
+        "features": list(features),
+        "target": target,
+        "filtro": _json_estable(filtro or {}),
+        "alcance": alcance,
+    }
+
+
+def _hash(*partes) -> str:
+    return hashlib.sha1("|".join(partes).encode("utf-8")).hexdigest()
+
+
+def _spec_id(spec) -> str:
+    return _hash(_json_estable(spec))
+
+
+def _modelo_id(spec, version) -> str:
+    return _hash(_json_estable(spec), str(version))
+
+
+def version_coleccion(col) -> str:
+    """Último _id y conteo estimado: cambia al insertar o borrar documentos."""
+    ultimo = col.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+    if not ultimo:
+        return "vacio"
+    return f"{ultimo['_id']}:{col.estimated_document_count()}"
+
+
+def _asegurar_indices(db):
+    global _indices_listos
+    if _indices_listos:
+        return
+    try:
+        col = db[COLECCION_MODELOS]
+        col.create_index([("expires_at", 1)], expireAfterSeconds=0)
+        col.create_index([("spec_id", 1), ("created_at", -1)])
+        _indices_listos = True
+    except Exception as e:
+        print(f"⚠️ No se pudieron crear índices de {COLECCION_MODELOS}: {e}")
+
+
+def _lru_get(modelo_id):
+    with _lock:
+        item = _lru.get(modelo_id)
+        if item is None:
+            return None
+        if item[0] <= time.time():
+            _lru.pop(modelo_id, None)
+            return None
+        _lru.move_to_end(modelo_id)
+        return item[1]
+
+
+def _lru_put(modelo_id, modelo, expires_at=None):
+    with _lock:
+        _lru[modelo_id] = (expires_at or time.time() + CACHE_TTL, modelo)
+        _lru.move_to_end(modelo_id)
+        while len(_lru) > CACHE_MAX:
+            _lru.popitem(last=False)
+
+
+def _desde_doc(doc):
+    """Documento de 'regresion_modelos' -> modelo (y lo sube al LRU)."""
+    if not doc:
+        return None
+    expires = doc.get("expires_at")
+    if isinstance(expires, datetime.datetime):
+        restante = (expires - datetime.datetime.utcnow()).total_seconds()
+        if restante <= 0:
+            return None
+        _lru_put(doc["_id"], doc["modelo"], time.time() + restante)
+    else:
+        _lru_put(doc["_id"], doc["modelo"])
+    return doc["modelo"]
+
+
+def obtener(db, modelo_id: str) -> Optional[Dict[str, Any]]:
+    modelo = _lru_get(modelo_id)
+    if modelo is not None:
+        return modelo
+    if db is None:
+        return None
+    return _desde_doc(db[COLECCION_MODELOS].find_one({"_id": modelo_id}))
+
+
+def buscar(db, spec, version) -> Optional[Dict[str, Any]]:
+    return obtener(db, _modelo_id(spec, version))
+
+
+def ultimo(db, spec) -> Optional[Dict[str, Any]]:
+    """Modelo más reciente para la spec, sin mirar la colección de origen."""
+    doc = db[COLECCION_MODELOS].find_one(
+        {"spec_id": _spec_id(spec), "expires_at": {"$gt": datetime.datetime.utcnow()}},
+        sort=[("created_at", -1)],
+    )
+    return _desde_doc(doc)
+
+
+def guardar(db, spec, version, modelo: Dict[str, Any]) -> str:
+    """Guarda el modelo en el LRU y en MongoDB (si falla MongoDB queda solo en memoria)."""
+    modelo_id = _modelo_id(spec, version)
+    modelo = {**modelo, "modelo_id": modelo_id, "version": version,
+              "created_at": datetime.datetime.utcnow().isoformat()}
+    _lru_put(modelo_id, modelo)
+    try:
+        _asegurar_indices(db)
+        ahora = datetime.datetime.utcnow()
+        db[COLECCION_MODELOS].replace_one(
+            {"_id": modelo_id},
+            {"_id": modelo_id, "spec_id": _spec_id(spec), "spec": spec, "version": version,
+             "modelo": modelo, "created_at": ahora,
+             "expires_at": ahora + datetime.timedelta(seconds=CACHE_TTL)},
+            upsert=True,
+        )
+    except Exception as e:
+        print(f"⚠️ No se pudo persistir el modelo {modelo_id}: {e}")
+    return modelo_id
+
+
+def predecir(modelo: Dict[str, Any], X) -> np.ndarray:
+    """intercept + X·coef para una matriz (n x len(features))."""
+    X = np.asarray(X, dtype=np.float64)
+    if X.ndim == 1:
+        X = X.reshape(-1, 1)
+    coef = np.asarray(modelo["coef_vector"], dtype=np.float64)
+    if X.shape[1] != coef.size:
+        raise ValueError(f"Se esperaban {coef.size} columnas, llegaron {X.shape[1]}")
+    return modelo["intercept"] + X @ coef
+
+
+def limpiar_memoria():
+    with _lock:
+        _lru.clear()
@@ -0,0 +1,262 @@
+# controllers/regresion_lineal/motor.py
+"""
+Motor de regresión lineal (NumPy) compartido por /regresion/simple y /regresion/multiple.
+Funciones:
+ - extraer_columnas(cursor, n_max, n_features, fila) -> (X, y, omitidos)
+ - ajustar(X, y) -> dict con intercept, coef, r2, r2_ajustado, errores estándar y residuos
+ - indices_muestra(n, max_points) -> índices para submuestrear los puntos de la respuesta
+ - EstadisticasSuficientes: acumula n, medias y co-momentos por chunks (y se combina entre particiones)
+ - ajustar_desde_estadisticas(stats) -> mismo dict que ajustar, sin y_pred ni residuos por punto
+
+El ajuste centra las columnas y resuelve por SVD (equivalente a lstsq): evita formar XᵀX,
+tolera columnas constantes o colineales (coeficiente 0 en esa dirección) y es estable con
+valores grandes como epoch en segundos.
+"""
+from typing import Any, Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def extraer_columnas(cursor: Iterable[Dict[str, Any]], n_max: int, n_features: int,
+                     fila: Callable[[Dict[str, Any]], Optional[Tuple[Sequence[float], float]]]) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    Llena arrays preasignados (n_max x n_features y n_max) directamente desde el cursor.
+    'fila(doc)' devuelve (valores_x, y) o None para omitir el documento.
+    Devuelve (X, y, omitidos) recortados a las filas válidas.
+    """
+    X = np.empty((n_max, n_features), dtype=np.float64)
+    y = np.empty(n_max, dtype=np.float64)
+    i = 0
+    omitidos = 0
+    if n_max <= 0:
+        return X, y, 0
+    for doc in cursor:
+        r = fila(doc)
+        if r is None:
+            omitidos += 1
+            continue
+        X[i, :] = r[0]
+        y[i] = r[1]
+        i += 1
+        # cortar justo al llenar, sin consumir más documentos (el cursor puede seguir leyéndose)
+        if i >= n_max:
+            break
+    return X[:i], y[:i], omitidos
+
+
+def ajustar(X: np.ndarray, y: np.ndarray) -> Dict[str, Any]:
+    """
+    Ajusta y = intercept + X·coef por mínimos cuadrados.
+    Devuelve intercept, coef (array), r2, r2_ajustado, errores estándar (intercept y coef),
+    resumen de residuos, rango efectivo e y_pred (array).
+    """
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if X.ndim == 1:
+        X = X.reshape(-1, 1)
+    n, k = X.shape
+
+    mx = X.mean(axis=0)
+    my = y.mean()
+    Xc = X - mx
+    yc = y - my
+
+    U, s, Vt = np.linalg.svd(Xc, full_matrices=False)
+    tol = (s.max() if s.size else 0.0) * max(n, k) * np.finfo(np.float64).eps
+    s_inv = np.zeros_like(s)
+    mask = s > tol
+    s_inv[mask] = 1.0 / s[mask]
+    rank = int(mask.sum())
+
+    coef = Vt.T @ (s_inv * (U.T @ yc))
+    intercept = float(my - mx @ coef)
+
+    y_pred = intercept + X @ coef
+    residuos = y - y_pred
+    ssr = float(residuos @ residuos)
+    sst = float(yc @ yc)
+
+    r2 = (1.0 - ssr / sst) if sst > 0 else None
+    gl = n - rank - 1  # grados de libertad de los residuos
+    r2_ajustado = (1.0 - (1.0 - r2) * (n - 1) / gl) if (r2 is not None and gl > 0) else None
+
+    se_coef = None
+    se_intercept = None
+    if gl > 0:
+        sigma2 = ssr / gl
+        cov = (Vt.T * (s_inv ** 2)) @ Vt * sigma2
+        se_coef = np.sqrt(np.clip(np.diag(cov), 0.0, None))
+        se_intercept = float(np.sqrt(max(sigma2 / n + float(mx @ cov @ mx), 0.0)))
+
+    return {
+        "n": n,
+        "rank": rank,
+        "intercept": intercept,
+        "coef": coef,
+        "r2": r2,
+        "r2_ajustado": r2_ajustado,
+        "se_intercept": se_intercept,
+        "se_coef": se_coef,
+        "residuos": {
+            "media": float(residuos.mean()),
+            "std": float(residuos.std(ddof=1)) if n > 1 else 0.0,
+            "min": float(residuos.min()),
+            "max": float(residuos.max()),
+            "mae": float(np.abs(residuos).mean()),
+            "rmse": float(np.sqrt(ssr / n)),
+        },
+        "y_pred": y_pred,
+    }
+
+
+class EstadisticasSuficientes:
+    """
+    Estadísticos suficientes de la regresión lineal: n, medias de X e y y co-momentos centrados
+    (Σ(x-x̄)(x-x̄)ᵀ, Σ(x-x̄)(y-ȳ), Σ(y-ȳ)²). Se actualizan por chunks y se combinan entre
+    particiones con las fórmulas de Chan et al., así que la memoria es constante y el resultado
+    no pierde precisión con valores grandes (epoch).
+    """
+
+    def __init__(self, k: int):
+        self.k = k
+        self.n = 0
+        self.mx = np.zeros(k)
+        self.my = 0.0
+        self.cxx = np.zeros((k, k))
+        self.cxy = np.zeros(k)
+        self.cyy = 0.0
+
+    @classmethod
+    def desde_chunk(cls, X: np.ndarray, y: np.ndarray) -> "EstadisticasSuficientes":
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(-1, 1)
+        st = cls(X.shape[1])
+        st.n = int(X.shape[0])
+        if st.n == 0:
+            return st
+        st.mx = X.mean(axis=0)
+        st.my = float(np.mean(y))
+        Xc = X - st.mx
+        yc = np.asarray(y, dtype=np.float64) - st.my
+        st.cxx = Xc.T @ Xc
+        st.cxy = Xc.T @ yc
+        st.cyy = float(yc @ yc)
+        return st
+
+    @classmethod
+    def desde_sumas(cls, n: int, x0: np.ndarray, y0: float, sx: np.ndarray, sy: float,
+                    sxx: np.ndarray, sxy: np.ndarray, syy: float) -> "EstadisticasSuficientes":
+        """
+        Construye los estadísticos desde sumas desplazadas (x - x0, y - y0), p. ej. las de un $group.
+        El desplazamiento evita la cancelación catastrófica de Σx² - (Σx)²/n.
+        """
+        st = cls(len(x0))
+        st.n = int(n)
+        if st.n == 0:
+            return st
+        dx = np.asarray(sx, dtype=np.float64) / n
+        dy = float(sy) / n
+        st.mx = np.asarray(x0, dtype=np.float64) + dx
+        st.my = float(y0) + dy
+        st.cxx = np.asarray(sxx, dtype=np.float64) - n * np.outer(dx, dx)
+        st.cxy = np.asarray(sxy, dtype=np.float64) - n * dx * dy
+        st.cyy = float(syy) - n * dy * dy
+        return st
+
+    def combinar(self, otro: "EstadisticasSuficientes") -> "EstadisticasSuficientes":
+        """Incorpora 'otro' (chunk o partición) en self y devuelve self."""
+        if otro.n == 0:
+            return self
+        if self.n == 0:
+            self.n, self.mx, self.my = otro.n, otro.mx.copy(), otro.my
+            self.cxx, self.cxy, self.cyy = otro.cxx.copy(), otro.cxy.copy(), otro.cyy
+            return self
+        n = self.n + otro.n
+        dx = otro.mx - self.mx
+        dy = otro.my - self.my
+        f = self.n * otro.n / n
+        self.cxx = self.cxx + otro.cxx + f * np.outer(dx, dx)
+        self.cxy = self.cxy + otro.cxy + f * dx * dy
+        self.cyy = self.cyy + otro.cyy + f * dy * dy
+        self.mx = self.mx + dx * (otro.n / n)
+        self.my = self.my + dy * (otro.n / n)
+        self.n = n
+        return self
+
+    def actualizar(self, X: np.ndarray, y: np.ndarray) -> "EstadisticasSuficientes":
+        return self.combinar(EstadisticasSuficientes.desde_chunk(X, y))
+
+
+def ajustar_desde_estadisticas(st: EstadisticasSuficientes) -> Dict[str, Any]:
+    """
+    Ajuste por mínimos cuadrados a partir de los estadísticos suficientes.
+    Devuelve las mismas claves que ajustar(); y_pred es None y de los residuos solo se conocen
+    media (0) y rmse.
+    """
+    n, k = st.n, st.k
+    # se trabaja con la matriz de correlación (escala 1 por columna) para que la tolerancia de
+    # rango no dependa de las unidades: epoch y conteos conviven en la misma matriz
+    d = np.sqrt(np.clip(np.diag(st.cxx), 0.0, None))
+    d[d == 0] = 1.0
+    corr = st.cxx / np.outer(d, d)
+    U, s, Vt = np.linalg.svd(corr)
+    tol = (s.max() if s.size else 0.0) * max(n, k) * np.finfo(np.float64).eps
+    s_inv = np.zeros_like(s)
+    mask = s > tol
+    s_inv[mask] = 1.0 / s[mask]
+    rank = int(mask.sum())
+    cxx_pinv = ((Vt.T * s_inv) @ U.T) / np.outer(d, d)
+
+    coef = cxx_pinv @ st.cxy
+    intercept = float(st.my - st.mx @ coef)
+    ssr = max(float(st.cyy - coef @ st.cxy), 0.0)
+    sst = st.cyy
+
+    r2 = (1.0 - ssr / sst) if sst > 0 else None
+    gl = n - rank - 1
+    r2_ajustado = (1.0 - (1.0 - r2) * (n - 1) / gl) if (r2 is not None and gl > 0) else None
+
+    se_coef = None
+    se_intercept = None
+    if gl > 0:
+        sigma2 = ssr / gl
+        cov = cxx_pinv * sigma2
+        se_coef = np.sqrt(np.clip(np.diag(cov), 0.0, None))
+        se_intercept = float(np.sqrt(max(sigma2 / n + float(st.mx @ cov @ st.mx), 0.0)))
+
+    return {
+        "n": n,
+        "rank": rank,
+        "intercept": intercept,
+        "coef": coef,
+        "r2": r2,
+        "r2_ajustado": r2_ajustado,
+        "se_intercept": se_intercept,
+        "se_coef": se_coef,
+        "residuos": {
+            "media": 0.0,
+            "std": float(np.sqrt(ssr / (n - 1))) if n > 1 else 0.0,
+            "min": None,
+            "max": None,
+            "mae": None,
+            "rmse": float(np.sqrt(ssr / n)) if n else 0.0,
+        },
+        "y_pred": None,
+    }
+
+
+def errores_estandar(fit: Dict[str, Any], features: Sequence[str]) -> Optional[Dict[str, float]]:
+    """Errores estándar como dict {intercept, <feature>: se}; None si no hay grados de libertad."""
+    if fit["se_coef"] is None:
+        return None
+    out = {"intercept": fit["se_intercept"]}
+    out.update({f: float(fit["se_coef"][i]) for i, f in enumerate(features)})
+    return out
+
+
+def indices_muestra(n: int, max_points: Optional[int]) -> Optional[np.ndarray]:
+    """Índices equiespaciados para devolver a lo sumo max_points puntos (None = todos)."""
+    if not max_points or max_points <= 0 or n <= max_points:
+        return None
+    return np.unique(np.linspace(0, n - 1, int(max_points)).astype(np.int64))
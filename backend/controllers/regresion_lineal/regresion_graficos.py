@@ -2,11 +2,33 @@
 from flask import Blueprint, request, current_app, jsonify
 from bson import json_util
 import json
+import os
 import datetime
 import traceback
+import numpy as np
+
+from .motor import ajustar, ajustar_desde_estadisticas, errores_estandar, extraer_columnas, indices_muestra
+from .features import pipeline_features, fila_desde_v
+from .streaming import MAX_PARTICIONES, estadisticas_cursor, estadisticas_group_simple, particiones_id
+from .modelos import buscar, guardar, obtener, predecir, spec_modelo, ultimo, version_coleccion
 
 bp = Blueprint('regresion', __name__, url_prefix='/regresion')
 
+# Tope de filas para /regresion/multiple en modo colección (features calculadas en el servidor)
+try:
+    MAX_FILAS_AGREGACION = int(os.environ.get("REGRESION_MAX_FILAS", "200000"))
+except ValueError:
+    MAX_FILAS_AGREGACION = 200000
+
+# Campos que 'filtro' puede usar además de los del modelo (x/y, features/target)
+FILTRO_CAMPOS = tuple(c.strip() for c in os.environ.get(
+    "REGRESION_FILTRO_CAMPOS", "_id,created_at,fecha,fecha_ordinal,estado").split(",") if c.strip())
+# Operadores de consulta admitidos en 'filtro' (nada que ejecute código: $where, $function, $expr...)
+_OPERADORES_FILTRO = {
+    "$and", "$or", "$nor", "$not", "$eq", "$ne", "$gt", "$gte", "$lt", "$lte", "$in", "$nin",
+    "$exists", "$type", "$regex", "$options", "$all", "$size", "$elemMatch",
+}
+
 def _serialize(obj):
     try:
         return json.loads(json_util.dumps(obj))
@@ -19,8 +41,17 @@ def _serialize(obj):
 def _bad(msg: str):
     return jsonify({"ok": False, "error": msg}), 400
 
+def _epoch_utc(dt):
+    # fecha sin zona = UTC (como pymongo y como _expr_x_epoch en el servidor), no la hora local
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return int(dt.timestamp())
+
 def _to_epoch_loose(value):
-    """Intento robusto de convertir value a epoch (segundos). Devuelve int o None."""
+    """
+    Intento robusto de convertir value a epoch (segundos). Devuelve int o None.
+    Las fechas y strings sin zona se interpretan como UTC, igual que en stream=true.
+    """
     if value is None:
         return None
     # numérico
@@ -32,7 +63,7 @@ def _to_epoch_loose(value):
     # datetime
     if isinstance(value, datetime.datetime):
         try:
-            return int(value.timestamp())
+            return _epoch_utc(value)
         except Exception:
             return None
     # string: intentar ISO parse
@@ -40,21 +71,159 @@ def _to_epoch_loose(value):
         s = value.strip()
         if not s:
             return None
-        # quitar sufijo Z para fromisoformat si existe
-        s2 = s[:-1] if s.endswith('Z') else s
+        # sufijo Z -> +00:00 para fromisoformat
+        s2 = s[:-1] + '+00:00' if s.endswith('Z') else s
         try:
             dt = datetime.datetime.fromisoformat(s2)
-            return int(dt.timestamp())
+            return _epoch_utc(dt)
         except Exception:
             # fallback a dateutil si está disponible
             try:
                 from dateutil import parser as _parser
                 dt = _parser.isoparse(s)
-                return int(dt.timestamp())
+                return _epoch_utc(dt)
             except Exception:
                 return None
     return None
 
+def _flag(body, key, default):
+    v = body.get(key, default)
+    if isinstance(v, str):
+        v = v.strip().lower() not in ("false", "0", "no", "")
+    return bool(v)
+
+def _opciones_puntos(body):
+    """
+    Lee return_points (por defecto true) y max_points (submuestreo opcional) del body.
+    """
+    try:
+        max_points = int(body.get("max_points") or 0) or None
+    except (TypeError, ValueError):
+        max_points = None
+    return _flag(body, "return_points", True), max_points
+
+def _opciones_stream(body):
+    """
+    Modo stream (sin tope de filas): stream=true, particiones (rangos de _id leídos en paralelo,
+    1..MAX_PARTICIONES) y stream_modo ('cursor' o 'servidor', este último solo en /simple).
+    """
+    try:
+        particiones = int(body.get("particiones") or 1)
+    except (TypeError, ValueError):
+        particiones = 1
+    particiones = max(1, min(particiones, MAX_PARTICIONES))
+    modo = str(body.get("stream_modo") or "cursor").strip().lower()
+    return _flag(body, "stream", False), particiones, modo
+
+def _entero(body, key, default):
+    """Entero opcional del body; ValueError con un mensaje para el 400 si no es numérico."""
+    valor = body.get(key)
+    if not valor:
+        return default
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        raise ValueError(f"{key} debe ser un número entero")
+
+def _campo_permitido(campo, permitidos):
+    return any(campo == p or campo.startswith(p + ".") for p in permitidos)
+
+def _validar_filtro(valor, permitidos, en_campo=False):
+    if isinstance(valor, list):
+        for v in valor:
+            _validar_filtro(v, permitidos, en_campo)
+        return
+    if not isinstance(valor, dict):
+        return
+    for clave, v in valor.items():
+        if not isinstance(clave, str):
+            raise ValueError("filtro inválido")
+        if clave.startswith("$"):
+            if clave not in _OPERADORES_FILTRO:
+                raise ValueError(f"Operador no permitido en filtro: {clave}")
+        elif en_campo:
+            # documento literal como valor de comparación: sus claves no son campos
+            continue
+        elif not _campo_permitido(clave, permitidos):
+            raise ValueError(f"Campo no permitido en filtro: {clave}")
+        _validar_filtro(v, permitidos, en_campo or not clave.startswith("$"))
+
+def _filtro(body, campos):
+    """
+    Filtro opcional ('filtro') aplicado a la colección en modo colección. Solo admite los campos
+    del modelo ('campos') y FILTRO_CAMPOS, y operadores de consulta de _OPERADORES_FILTRO.
+    ValueError (mensaje para el 400) si no es un objeto o no cumple.
+    """
+    f = body.get("filtro") or {}
+    if not isinstance(f, dict):
+        raise ValueError("filtro debe ser un objeto")
+    _validar_filtro(f, set(FILTRO_CAMPOS) | {c for c in campos if isinstance(c, str)})
+    return f
+
+def _combinar_filtros(a, b):
+    if a and b:
+        return {"$and": [a, b]}
+    return a or b or {}
+
+def _modelo_en_cache(body, db, spec, version, stream):
+    """
+    Modelo ya ajustado para (spec, versión) si la respuesta no necesita puntos
+    (return_points=false o stream=true) y no se pidió cache=false.
+    """
+    return_points, _ = _opciones_puntos(body)
+    if not _flag(body, "cache", True) or (return_points and not stream):
+        return None
+    return buscar(db, spec, version)
+
+def _guardar_modelo(db, spec, version, fit, resumen, features, target):
+    modelo = {
+        "tipo": spec["tipo"], "collection": spec["collection"], "features": list(features), "target": target,
+        "intercept": fit["intercept"], "coef_vector": [float(c) for c in fit["coef"]], "resumen": resumen,
+    }
+    return guardar(db, spec, version, modelo)
+
+def _respuesta_modelo(modelo):
+    return jsonify({"ok": True, "mode": "collection", "collection": modelo["collection"], **modelo["resumen"],
+                    "puntos": {"total": modelo["resumen"]["n"], "devueltos": 0},
+                    "modelo_id": modelo["modelo_id"], "cache": True}), 200
+
+def _resumen(fit, features, coef_simple=False):
+    """Campos comunes de la respuesta a partir del ajuste del motor."""
+    if coef_simple:
+        coef = float(fit["coef"][0])
+        se = errores_estandar(fit, ["coef"])
+    else:
+        coef = {features[i]: float(fit["coef"][i]) for i in range(len(features))}
+        se = errores_estandar(fit, features)
+    return {
+        "n": fit["n"],
+        "intercept": fit["intercept"],
+        "coef": coef,
+        "r2": fit["r2"],
+        "r2_ajustado": fit["r2_ajustado"],
+        "errores_estandar": se,
+        "residuos": fit["residuos"],
+    }
+
+def _puntos(body, fit, columnas):
+    """
+    Construye 'samples' con las columnas indicadas (dict nombre -> array) más y_pred,
+    respetando return_points/max_points. Devuelve (samples | None, info_puntos).
+    """
+    return_points, max_points = _opciones_puntos(body)
+    n = fit["n"]
+    if not return_points:
+        return None, {"total": n, "devueltos": 0}
+    if fit["y_pred"] is None:
+        # ajuste por estadísticos suficientes (stream): no hay puntos que devolver
+        return None, {"total": n, "devueltos": 0}
+    idx = indices_muestra(n, max_points)
+    samples = {}
+    for nombre, arr in {**columnas, "y_pred": fit["y_pred"]}.items():
+        arr = arr if idx is None else arr[idx]
+        samples[nombre] = arr.tolist()
+    return samples, {"total": n, "devueltos": n if idx is None else int(idx.size)}
+
 @bp.route('/simple', methods=['POST'])
 def regresion_simple():
     """
@@ -62,6 +231,13 @@ def regresion_simple():
       - samples mode: { samples: { x: [...], y: [...] } }
       - collection mode: { collection, x_field, y_field, limit }
     Convierte fechas ISO a epoch on-the-fly si x_field apunta a un campo de fecha.
+    Opcionales: return_points (default true) y max_points (submuestreo de los puntos devueltos).
+    Con stream=true se ajusta sobre toda la colección (ignora limit y no devuelve puntos);
+    stream_modo='servidor' resuelve las sumas con un $group en MongoDB.
+    En modo colección: 'filtro' (query de MongoDB sobre x/y y FILTRO_CAMPOS, sin $where/$expr)
+    restringe los documentos; el modelo ajustado se
+    guarda (ver modelos.py) y se reutiliza mientras la colección no cambie si no se piden puntos
+    (cache=false fuerza el reajuste). La respuesta incluye modelo_id para /regresion/predict.
     """
     try:
         body = request.get_json(silent=True)
@@ -81,31 +257,31 @@ def regresion_simple():
             if len(xs) != len(ys):
                 return _bad("samples.x y samples.y deben tener la misma longitud")
             try:
-                xs_n = [float(v) for v in xs]
-                ys_n = [float(v) for v in ys]
+                xs_n = np.asarray(xs, dtype=np.float64)
+                ys_n = np.asarray(ys, dtype=np.float64)
             except Exception:
                 return _bad("samples.x / samples.y deben contener valores numéricos")
+            # null/None pasa a NaN con dtype float64: sin este chequeo el ajuste falla con un 500
+            if xs_n.ndim != 1 or ys_n.ndim != 1 or not (np.isfinite(xs_n).all() and np.isfinite(ys_n).all()):
+                return _bad("samples.x / samples.y deben contener valores numéricos")
             n = len(xs_n)
             if n < 2:
                 return _bad("Se requieren al menos 2 muestras")
-            mean_x = sum(xs_n) / n
-            mean_y = sum(ys_n) / n
-            num = sum((xs_n[i]-mean_x)*(ys_n[i]-mean_y) for i in range(n))
-            den = sum((xs_n[i]-mean_x)**2 for i in range(n))
-            coef = 0.0 if den == 0 else num/den
-            intercept = mean_y - coef * mean_x
-            y_pred = [intercept + coef * x for x in xs_n]
-            return jsonify({
-                "ok": True, "mode": "samples", "n": n,
-                "intercept": intercept, "coef": coef, "r2": None,
-                "samples": {"x": xs_n, "y": ys_n, "y_pred": y_pred}
-            }), 200
+            fit = ajustar(xs_n, ys_n)
+            puntos, info = _puntos(body, fit, {"x": xs_n, "y": ys_n})
+            resp = {"ok": True, "mode": "samples", **_resumen(fit, ["x"], coef_simple=True), "puntos": info}
+            if puntos is not None:
+                resp["samples"] = puntos
+            return jsonify(resp), 200
 
         # collection mode
         collection = body.get("collection")
         x_field = body.get("x_field")
         y_field = body.get("y_field")
-        limit = int(body.get("limit") or 1000)
+        try:
+            limit = _entero(body, "limit", 1000)
+        except ValueError as e:
+            return _bad(str(e))
         if not collection or not x_field or not y_field:
             return _bad("Faltan parámetros: collection, x_field y y_field son requeridos cuando no se envían samples")
 
@@ -114,55 +290,73 @@ def regresion_simple():
             return _bad("DB no disponible")
         if collection not in db.list_collection_names():
             return _bad(f"Colección '{collection}' no encontrada en DB")
+        try:
+            filtro = _filtro(body, [x_field, y_field])
+        except ValueError as e:
+            return _bad(str(e))
+
+        stream, particiones, stream_modo = _opciones_stream(body)
+        n_max = max(1, min(limit, 20000))
+        col = db[collection]
+        spec = spec_modelo("simple", collection, [x_field], y_field, filtro, "todo" if stream else n_max)
+        version = version_coleccion(col)
+        modelo = _modelo_en_cache(body, db, spec, version, stream)
+        if modelo is not None:
+            return _respuesta_modelo(modelo)
 
         # muestreo inicial para diagnóstico
         try:
-            sample_docs = list(db[collection].find({}, {x_field:1, y_field:1}).limit(6))
+            sample_docs = list(db[collection].find(filtro, {x_field:1, y_field:1}).limit(6))
             current_app.logger.info("Regresion collection sample_docs (first up to 6): %s", _serialize(sample_docs))
         except Exception as e:
             current_app.logger.exception("Error al leer sample_docs: %s", e)
             sample_docs = []
 
-        xs = []
-        ys = []
-        skipped = 0
-        cursor = db[collection].find({}, {x_field: 1, y_field: 1}).limit(max(1, min(limit, 20000)))
-        for doc in cursor:
-            xv = doc.get(x_field)
-            yv = doc.get(y_field)
-
-            xv_conv = _to_epoch_loose(xv)
+        def _fila(doc):
+            xv_conv = _to_epoch_loose(doc.get(x_field))
             try:
-                yv_conv = float(yv)
+                yv_conv = float(doc.get(y_field))
             except Exception:
                 yv_conv = None
-
             if xv_conv is None or yv_conv is None:
-                skipped += 1
-                continue
+                return None
+            return (float(xv_conv),), yv_conv
 
-            xs.append(float(xv_conv))
-            ys.append(float(yv_conv))
+        if stream:
+            if stream_modo == "servidor":
+                st, info_stream = estadisticas_group_simple(col, x_field, y_field, match=filtro)
+            else:
+                st, info_stream = estadisticas_cursor(
+                    lambda f: col.find(_combinar_filtros(filtro, f), {x_field: 1, y_field: 1}, batch_size=10000),
+                    1, _fila, particiones_id(col, particiones, match=filtro))
+            current_app.logger.info("Regresion stream: n=%s info=%s", st.n, info_stream)
+            if st.n < 2:
+                return _bad(f"No hay suficientes datos numéricos: encontrados {st.n} válidos. Revisa que '{x_field}' y '{y_field}' existan y sean convertibles a número.")
+            fit = ajustar_desde_estadisticas(st)
+            resumen = _resumen(fit, [x_field], coef_simple=True)
+            modelo_id = _guardar_modelo(db, spec, version, fit, resumen, [x_field], y_field)
+            return jsonify({"ok": True, "mode": "collection", "collection": collection, **resumen,
+                            "puntos": {"total": st.n, "devueltos": 0}, "stream": info_stream,
+                            "modelo_id": modelo_id, "cache": False}), 200
+
+        cursor = col.find(filtro, {x_field: 1, y_field: 1}).limit(n_max)
+        X, ys, skipped = extraer_columnas(cursor, n_max, 1, _fila)
+        xs = X[:, 0]
 
         current_app.logger.info("Regresion extracted counts: kept=%s skipped=%s", len(xs), skipped)
 
         if len(xs) < 2:
             return _bad(f"No hay suficientes datos numéricos: encontrados {len(xs)} válidos, {skipped} omitidos. Revisa que '{x_field}' y '{y_field}' existan y sean convertibles a número; alternativamente envia samples o ejecuta la migración de fecha_ordinal.")
 
-        n = len(xs)
-        mean_x = sum(xs) / n
-        mean_y = sum(ys) / n
-        num = sum((xs[i]-mean_x)*(ys[i]-mean_y) for i in range(n))
-        den = sum((xs[i]-mean_x)**2 for i in range(n))
-        coef = 0.0 if den == 0 else num/den
-        intercept = mean_y - coef * mean_x
-        y_pred = [intercept + coef * x for x in xs]
-
-        return jsonify({
-            "ok": True, "mode": "collection", "collection": collection, "n": n,
-            "intercept": intercept, "coef": coef, "r2": None,
-            "samples": {"x": xs, "y": ys, "y_pred": y_pred}
-        }), 200
+        fit = ajustar(X, ys)
+        resumen = _resumen(fit, [x_field], coef_simple=True)
+        modelo_id = _guardar_modelo(db, spec, version, fit, resumen, [x_field], y_field)
+        puntos, info = _puntos(body, fit, {"x": xs, "y": ys})
+        resp = {"ok": True, "mode": "collection", "collection": collection,
+                **resumen, "puntos": info, "modelo_id": modelo_id, "cache": False}
+        if puntos is not None:
+            resp["samples"] = puntos
+        return jsonify(resp), 200
 
     except Exception as exc:
         current_app.logger.exception("Error en /regresion/simple: %s", exc)
@@ -180,6 +374,11 @@ def regresion_multiple():
       - features dentro de arrays con notación 'productos.FIELD' (agrega vía suma)
       - campos simples al nivel del documento
     Respuesta incluye filas X_matrix opcional para facilitar mapeo en frontend.
+    En modo colección las features se calculan con un pipeline de agregación (ver features.py).
+    Opcionales: return_points (default true) y max_points (submuestreo de los puntos devueltos).
+    Con stream=true se ajusta sobre toda la colección (ignora limit y no devuelve puntos),
+    opcionalmente leyendo 'particiones' rangos de _id en paralelo.
+    'filtro', caché de modelos y modelo_id igual que en /regresion/simple.
     """
     try:
         body = request.get_json(silent=True)
@@ -193,36 +392,32 @@ def regresion_multiple():
             if not isinstance(samples, list) or not samples:
                 return _bad("samples debe ser un array de ejemplos {x:{...}, y: number}")
             features = list(samples[0].get("x", {}).keys())
-            X = []
-            y = []
-            for s in samples:
+            X = np.empty((len(samples), len(features)), dtype=np.float64)
+            y = np.empty(len(samples), dtype=np.float64)
+            for i, s in enumerate(samples):
                 xv = s.get("x", {})
                 try:
-                    row = [float(xv.get(f, 0)) for f in features]
-                    X.append([1.0] + row)
-                    y.append(float(s.get("y")))
+                    X[i, :] = [float(xv.get(f, 0)) for f in features]
+                    y[i] = float(s.get("y"))
                 except Exception:
                     return _bad("Todos los features y y deben ser numéricos en samples")
-            try:
-                import numpy as _np
-                Xt = _np.array(X)
-                yt = _np.array(y).reshape(-1,1)
-                coef_vec = _np.linalg.pinv(Xt.T.dot(Xt)).dot(Xt.T).dot(yt).flatten()
-                intercept = float(coef_vec[0])
-                coefs = {features[i]: float(coef_vec[i+1]) for i in range(len(features))}
-                y_pred = (Xt.dot(coef_vec.reshape(-1,1)).flatten()).tolist()
-            except Exception:
-                return _bad("Regresión múltiple requiere numpy en el entorno para cálculos (instala numpy)")
-            return jsonify({
-                "ok": True, "n": len(y), "intercept": intercept, "coef": coefs, "r2": None,
-                "samples": {"y": y, "y_pred": y_pred}, "features": features
-            }), 200
+            if not (np.isfinite(X).all() and np.isfinite(y).all()):
+                return _bad("Todos los features y y deben ser numéricos en samples")
+            fit = ajustar(X, y)
+            puntos, info = _puntos(body, fit, {"y": y})
+            resp = {"ok": True, **_resumen(fit, features), "features": features, "puntos": info}
+            if puntos is not None:
+                resp["samples"] = puntos
+            return jsonify(resp), 200
 
         # collection mode
         collection = body.get("collection")
         features = body.get("features")
         target = body.get("target")
-        limit = int(body.get("limit") or 1000)
+        try:
+            limit = _entero(body, "limit", 1000)
+        except ValueError as e:
+            return _bad(str(e))
         if not collection or not features or not target:
             return _bad("Faltan parámetros: collection, features y target son requeridos cuando no se envían samples")
         if not isinstance(features, list) or not features:
@@ -234,96 +429,122 @@ def regresion_multiple():
         if collection not in db.list_collection_names():
             return _bad(f"Colección '{collection}' no encontrada en DB")
 
-        rows = []
-        y_vals = []
-        x_matrix = []  # conservar valores originales por fila para frontend si se desea
-        cursor = db[collection].find().limit(max(1, min(limit, 20000)))
-        for doc in cursor:
-            row_vals = []
-            skip = False
-            for f in features:
-                # features derivadas conocidas
-                if f == "items_count":
-                    v = len(doc.get("productos") or [])
-                elif f == "sum_precio":
-                    s = 0.0
-                    for p in doc.get("productos") or []:
-                        try:
-                            s += float(p.get("precio", 0)) * int(p.get("cantidad", 1))
-                        except Exception:
-                            pass
-                    v = s
-                elif f == "avg_precio":
-                    cnt = len(doc.get("productos") or [])
-                    s = 0.0
-                    for p in doc.get("productos") or []:
-                        try:
-                            s += float(p.get("precio", 0)) * int(p.get("cantidad", 1))
-                        except Exception:
-                            pass
-                    v = (s / cnt) if cnt else 0.0
-                # soporte para features con notación productos.FIELD (ej: productos.precio)
-                elif isinstance(f, str) and f.startswith("productos."):
-                    fld = f.split(".", 1)[1]
-                    vals = []
-                    for p in doc.get("productos") or []:
-                        try:
-                            val = p.get(fld)
-                            if val is None:
-                                continue
-                            vals.append(float(val))
-                        except Exception:
-                            continue
-                    # agregación por suma; si necesitas promedio cambia la siguiente línea
-                    v = sum(vals) if vals else 0.0
-                else:
-                    # campo simple al nivel del documento (fallback)
-                    try:
-                        raw = doc.get(f, None)
-                        if raw is None:
-                            v = 0.0
-                        else:
-                            v = float(raw)
-                    except Exception:
-                        v = None
-                if v is None:
-                    skip = True
-                    break
-                row_vals.append(float(v))
-            # target
-            try:
-                yv = float(doc.get(target, 0))
-            except Exception:
-                skip = True
-            if skip:
-                continue
-            rows.append([1.0] + row_vals)
-            x_matrix.append(row_vals)
-            y_vals.append(yv)
+        if not all(isinstance(f, str) and f for f in features):
+            return _bad("features debe contener nombres de campo (strings)")
+        try:
+            filtro = _filtro(body, features + [target])
+        except ValueError as e:
+            return _bad(str(e))
 
-        current_app.logger.info("Regresion multiple extracted: rows=%s features=%s", len(rows), features)
+        stream, particiones, _ = _opciones_stream(body)
+        n_max = max(1, min(limit, MAX_FILAS_AGREGACION))
+        col = db[collection]
+        spec = spec_modelo("multiple", collection, features, target, filtro, "todo" if stream else n_max)
+        version = version_coleccion(col)
+        modelo = _modelo_en_cache(body, db, spec, version, stream)
+        if modelo is not None:
+            return _respuesta_modelo(modelo)
 
-        if len(rows) < len(features) + 1:
-            return _bad("No hay suficientes filas válidas para resolver regresión múltiple con las features solicitadas")
+        if stream:
+            st, info_stream = estadisticas_cursor(
+                lambda f: col.aggregate(pipeline_features(features, target, match=_combinar_filtros(filtro, f)),
+                                        allowDiskUse=True, batchSize=10000),
+                len(features), fila_desde_v, particiones_id(col, particiones, match=filtro))
+            current_app.logger.info("Regresion multiple stream: n=%s info=%s", st.n, info_stream)
+            if st.n < len(features) + 1:
+                return _bad("No hay suficientes filas válidas para resolver regresión múltiple con las features solicitadas")
+            fit = ajustar_desde_estadisticas(st)
+            resumen = {**_resumen(fit, features), "features": features}
+            modelo_id = _guardar_modelo(db, spec, version, fit, resumen, features, target)
+            return jsonify({"ok": True, "mode": "collection", "collection": collection, **resumen,
+                            "puntos": {"total": st.n, "devueltos": 0}, "stream": info_stream,
+                            "modelo_id": modelo_id, "cache": False}), 200
 
-        try:
-            import numpy as _np
-            Xt = _np.array(rows)
-            yt = _np.array(y_vals).reshape(-1,1)
-            coef_vec = _np.linalg.pinv(Xt.T.dot(Xt)).dot(Xt.T).dot(yt).flatten()
-            intercept = float(coef_vec[0])
-            coefs = {features[i]: float(coef_vec[i+1]) for i in range(len(features))}
-            y_pred = (Xt.dot(coef_vec.reshape(-1,1)).flatten()).tolist()
-        except Exception:
-            current_app.logger.exception("Error en cálculo numpy")
-            return _bad("Regresión múltiple requiere numpy en el entorno para cálculos (instala numpy)")
+        # La extracción de features corre en MongoDB: solo viajan los números por fila
+        cursor = col.aggregate(pipeline_features(features, target, limit=n_max, match=filtro or None),
+                               allowDiskUse=True, batchSize=10000)
+        X, y_vals, _ = extraer_columnas(cursor, n_max, len(features), fila_desde_v)
+
+        current_app.logger.info("Regresion multiple extracted: rows=%s features=%s", len(y_vals), features)
+
+        if len(y_vals) < len(features) + 1:
+            return _bad("No hay suficientes filas válidas para resolver regresión múltiple con las features solicitadas")
 
-        return jsonify({
-            "ok": True, "mode": "collection", "collection": collection, "n": len(rows),
-            "intercept": intercept, "coef": coefs, "r2": None,
-            "samples": {"y": y_vals, "y_pred": y_pred, "X_matrix": x_matrix}, "features": features
-        }), 200
+        fit = ajustar(X, y_vals)
+        resumen = {**_resumen(fit, features), "features": features}
+        modelo_id = _guardar_modelo(db, spec, version, fit, resumen, features, target)
+        puntos, info = _puntos(body, fit, {"y": y_vals, "X_matrix": X})
+        resp = {"ok": True, "mode": "collection", "collection": collection,
+                **resumen, "puntos": info, "modelo_id": modelo_id, "cache": False}
+        if puntos is not None:
+            resp["samples"] = puntos
+        return jsonify(resp), 200
 
     except Exception as exc:
         current_app.logger.exception("Error en /regresion/multiple: %s", traceback.format_exc())
         return jsonify({"ok": False, "error": "Error interno al procesar regresión múltiple", "detail": str(exc)}), 500
+
+
+@bp.route('/predict', methods=['POST'])
+def regresion_predict():
+    """
+    Evalúa un modelo guardado sin leer la colección de origen.
+      - { modelo_id, inputs }  o
+      - { collection, x_field, y_field | features, target, filtro?, stream?, limit?, inputs }
+        (usa el modelo más reciente ajustado con esos parámetros)
+    inputs: lista de números (simple), lista de listas en el orden de features, o lista de
+    objetos {feature: valor} (features ausentes = 0).
+    """
+    try:
+        body = request.get_json(silent=True)
+        if not body:
+            return _bad("Request body vacío o no es JSON")
+        db = current_app.config.get('GET_DB')()
+
+        modelo_id = body.get("modelo_id")
+        if modelo_id:
+            modelo = obtener(db, str(modelo_id))
+        else:
+            collection = body.get("collection")
+            if body.get("x_field"):
+                tipo, features, target = "simple", [body.get("x_field")], body.get("y_field")
+                tope = 20000
+            else:
+                tipo, features, target = "multiple", body.get("features"), body.get("target")
+                tope = MAX_FILAS_AGREGACION
+            if not collection or not features or not target or not isinstance(features, list):
+                return _bad("Se requiere modelo_id, o collection con x_field/y_field o features/target")
+            try:
+                filtro = _filtro(body, features + [target])
+                limit = _entero(body, "limit", 1000)
+            except ValueError as e:
+                return _bad(str(e))
+            if db is None:
+                return _bad("DB no disponible")
+            alcance = "todo" if _flag(body, "stream", False) else max(1, min(limit, tope))
+            modelo = ultimo(db, spec_modelo(tipo, collection, features, target, filtro, alcance))
+        if modelo is None:
+            return jsonify({"ok": False, "error": "Modelo no encontrado (ajústalo primero con /regresion/simple o /regresion/multiple)"}), 404
+
+        inputs = body.get("inputs")
+        if not isinstance(inputs, list) or not inputs:
+            return _bad("inputs debe ser un array no vacío")
+        features = modelo["features"]
+        try:
+            if isinstance(inputs[0], dict):
+                X = [[float(fila.get(f, 0)) for f in features] for fila in inputs]
+            elif isinstance(inputs[0], list):
+                X = [[float(v) for v in fila] for fila in inputs]
+            else:
+                X = [[float(v)] for v in inputs]
+            y_pred = predecir(modelo, X)
+        except (TypeError, ValueError, AttributeError) as e:
+            return _bad(f"inputs inválidos: {e}")
+
+        return jsonify({"ok": True, "modelo_id": modelo["modelo_id"], "version": modelo.get("version"),
+                        "features": features, "target": modelo.get("target"),
+                        "y_pred": y_pred.tolist()}), 200
+
+    except Exception as exc:
+        current_app.logger.exception("Error en /regresion/predict: %s", exc)
+        return jsonify({"ok": False, "error": "Error interno al predecir", "detail": str(exc)}), 500
@@ -0,0 +1,166 @@
+# controllers/regresion_lineal/streaming.py
+"""
+Regresión sobre la colección completa sin tope de filas (modo 'stream').
+Funciones:
+ - particiones_id(col, n, match=None) -> lista de filtros por rango de _id
+ - estadisticas_cursor(hacer_cursor, k, fila, particiones, chunk) -> (EstadisticasSuficientes, info)
+ - estadisticas_group_simple(col, x_field, y_field) -> (EstadisticasSuficientes, info)
+
+El cursor se consume por chunks de tamaño fijo y cada chunk se pliega en los estadísticos
+suficientes (motor.EstadisticasSuficientes), así que la memoria no depende del tamaño de la
+colección. Con particiones > 1 cada rango de _id se lee en su propio hilo y los estadísticos
+parciales se combinan al final.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .motor import EstadisticasSuficientes, extraer_columnas
+
+CHUNK_FILAS = 50000
+MAX_PARTICIONES = 8
+
+
+def particiones_id(col, n: int, match: Optional[Dict[str, Any]] = None) -> List[Optional[Dict[str, Any]]]:
+    """
+    Divide la colección en n rangos contiguos de _id con $bucketAuto.
+    Devuelve filtros {"_id": {"$gte": a, "$lt": b}} (el último con $lte); [None] si n <= 1
+    o no hay documentos.
+    """
+    if n <= 1:
+        return [None]
+    pipeline = []
+    if match:
+        pipeline.append({"$match": match})
+    pipeline.append({"$bucketAuto": {"groupBy": "$_id", "buckets": int(n)}})
+    buckets = list(col.aggregate(pipeline, allowDiskUse=True))
+    if not buckets:
+        return [None]
+    filtros = []
+    for i, b in enumerate(buckets):
+        hasta = "$lte" if i == len(buckets) - 1 else "$lt"
+        filtros.append({"_id": {"$gte": b["_id"]["min"], hasta: b["_id"]["max"]}})
+    return filtros
+
+
+def _plegar(cursor, k: int, fila: Callable, chunk: int) -> Tuple[EstadisticasSuficientes, int, int]:
+    """Consume el cursor por chunks y acumula estadísticos. Devuelve (stats, omitidos, chunks)."""
+    st = EstadisticasSuficientes(k)
+    omitidos = 0
+    chunks = 0
+    while True:
+        X, y, om = extraer_columnas(cursor, chunk, k, fila)
+        omitidos += om
+        if len(y):
+            st.actualizar(X, y)
+            chunks += 1
+        if len(y) < chunk:
+            return st, omitidos, chunks
+
+
+def estadisticas_cursor(hacer_cursor: Callable[[Optional[Dict[str, Any]]], Any], k: int, fila: Callable,
+                        particiones: List[Optional[Dict[str, Any]]], chunk: int = CHUNK_FILAS
+                        ) -> Tuple[EstadisticasSuficientes, Dict[str, Any]]:
+    """
+    hacer_cursor(filtro_id) abre el cursor de una partición (filtro None = colección completa).
+    Las particiones se leen en paralelo y sus estadísticos se combinan.
+    """
+    inicio = time.perf_counter()
+
+    def _una(filtro):
+        cursor = hacer_cursor(filtro)
+        try:
+            return _plegar(cursor, k, fila, chunk)
+        finally:
+            close = getattr(cursor, "close", None)
+            if close:
+                close()
+
+    if len(particiones) == 1:
+        parciales = [_una(particiones[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=len(particiones), thread_name_prefix="regresion_stream") as ex:
+            parciales = list(ex.map(_una, particiones))
+
+    st = EstadisticasSuficientes(k)
+    omitidos = 0
+    chunks = 0
+    for p_st, p_om, p_ch in parciales:
+        st.combinar(p_st)
+        omitidos += p_om
+        chunks += p_ch
+    elapsed = time.perf_counter() - inicio
+    return st, {
+        "modo": "cursor",
+        "particiones": len(particiones),
+        "chunks": chunks,
+        "chunk_filas": chunk,
+        "omitidos": omitidos,
+        "elapsed_s": round(elapsed, 3),
+        "filas_por_seg": round(st.n / elapsed, 1) if elapsed > 0 else None,
+    }
+
+
+def _expr_x_epoch(campo: str) -> Dict[str, Any]:
+    """
+    Equivalente en agregación de _to_epoch_loose: fechas -> epoch en segundos, números truncados,
+    strings ISO parseadas en el servidor (las que no traen zona se interpretan como UTC).
+    """
+    ref = f"${campo}"
+    return {"$switch": {
+        "branches": [
+            {"case": {"$eq": [{"$type": ref}, "date"]},
+             "then": {"$trunc": {"$divide": [{"$toLong": ref}, 1000]}}},
+            {"case": {"$eq": [{"$type": ref}, "string"]},
+             "then": {"$let": {
+                 "vars": {"d": {"$convert": {"input": ref, "to": "date", "onError": None, "onNull": None}}},
+                 "in": {"$cond": [{"$eq": ["$$d", None]}, None,
+                                  {"$trunc": {"$divide": [{"$toLong": "$$d"}, 1000]}}]},
+             }}},
+            {"case": {"$isNumber": ref}, "then": {"$trunc": {"$toDouble": ref}}},
+        ],
+        "default": None,
+    }}
+
+
+def estadisticas_group_simple(col, x_field: str, y_field: str,
+                              match: Optional[Dict[str, Any]] = None) -> Tuple[EstadisticasSuficientes, Dict[str, Any]]:
+    """
+    Regresión simple resuelta con un único $group en MongoDB: al cliente solo llegan las sumas.
+    Las sumas se desplazan por el primer punto válido (x0, y0) para no perder precisión con epoch.
+    """
+    inicio = time.perf_counter()
+    base: List[Dict[str, Any]] = []
+    if match:
+        base.append({"$match": match})
+    base += [
+        {"$project": {"_id": 0,
+                      "x": _expr_x_epoch(x_field),
+                      "y": {"$convert": {"input": f"${y_field}", "to": "double", "onError": None, "onNull": None}}}},
+        {"$match": {"x": {"$ne": None}, "y": {"$ne": None}}},
+    ]
+    primero = next(iter(col.aggregate(base + [{"$limit": 1}])), None)
+    if primero is None:
+        return EstadisticasSuficientes(1), {"modo": "servidor", "elapsed_s": round(time.perf_counter() - inicio, 3)}
+    x0, y0 = float(primero["x"]), float(primero["y"])
+
+    dx = {"$subtract": ["$x", x0]}
+    dy = {"$subtract": ["$y", y0]}
+    grupo = {"$group": {
+        "_id": None,
+        "n": {"$sum": 1},
+        "sx": {"$sum": dx},
+        "sy": {"$sum": dy},
+        "sxx": {"$sum": {"$multiply": [dx, dx]}},
+        "sxy": {"$sum": {"$multiply": [dx, dy]}},
+        "syy": {"$sum": {"$multiply": [dy, dy]}},
+    }}
+    r = next(iter(col.aggregate(base + [grupo], allowDiskUse=True)), None) or {}
+    st = EstadisticasSuficientes.desde_sumas(
+        int(r.get("n", 0)), np.array([x0]), y0,
+        np.array([r.get("sx", 0.0)]), r.get("sy", 0.0),
+        np.array([[r.get("sxx", 0.0)]]), np.array([r.get("sxy", 0.0)]), r.get("syy", 0.0),
+    )
+    return st, {"modo": "servidor", "elapsed_s": round(time.perf_counter() - inicio, 3)}
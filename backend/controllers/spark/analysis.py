@@ -1,174 +1,189 @@
 import datetime
-from pyspark.sql.functions import avg, sum, count, col, desc, explode, max, min
+import time
+from contextlib import contextmanager
+from pyspark import StorageLevel
+from pyspark.sql.functions import avg, sum, count, col, desc, explode, max, min, max_by, struct
 from pyspark.sql.types import DateType
 # --- Import relativo actualizado ---
 from .spark_config import get_spark_session
 
+
+@contextmanager
+def _etapa(tiempos, nombre):
+    """Mide el tiempo (ms) de una etapa del pipeline y lo guarda en tiempos[nombre]."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        tiempos[nombre] = round((time.perf_counter() - inicio) * 1000, 1)
+
+
 def run_spark_analysis():
     """
     Ejecuta todo el pipeline de análisis de datos con Spark.
     Importa la sesión de Spark desde spark_config.
+
+    Las ventas unidas con clientes se leen de MongoDB una sola vez y se
+    persisten; las estadísticas escalares salen de una única agregación y la
+    serie diaria se calcula una vez. El resultado incluye 'tiempos_ms' con el
+    tiempo de cada etapa.
     """
     spark_session = get_spark_session()
     if not spark_session:
         raise Exception("No se pudo establecer la sesión de Spark.")
 
-    # 1️⃣ Cargar colecciones desde MongoDB
+    tiempos = {}
+    inicio_total = time.perf_counter()
+
+    # 1️⃣ Cargar colecciones desde MongoDB (solo las columnas que se usan)
     try:
-        print("Cargando colecciones desde MongoDB...")
-        ventas_df = (
-            spark_session.read.format("mongodb")
-            .option("database", "superpancho_db")
-            .option("collection", "ventas")
-            .load()
-        )
-
-        clientes_df = (
-            spark_session.read.format("mongodb")
-            .option("database", "superpancho_db")
-            .option("collection", "clientes")
-            .load()
-        )
-
-        productos_df = (
-            spark_session.read.format("mongodb")
-            .option("database", "superpancho_db")
-            .option("collection", "productos")
-            .load()
-        )
-
-        print("Datos cargados correctamente.")
-        total_ventas = ventas_df.count()
-        print(f"Ventas cargadas: {total_ventas}")
+        with _etapa(tiempos, "carga"):
+            print("Cargando colecciones desde MongoDB...")
+            ventas_df = (
+                spark_session.read.format("mongodb")
+                .option("database", "superpancho_db")
+                .option("collection", "ventas")
+                .load()
+                .select("_id", "fecha", "total", "cliente_ref", "productos")
+            )
 
-        if total_ventas == 0:
-            raise Exception("No se encontraron ventas en la colección.")
+            clientes_df = (
+                spark_session.read.format("mongodb")
+                .option("database", "superpancho_db")
+                .option("collection", "clientes")
+                .load()
+                .select(col("_id").alias("cliente_ref_id"), "nombre")
+            )
+
+            # 2️⃣ Convertir fechas
+            ventas_df = ventas_df.withColumn("fecha_date", col("fecha").substr(1, 10).cast(DateType()))
+            ventas_df = ventas_df.withColumnRenamed("total", "total_venta")
+
+            # 3️⃣ Unir por referencia de cliente y persistir: todas las acciones
+            # siguientes reutilizan este DataFrame en lugar de releer MongoDB
+            ventas_df = ventas_df.join(
+                clientes_df,
+                ventas_df["cliente_ref"] == clientes_df["cliente_ref_id"],
+                how="left"
+            ).persist(StorageLevel.MEMORY_AND_DISK)
+            print("Datos cargados correctamente.")
     except Exception as e:
         raise Exception(f"Error al cargar datos: {str(e)}")
 
-    # 2️⃣ Convertir fechas
-    ventas_df = ventas_df.withColumn("fecha_simple", col("fecha").substr(1, 10))
-    ventas_df = ventas_df.withColumn("fecha_date", col("fecha_simple").cast(DateType()))
-
-    # 4️⃣ Preparar y unir clientes
-    clientes_df = clientes_df.drop("productos") 
-    clientes_df = clientes_df.withColumnRenamed("_id", "cliente_ref_id")
-
-    ventas_df = ventas_df.withColumnRenamed("total", "total_venta")
-
-    # Unir por referencia de cliente
-    ventas_df = ventas_df.join(
-        clientes_df,
-        ventas_df["cliente_ref"] == clientes_df["cliente_ref_id"],
-        how="left"
-    )
-
-    # Diccionario de resultados
-    results = {
-        "fecha_analisis": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "total_ventas": total_ventas,
-        "rango_fechas": {},
-        "dia_mas_ventas": {},
-        "promedios": {},
-        "top_10_productos": [],
-        "top_10_clientes": [],
-        "estadisticas_generales": {}
-    }
-
-    # 5️⃣ Rango de fechas
-    fechas = ventas_df.agg(min("fecha_date").alias("min_fecha"), max("fecha_date").alias("max_fecha")).first()
-    results["rango_fechas"] = {
-        "desde": str(fechas["min_fecha"]) if fechas["min_fecha"] else "N/A",
-        "hasta": str(fechas["max_fecha"]) if fechas["max_fecha"] else "N/A"
-    }
-
-    # 6️⃣ Día con más ventas
-    ventas_por_dia = (
-        ventas_df.groupBy("fecha_date")
-        .agg(sum("total_venta").alias("total_vendido"), count("_id").alias("cantidad_ventas"))
-        .orderBy(desc("total_vendido"))
-    )
-    if ventas_por_dia.count() > 0:
-        top_dia = ventas_por_dia.first()
-        results["dia_mas_ventas"] = {
-            "fecha": str(top_dia["fecha_date"]),
-            "total_vendido": float(top_dia["total_vendido"]),
-            "cantidad_ventas": int(top_dia["cantidad_ventas"])
-        }
+    try:
+        # 4️⃣ Estadísticas escalares en una sola agregación (materializa el cache)
+        with _etapa(tiempos, "estadisticas"):
+            stats = ventas_df.agg(
+                count("_id").alias("total_ventas"),
+                min("fecha_date").alias("min_fecha"),
+                max("fecha_date").alias("max_fecha"),
+                sum("total_venta").alias("ingresos_totales"),
+                avg("total_venta").alias("ticket_promedio"),
+                max("total_venta").alias("venta_maxima"),
+                min("total_venta").alias("venta_minima")
+            ).first()
+
+        total_ventas = int(stats["total_ventas"] or 0)
+        print(f"Ventas cargadas: {total_ventas}")
+        if total_ventas == 0:
+            raise Exception("No se encontraron ventas en la colección.")
 
-    # 7️⃣ Promedios
-    results["promedios"]["venta_promedio"] = ventas_df.select(avg("total_venta")).first()[0]
-    results["promedios"]["ventas_por_dia"] = ventas_por_dia.select(avg("cantidad_ventas")).first()[0]
+        # Diccionario de resultados
+        results = {
+            "fecha_analisis": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "total_ventas": total_ventas,
+            "rango_fechas": {
+                "desde": str(stats["min_fecha"]) if stats["min_fecha"] else "N/A",
+                "hasta": str(stats["max_fecha"]) if stats["max_fecha"] else "N/A"
+            },
+            "dia_mas_ventas": {},
+            "promedios": {"venta_promedio": stats["ticket_promedio"]},
+            "top_10_productos": [],
+            "top_10_clientes": [],
+            "estadisticas_generales": {
+                "total_ventas": total_ventas,
+                "ingresos_totales": float(stats["ingresos_totales"]),
+                "ticket_promedio": float(stats["ticket_promedio"]),
+                "venta_maxima": float(stats["venta_maxima"]),
+                "venta_minima": float(stats["venta_minima"])
+            },
+            "tiempos_ms": tiempos
+        }
 
-    # 8️⃣ Top 10 productos (✅ corregido)
-    try:
-        # Seleccionamos únicamente la columna de productos desde ventas_df, evitando ambigüedad
-        ventas_productos_df = ventas_df.select(col("productos").alias("productos_venta"))
-
-        # Expandimos el array de productos en filas individuales
-        productos_exploded = ventas_productos_df.select(explode(col("productos_venta")).alias("producto"))
-
-        # Aseguramos que el campo nombre exista antes de agrupar
-        productos_limpios = productos_exploded.select(
-            col("producto.nombre").alias("nombre_producto"),
-            col("producto.cantidad").alias("cantidad"),
-            col("producto.precio").alias("precio")
-        )
-
-        # Agrupamos los productos
-        top_productos = (
-            productos_limpios.groupBy("nombre_producto")
-            .agg(
-                sum("cantidad").alias("total_vendido"),
-                sum(col("precio") * col("cantidad")).alias("ingresos_totales")
+        # 5️⃣ Serie diaria: se agrega una vez y de ella salen el día top y el promedio diario
+        with _etapa(tiempos, "ventas_por_dia"):
+            ventas_por_dia = (
+                ventas_df.groupBy("fecha_date")
+                .agg(sum("total_venta").alias("total_vendido"), count("_id").alias("cantidad_ventas"))
             )
-            .orderBy(desc("total_vendido"))
-            .limit(10)
-        )
-
-        # Convertimos los resultados a formato JSON
-        results["top_10_productos"] = [
-            {
-                "nombre": row["nombre_producto"],
-                "total_vendido": int(row["total_vendido"]),
-                "ingresos_totales": float(row["ingresos_totales"])
+            dias = ventas_por_dia.agg(
+                avg("cantidad_ventas").alias("ventas_por_dia"),
+                max_by(struct("fecha_date", "total_vendido", "cantidad_ventas"), "total_vendido").alias("top_dia")
+            ).first()
+
+        results["promedios"]["ventas_por_dia"] = dias["ventas_por_dia"]
+        top_dia = dias["top_dia"]
+        if top_dia is not None:
+            results["dia_mas_ventas"] = {
+                "fecha": str(top_dia["fecha_date"]),
+                "total_vendido": float(top_dia["total_vendido"]),
+                "cantidad_ventas": int(top_dia["cantidad_ventas"])
             }
-            for row in top_productos.collect()
-        ]
 
-    except Exception as e:
-        results["top_10_productos"] = {"error": str(e)}
-
-
-    # 9️⃣ Top 10 clientes
-    top_clientes = (
-        ventas_df.groupBy("nombre")
-        .agg(sum("total_venta").alias("gasto_total"), count("_id").alias("compras"))
-        .orderBy(desc("gasto_total"))
-        .limit(10)
-    )
-    for row in top_clientes.collect():
-        results["top_10_clientes"].append({
-            "nombre": row["nombre"],
-            "gasto_total": float(row["gasto_total"]),
-            "compras": int(row["compras"])
-        })
-
-    # 🔟 Estadísticas generales
-    stats = ventas_df.agg(
-        count("_id").alias("total_ventas"),
-        sum("total_venta").alias("ingresos_totales"),
-        avg("total_venta").alias("ticket_promedio"),
-        max("total_venta").alias("venta_maxima"),
-        min("total_venta").alias("venta_minima")
-    ).first()
-    results["estadisticas_generales"] = {
-        "total_ventas": int(stats["total_ventas"]),
-        "ingresos_totales": float(stats["ingresos_totales"]),
-        "ticket_promedio": float(stats["ticket_promedio"]),
-        "venta_maxima": float(stats["venta_maxima"]),
-        "venta_minima": float(stats["venta_minima"])
-    }
-
-    print("✅ Análisis completado correctamente.")
+        # 6️⃣ Top 10 productos
+        with _etapa(tiempos, "top_productos"):
+            try:
+                # Expandimos el array de productos en filas individuales
+                productos_limpios = (
+                    ventas_df.select(explode(col("productos")).alias("producto"))
+                    .select(
+                        col("producto.nombre").alias("nombre_producto"),
+                        col("producto.cantidad").alias("cantidad"),
+                        col("producto.precio").alias("precio")
+                    )
+                )
+
+                # Agrupamos los productos
+                top_productos = (
+                    productos_limpios.groupBy("nombre_producto")
+                    .agg(
+                        sum("cantidad").alias("total_vendido"),
+                        sum(col("precio") * col("cantidad")).alias("ingresos_totales")
+                    )
+                    .orderBy(desc("total_vendido"))
+                    .limit(10)
+                )
+
+                # Convertimos los resultados a formato JSON
+                results["top_10_productos"] = [
+                    {
+                        "nombre": row["nombre_producto"],
+                        "total_vendido": int(row["total_vendido"]),
+                        "ingresos_totales": float(row["ingresos_totales"])
+                    }
+                    for row in top_productos.collect()
+                ]
+
+            except Exception as e:
+                results["top_10_productos"] = {"error": str(e)}
+
+        # 7️⃣ Top 10 clientes
+        with _etapa(tiempos, "top_clientes"):
+            top_clientes = (
+                ventas_df.groupBy("nombre")
+                .agg(sum("total_venta").alias("gasto_total"), count("_id").alias("compras"))
+                .orderBy(desc("gasto_total"))
+                .limit(10)
+            )
+            for row in top_clientes.collect():
+                results["top_10_clientes"].append({
+                    "nombre": row["nombre"],
+                    "gasto_total": float(row["gasto_total"]),
+                    "compras": int(row["compras"])
+                })
+    finally:
+        ventas_df.unpersist()
+
+    tiempos["total"] = round((time.perf_counter() - inicio_total) * 1000, 1)
+    print(f"✅ Análisis completado correctamente. Tiempos (ms): {tiempos}")
     return results
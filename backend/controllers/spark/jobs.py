@@ -0,0 +1,153 @@
+"""
+Ejecución asíncrona de run_spark_analysis con deduplicación y caché de resultados.
+
+ - submit_analysis(db): encola un análisis (o reutiliza el que ya está en curso / en caché)
+ - get_job(job_id): estado y resultado de un job
+
+Los jobs corren en un pool acotado (SPARK_MAX_JOBS, por defecto 1) para no lanzar más de N jobs
+de Spark a la vez. El resultado se cachea SPARK_RESULT_TTL segundos (por defecto 600) bajo una
+versión de datos: el _id de la última venta, el número de ventas y el updated_at más reciente
+(índice idx_ventas_updated_at). Un insert, un borrado, una edición o una anulación cambian la
+versión y el siguiente submit recalcula. El estado vive en memoria del proceso.
+
+wait_result espera como mucho SPARK_WAIT_S segundos (por defecto 120); el job sigue corriendo y
+se consulta con get_job.
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from .analysis import run_spark_analysis
+
+try:
+    MAX_JOBS = max(1, int(os.environ.get("SPARK_MAX_JOBS", "1")))
+except ValueError:
+    MAX_JOBS = 1
+try:
+    RESULT_TTL = int(os.environ.get("SPARK_RESULT_TTL", "600"))
+except ValueError:
+    RESULT_TTL = 600
+try:
+    WAIT_S = float(os.environ.get("SPARK_WAIT_S", "120"))
+except ValueError:
+    WAIT_S = 120.0
+
+_executor = ThreadPoolExecutor(max_workers=MAX_JOBS, thread_name_prefix="spark_job")
+_lock = threading.Lock()
+_jobs = {}          # job_id -> dict con estado
+_in_flight = {}     # data_version -> job_id
+_cache = {}         # data_version -> (expires_at, result)
+
+
+def data_version(db) -> str:
+    """
+    Marca de versión de 'ventas': cambia al insertar (último _id), borrar (número de ventas) o
+    editar/anular (updated_at más reciente; update y anular_venta lo fijan).
+    """
+    ventas = db["ventas"]
+    ultimo = ventas.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+    if not ultimo:
+        return "vacio"
+    editada = ventas.find_one({"updated_at": {"$type": "date"}}, {"updated_at": 1}, sort=[("updated_at", -1)])
+    updated = editada["updated_at"].isoformat() if editada else None
+    return f"{ultimo['_id']}:{ventas.estimated_document_count()}:{updated}"
+
+
+def _public(job, include_result=True):
+    out = {k: v for k, v in job.items() if k not in ("future", "result", "finished_ts")}
+    if include_result and job["estado"] == "completado":
+        out["result"] = job["result"]
+    return out
+
+
+def _prune(now):
+    """Descarta jobs terminados y entradas de caché vencidas."""
+    for version in [v for v, (exp, _) in _cache.items() if exp <= now]:
+        _cache.pop(version, None)
+    for job_id in [j for j, job in _jobs.items()
+                   if job.get("finished_ts") and now - job["finished_ts"] > RESULT_TTL]:
+        _jobs.pop(job_id, None)
+
+
+def _run(job_id, version):
+    with _lock:
+        job = _jobs[job_id]
+        job["estado"] = "ejecutando"
+        job["started_at"] = datetime.utcnow().isoformat()
+    try:
+        result = run_spark_analysis()
+        with _lock:
+            job["estado"] = "completado"
+            job["result"] = result
+            _cache[version] = (time.time() + RESULT_TTL, result)
+        return result
+    except Exception as e:
+        with _lock:
+            job["estado"] = "error"
+            job["error"] = str(e)
+        raise
+    finally:
+        with _lock:
+            job["finished_at"] = datetime.utcnow().isoformat()
+            job["finished_ts"] = time.time()
+            _in_flight.pop(version, None)
+
+
+def submit_analysis(db, force: bool = False) -> dict:
+    """
+    Encola un análisis de Spark y devuelve el job (dict interno, con 'future').
+      - si hay resultado en caché para la versión actual, devuelve un job ya completado
+      - si hay un job en curso para la misma versión, devuelve ese mismo job
+      - force=True ignora la caché (pero sigue deduplicando jobs en curso)
+    """
+    version = data_version(db)
+    now = time.time()
+    with _lock:
+        _prune(now)
+        if not force and version in _cache:
+            expires_at, result = _cache[version]
+            job_id = uuid.uuid4().hex
+            job = {
+                "job_id": job_id, "estado": "completado", "version": version, "cache": True,
+                "created_at": datetime.utcnow().isoformat(), "finished_at": datetime.utcnow().isoformat(),
+                "finished_ts": now, "result": result, "future": None,
+            }
+            _jobs[job_id] = job
+            return job
+
+        if version in _in_flight:
+            return _jobs[_in_flight[version]]
+
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id, "estado": "pendiente", "version": version, "cache": False,
+            "created_at": datetime.utcnow().isoformat(), "future": None,
+        }
+        _jobs[job_id] = job
+        _in_flight[version] = job_id
+        job["future"] = _executor.submit(_run, job_id, version)
+        return job
+
+
+def wait_result(job, timeout=WAIT_S):
+    """
+    Espera el resultado de un job devuelto por submit_analysis. Si no termina en 'timeout'
+    segundos lanza TimeoutError (el job sigue en curso).
+    """
+    if job.get("future") is None:
+        return job["result"]
+    return job["future"].result(timeout=timeout)
+
+
+def get_job(job_id):
+    with _lock:
+        job = _jobs.get(job_id)
+        return _public(job) if job else None
+
+
+def public_job(job, include_result=True):
+    with _lock:
+        return _public(job, include_result=include_result)
@@ -0,0 +1,499 @@
+"""
+Agregados materializados (rollups) de 'ventas' para /api/analisis.
+
+Mantiene en MongoDB:
+ - analisis_dia:      _id = "YYYY-MM-DD" -> total_vendido, cantidad_ventas
+ - analisis_producto: _id = nombre       -> total_vendido (unidades), ingresos_totales
+ - analisis_cliente:  _id = cliente_ref  -> gasto_total, compras
+ - analisis_area:     _id = area_nombre  -> total_vendido, unidades
+ - analisis_meta:     _id = "ventas"     -> count/sum/max/min de total y rango de fechas
+
+Funciones:
+ - refresh_rollups(db): incorpora las ventas que todavía no están en los rollups (server-side
+   con $merge)
+ - registrar_venta_rollups(db, venta, signo=1, session=None): suma (o resta con signo=-1) una
+   venta ya incorporada; la llama checkout.registrar_agregados al editar, borrar o anular
+ - asegurar_rollups(db): índice de 'en_rollups' y, si nunca se construyeron, reconstrucción en
+   segundo plano (main.py la llama al arrancar)
+ - rebuild_rollups(db, modo="mongo"|"spark"): reconstrucción completa para reconciliar
+ - build_analysis_from_rollups(db): respuesta con la misma forma que run_spark_analysis
+
+Cada venta incorporada lleva en 'en_rollups' el lote en que se contó. refresh_rollups marca de una
+vez las ventas sin marca con un lote nuevo y agrega solo ese lote: no depende del orden de los
+_id (ObjectId de procesos distintos en el mismo segundo, lotes sembrados fuera de orden), así que
+una venta que se confirma tarde con un _id menor entra en el siguiente refresh. Las ventas
+anuladas no se cuentan, igual que en ventas_diarias y reportes.
+
+Las ediciones, borrados y anulaciones de ventas ya marcadas se aplican al momento con
+registrar_venta_rollups; las que aún no tienen marca no se tocan (el refresh las cuenta con su
+estado de ese momento). Una edición que coincide con el refresh que está marcando esa misma venta
+puede quedar contada a medias; rebuild_rollups lo corrige. Con deltas, max/min de total y el
+rango de fechas solo crecen: borrar la venta máxima no los baja hasta reconstruir.
+
+Cada lote se aplica de forma idempotente: antes de marcar se guarda en analisis_meta como
+'pendiente' y cada documento de los rollups (y los escalares de meta) guarda en '_rango' el
+último lote que sumó. Si un refresh falla a mitad, el siguiente reagrega exactamente ese lote y
+los $merge saltan los documentos que ya lo tienen, sin contar dos veces.
+
+Refresh y rebuild se excluyen con un lease (lock_until + lock_owner) que el dueño renueva mientras
+trabaja y que solo él puede soltar.
+"""
+import datetime
+import json
+import threading
+import time
+from bson import ObjectId
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from ..puntoVenta.ventas_diarias import reconstruir_en_segundo_plano
+
+ROLLUP_DIA = "analisis_dia"
+ROLLUP_PRODUCTO = "analisis_producto"
+ROLLUP_CLIENTE = "analisis_cliente"
+ROLLUP_AREA = "analisis_area"
+ROLLUP_META = "analisis_meta"
+META_ID = "ventas"
+MARCA = "en_rollups"
+
+# Lease para que dos procesos (workers) no incorporen el mismo lote dos veces; el dueño lo
+# renueva cada LOCK_SECONDS / 3 mientras trabaja (un rebuild con Spark puede tardar más)
+LOCK_SECONDS = 300
+
+# Misma clave de día que Spark: los 10 primeros caracteres de 'fecha'
+_DIA_EXPR = {"$substrBytes": [{"$toString": "$fecha"}, 0, 10]}
+_NO_ANULADA = {"estado": {"$ne": "anulada"}}
+
+_construido = threading.Event()
+
+
+def _dia(fecha):
+    """Lo mismo que _DIA_EXPR para una venta en memoria."""
+    if isinstance(fecha, datetime.datetime):
+        return fecha.strftime("%Y-%m-%d")
+    return "" if fecha is None else str(fecha)[:10]
+
+
+def _merge_sumando(coll, campos, rango):
+    """
+    Etapas que marcan los grupos con 'rango' y los suman con $merge a los documentos existentes
+    (o los insertan). Un documento que ya tiene ese _rango no se vuelve a sumar (reintento).
+    """
+    ya_sumado = {"$eq": ["$_rango", "$$new._rango"]}
+    return [
+        {"$set": {"_rango": {"$literal": rango}}},
+        {"$merge": {
+            "into": coll,
+            "on": "_id",
+            "whenMatched": [{"$set": {
+                **{c: {"$cond": [ya_sumado, f"${c}", {"$add": [{"$ifNull": [f"${c}", 0]}, f"$$new.{c}"]}]}
+                   for c in campos},
+                "_rango": "$$new._rango",
+            }}],
+            "whenNotMatched": "insert",
+        }},
+    ]
+
+
+def _pipelines(match, rango):
+    """Pipelines de agregación por rollup para las ventas que cumplen 'match'."""
+    return {
+        ROLLUP_DIA: [
+            {"$match": match},
+            {"$group": {"_id": _DIA_EXPR, "total_vendido": {"$sum": "$total"}, "cantidad_ventas": {"$sum": 1}}},
+            *_merge_sumando(ROLLUP_DIA, ["total_vendido", "cantidad_ventas"], rango),
+        ],
+        ROLLUP_PRODUCTO: [
+            {"$match": match},
+            {"$project": {"productos.nombre": 1, "productos.cantidad": 1, "productos.precio": 1}},
+            {"$unwind": "$productos"},
+            {"$group": {
+                "_id": "$productos.nombre",
+                "total_vendido": {"$sum": "$productos.cantidad"},
+                "ingresos_totales": {"$sum": {"$multiply": ["$productos.precio", "$productos.cantidad"]}},
+            }},
+            *_merge_sumando(ROLLUP_PRODUCTO, ["total_vendido", "ingresos_totales"], rango),
+        ],
+        ROLLUP_CLIENTE: [
+            {"$match": match},
+            {"$group": {"_id": "$cliente_ref", "gasto_total": {"$sum": "$total"}, "compras": {"$sum": 1}}},
+            *_merge_sumando(ROLLUP_CLIENTE, ["gasto_total", "compras"], rango),
+        ],
+        ROLLUP_AREA: [
+            {"$match": match},
+            {"$project": {"productos.area_nombre": 1, "productos.subtotal": 1, "productos.cantidad": 1}},
+            {"$unwind": "$productos"},
+            {"$group": {
+                "_id": "$productos.area_nombre",
+                "total_vendido": {"$sum": "$productos.subtotal"},
+                "unidades": {"$sum": "$productos.cantidad"},
+            }},
+            *_merge_sumando(ROLLUP_AREA, ["total_vendido", "unidades"], rango),
+        ],
+    }
+
+
+# --- Lease ---
+
+def _acquire_lock(db):
+    """Toma el lease; devuelve el token del dueño o None si lo tiene otro proceso."""
+    now = datetime.datetime.utcnow()
+    token = ObjectId()
+    try:
+        db[ROLLUP_META].update_one(
+            {"_id": META_ID, "$or": [{"lock_until": {"$exists": False}}, {"lock_until": {"$lt": now}}]},
+            {"$set": {"lock_until": now + datetime.timedelta(seconds=LOCK_SECONDS), "lock_owner": token}},
+            upsert=True,
+        )
+        return token
+    except DuplicateKeyError:
+        # el documento existe y el lease está tomado por otro proceso
+        return None
+
+
+def _renew_lock(db, token, parar):
+    """Hilo: extiende el lease mientras el dueño trabaja; termina si otro se lo quedó."""
+    while not parar.wait(LOCK_SECONDS / 3):
+        res = db[ROLLUP_META].update_one(
+            {"_id": META_ID, "lock_owner": token},
+            {"$set": {"lock_until": datetime.datetime.utcnow() + datetime.timedelta(seconds=LOCK_SECONDS)}},
+        )
+        if not res.matched_count:
+            return
+
+
+def _release_lock(db, token):
+    # solo el dueño: si el lease venció y lo tomó otro proceso, no se lo quita
+    db[ROLLUP_META].update_one({"_id": META_ID, "lock_owner": token},
+                               {"$unset": {"lock_until": "", "lock_owner": ""}})
+
+
+def _con_lease(db, trabajo):
+    """Ejecuta trabajo(token) con el lease tomado y renovado; None si lo tiene otro proceso."""
+    token = _acquire_lock(db)
+    if token is None:
+        return None
+    parar = threading.Event()
+    threading.Thread(target=_renew_lock, args=(db, token, parar), daemon=True, name="rollups_lease").start()
+    try:
+        return trabajo(token)
+    finally:
+        parar.set()
+        _release_lock(db, token)
+
+
+# --- Incorporación ---
+
+def _aplicar_lote(db, match, lote):
+    """
+    Agrega las ventas que cumplen 'match' en los rollups y en los escalares de analisis_meta.
+    Idempotente para un mismo lote (ver _rango).
+    """
+    ventas = db["ventas"]
+    for pipeline in _pipelines(match, lote).values():
+        ventas.aggregate(pipeline, allowDiskUse=True)
+
+    escalares = list(ventas.aggregate([
+        {"$match": match},
+        {"$group": {
+            "_id": None,
+            "count": {"$sum": 1},
+            "sum_total": {"$sum": "$total"},
+            "max_total": {"$max": "$total"},
+            "min_total": {"$min": "$total"},
+            "min_fecha": {"$min": _DIA_EXPR},
+            "max_fecha": {"$max": _DIA_EXPR},
+        }},
+    ], allowDiskUse=True))
+    if not escalares:
+        return 0
+    e = escalares[0]
+    # el filtro por _rango hace que un reintento del mismo lote no vuelva a sumar
+    db[ROLLUP_META].update_one(
+        {"_id": META_ID, "_rango": {"$ne": lote}},
+        {
+            "$inc": {"count": e["count"], "sum_total": e["sum_total"]},
+            "$max": {"max_total": e["max_total"], "max_fecha": e["max_fecha"]},
+            "$min": {"min_total": e["min_total"], "min_fecha": e["min_fecha"]},
+            "$set": {"_rango": lote},
+        },
+    )
+    return e["count"]
+
+
+def _match_lote(lote):
+    return {MARCA: lote, **_NO_ANULADA}
+
+
+def _refrescar(db, token):
+    meta = db[ROLLUP_META].find_one({"_id": META_ID}) or {}
+    incorporadas = 0
+    pendiente = meta.get("pendiente")
+    if pendiente is not None:
+        # un refresh anterior falló a mitad: terminar exactamente ese lote antes de seguir
+        incorporadas += _aplicar_lote(db, _match_lote(pendiente), pendiente)
+    lote = ObjectId()
+    db[ROLLUP_META].update_one({"_id": META_ID, "lock_owner": token}, {"$set": {"pendiente": lote}})
+    marcadas = db["ventas"].update_many({MARCA: None}, {"$set": {MARCA: lote}}).modified_count
+    if marcadas:
+        incorporadas += _aplicar_lote(db, _match_lote(lote), lote)
+    db[ROLLUP_META].update_one(
+        {"_id": META_ID, "lock_owner": token},
+        {"$set": {"updated_at": datetime.datetime.utcnow()}, "$unset": {"pendiente": ""}},
+    )
+    return incorporadas
+
+
+def refresh_rollups(db) -> dict:
+    """
+    Incorpora a los rollups las ventas que todavía no tienen 'en_rollups'.
+    Devuelve {"ok", "incorporadas", "elapsed_ms"}; si otro proceso está actualizando, no hace nada.
+    Si los rollups nunca se construyeron lanza la reconstrucción en segundo plano y devuelve
+    {"ok": False, "reconstruyendo": True}.
+    """
+    started = time.perf_counter()
+    if not asegurar_rollups(db):
+        return {"ok": False, "incorporadas": 0, "reconstruyendo": True,
+                "mensaje": "Los rollups se están construyendo"}
+    meta = db[ROLLUP_META].find_one({"_id": META_ID}, {"pendiente": 1}) or {}
+    if meta.get("pendiente") is None and db["ventas"].find_one({MARCA: None}, {"_id": 1}) is None:
+        return {"ok": True, "incorporadas": 0, "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+    incorporadas = _con_lease(db, lambda token: _refrescar(db, token))
+    if incorporadas is None:
+        return {"ok": False, "incorporadas": 0, "mensaje": "Actualización en curso en otro proceso"}
+    return {"ok": True, "incorporadas": incorporadas, "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+
+def registrar_venta_rollups(db, venta, signo=1, session=None):
+    """
+    Suma (o resta con signo=-1) una venta que ya está en los rollups. Una venta sin 'en_rollups'
+    (recién insertada o todavía no incorporada) no se toca: la cuenta el próximo refresh.
+    """
+    if not venta.get(MARCA):
+        return
+    total = float(venta.get("total") or 0)
+    por_producto, por_area = {}, {}
+    for linea in venta.get("productos") or []:
+        cantidad = linea.get("cantidad") or 0
+        p = por_producto.setdefault(linea.get("nombre"), [0, 0.0])
+        p[0] += cantidad * signo
+        p[1] += float(linea.get("precio") or 0) * cantidad * signo
+        a = por_area.setdefault(linea.get("area_nombre"), [0.0, 0])
+        a[0] += float(linea.get("subtotal") or 0) * signo
+        a[1] += cantidad * signo
+
+    db[ROLLUP_DIA].update_one({"_id": _dia(venta.get("fecha"))},
+                              {"$inc": {"total_vendido": total * signo, "cantidad_ventas": signo}},
+                              upsert=True, session=session)
+    db[ROLLUP_CLIENTE].update_one({"_id": venta.get("cliente_ref")},
+                                  {"$inc": {"gasto_total": total * signo, "compras": signo}},
+                                  upsert=True, session=session)
+    if por_producto:
+        db[ROLLUP_PRODUCTO].bulk_write([
+            UpdateOne({"_id": nombre}, {"$inc": {"total_vendido": v[0], "ingresos_totales": v[1]}}, upsert=True)
+            for nombre, v in por_producto.items()
+        ], ordered=False, session=session)
+        db[ROLLUP_AREA].bulk_write([
+            UpdateOne({"_id": area}, {"$inc": {"total_vendido": v[0], "unidades": v[1]}}, upsert=True)
+            for area, v in por_area.items()
+        ], ordered=False, session=session)
+    cambio = {"$inc": {"count": signo, "sum_total": total * signo}}
+    if signo > 0:
+        dia = _dia(venta.get("fecha"))
+        cambio["$max"] = {"max_total": total, "max_fecha": dia}
+        cambio["$min"] = {"min_total": total, "min_fecha": dia}
+    db[ROLLUP_META].update_one({"_id": META_ID}, cambio, session=session)
+
+
+def _reset_rollups(db):
+    for coll in (ROLLUP_DIA, ROLLUP_PRODUCTO, ROLLUP_CLIENTE, ROLLUP_AREA):
+        db[coll].drop()
+    db[ROLLUP_META].update_one(
+        {"_id": META_ID},
+        {"$unset": {"watermark": "", "count": "", "sum_total": "", "max_total": "", "min_total": "",
+                    "min_fecha": "", "max_fecha": "", "pendiente": "", "_rango": "", "reconstruido_at": ""}},
+    )
+
+
+def _rebuild_spark(db, lote):
+    """
+    Recalcula los rollups con Spark (todas las ventas ya marcadas, sin las anuladas) y los
+    sobrescribe. analisis_cliente se reconstruye server-side: el conector lee los ObjectId de
+    cliente_ref como strings y los _id dejarían de coincidir con 'clientes' y con los deltas.
+    """
+    from pyspark.sql.functions import col, count, explode, lit, max, min, sum
+    from .spark_config import get_spark_session
+
+    spark_session = get_spark_session()
+    if not spark_session:
+        raise Exception("No se pudo establecer la sesión de Spark.")
+
+    match = {MARCA: {"$ne": None}, **_NO_ANULADA}
+    ventas_df = (
+        spark_session.read.format("mongodb")
+        .option("database", db.name)
+        .option("collection", "ventas")
+        .option("aggregation.pipeline", json.dumps([{"$match": match}]))
+        .load()
+        .select("_id", "fecha", "total", "cliente_ref", "productos")
+        .withColumn("dia", col("fecha").cast("string").substr(1, 10))
+        .cache()
+    )
+
+    def _write(df, coll):
+        (df.write.format("mongodb")
+         .mode("overwrite")
+         .option("database", db.name)
+         .option("collection", coll)
+         .save())
+
+    try:
+        _write(ventas_df.groupBy(col("dia").alias("_id"))
+               .agg(sum("total").alias("total_vendido"), count(lit(1)).alias("cantidad_ventas")), ROLLUP_DIA)
+        db["ventas"].aggregate(_pipelines(match, lote)[ROLLUP_CLIENTE], allowDiskUse=True)
+
+        items = ventas_df.select(explode("productos").alias("p")).select("p.*")
+        _write(items.groupBy(col("nombre").alias("_id"))
+               .agg(sum("cantidad").alias("total_vendido"),
+                    sum(col("precio") * col("cantidad")).alias("ingresos_totales")), ROLLUP_PRODUCTO)
+        _write(items.groupBy(col("area_nombre").alias("_id"))
+               .agg(sum("subtotal").alias("total_vendido"), sum("cantidad").alias("unidades")), ROLLUP_AREA)
+
+        e = ventas_df.agg(
+            count(lit(1)).alias("count"), sum("total").alias("sum_total"),
+            max("total").alias("max_total"), min("total").alias("min_total"),
+            min("dia").alias("min_fecha"), max("dia").alias("max_fecha"),
+        ).first()
+    finally:
+        ventas_df.unpersist()
+
+    db[ROLLUP_META].update_one(
+        {"_id": META_ID},
+        {"$set": {
+            "count": int(e["count"] or 0), "sum_total": float(e["sum_total"] or 0),
+            "max_total": e["max_total"], "min_total": e["min_total"],
+            "min_fecha": e["min_fecha"], "max_fecha": e["max_fecha"], "_rango": lote,
+        }},
+        upsert=True,
+    )
+
+
+def _reconstruir(db, token, modo):
+    _reset_rollups(db)
+    # todas las ventas quedan marcadas; las que entren después las toma el próximo refresh
+    lote = ObjectId()
+    db["ventas"].update_many({MARCA: None}, {"$set": {MARCA: lote}})
+    if modo == "spark":
+        _rebuild_spark(db, lote)
+    else:
+        _aplicar_lote(db, {MARCA: {"$ne": None}, **_NO_ANULADA}, lote)
+    ahora = datetime.datetime.utcnow()
+    db[ROLLUP_META].update_one(
+        {"_id": META_ID, "lock_owner": token},
+        {"$set": {"updated_at": ahora, "reconstruido_at": ahora, "rebuild_mode": modo}},
+    )
+    _construido.set()
+    return True
+
+
+def rebuild_rollups(db, modo: str = "mongo") -> dict:
+    """
+    Reconstruye todos los rollups desde cero (reconciliación).
+      - modo="mongo": una pasada de agregación server-side sobre toda la colección
+      - modo="spark": recalcula con Spark (mismo conector que run_spark_analysis) y sobrescribe
+    Como reconstruir_reportes, las ventas editadas mientras corre pueden quedar mal contadas;
+    lanzarla con el POS quieto.
+    """
+    if modo not in ("mongo", "spark"):
+        raise ValueError("modo debe ser 'mongo' o 'spark'")
+    started = time.perf_counter()
+    if _con_lease(db, lambda token: _reconstruir(db, token, modo)) is None:
+        return {"ok": False, "mensaje": "Actualización en curso en otro proceso"}
+    return {"ok": True, "modo": modo, "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+
+def asegurar_rollups(db):
+    """
+    Índice de la marca (las ventas sin marca se buscan por él) y, si los rollups nunca se
+    construyeron, reconstrucción en segundo plano. Devuelve True si ya están construidos.
+    """
+    if not _construido.is_set():
+        db["ventas"].create_index([(MARCA, ASCENDING)], name="idx_ventas_en_rollups")
+    return reconstruir_en_segundo_plano(db, META_ID, _construido, rebuild_rollups)
+
+
+def build_analysis_from_rollups(db) -> dict:
+    """
+    Construye la respuesta de /api/analisis leyendo solo los rollups.
+    Devuelve el mismo formato que run_spark_analysis (más 'ventas_por_area' y 'fuente').
+    """
+    started = time.perf_counter()
+    meta = db[ROLLUP_META].find_one({"_id": META_ID}) or {}
+    total_ventas = int(meta.get("count") or 0)
+    if total_ventas == 0:
+        raise Exception("No se encontraron ventas en la colección.")
+
+    sum_total = float(meta.get("sum_total") or 0.0)
+    num_dias = db[ROLLUP_DIA].estimated_document_count()
+
+    results = {
+        "fecha_analisis": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "total_ventas": total_ventas,
+        "rango_fechas": {
+            "desde": meta.get("min_fecha") or "N/A",
+            "hasta": meta.get("max_fecha") or "N/A"
+        },
+        "dia_mas_ventas": {},
+        "promedios": {
+            "venta_promedio": sum_total / total_ventas,
+            "ventas_por_dia": (total_ventas / num_dias) if num_dias else None
+        },
+        "top_10_productos": [],
+        "top_10_clientes": [],
+        "ventas_por_area": [],
+        "estadisticas_generales": {
+            "total_ventas": total_ventas,
+            "ingresos_totales": sum_total,
+            "ticket_promedio": sum_total / total_ventas,
+            "venta_maxima": float(meta.get("max_total") or 0.0),
+            "venta_minima": float(meta.get("min_total") or 0.0)
+        },
+        "fuente": "rollups",
+        "actualizado": meta.get("updated_at").isoformat() if meta.get("updated_at") else None,
+    }
+
+    top_dia = db[ROLLUP_DIA].find_one({}, sort=[("total_vendido", -1)])
+    if top_dia:
+        results["dia_mas_ventas"] = {
+            "fecha": top_dia["_id"],
+            "total_vendido": float(top_dia["total_vendido"]),
+            "cantidad_ventas": int(top_dia["cantidad_ventas"])
+        }
+
+    for row in db[ROLLUP_PRODUCTO].find().sort("total_vendido", -1).limit(10):
+        results["top_10_productos"].append({
+            "nombre": row["_id"],
+            "total_vendido": int(row["total_vendido"]),
+            "ingresos_totales": float(row["ingresos_totales"])
+        })
+
+    top_clientes = list(db[ROLLUP_CLIENTE].find().sort("gasto_total", -1).limit(10))
+    refs = [c["_id"] for c in top_clientes if c["_id"] is not None]
+    nombres = {c["_id"]: c.get("nombre") for c in db["clientes"].find({"_id": {"$in": refs}}, {"nombre": 1})}
+    for row in top_clientes:
+        results["top_10_clientes"].append({
+            "nombre": nombres.get(row["_id"]),
+            "gasto_total": float(row["gasto_total"]),
+            "compras": int(row["compras"])
+        })
+
+    for row in db[ROLLUP_AREA].find().sort("total_vendido", -1):
+        results["ventas_por_area"].append({
+            "area": row["_id"],
+            "total_vendido": float(row["total_vendido"]),
+            "unidades": int(row["unidades"])
+        })
+
+    results["tiempos_ms"] = {"total": round((time.perf_counter() - started) * 1000, 1)}
+    return results
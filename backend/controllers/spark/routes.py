@@ -1,6 +1,10 @@
-from flask import Blueprint, jsonify
+from concurrent.futures import TimeoutError as FuturesTimeout
+
+from flask import Blueprint, jsonify, request
+from db.conexion import get_db
 # --- Import relativo actualizado ---
-from .analysis import run_spark_analysis
+from .jobs import submit_analysis, wait_result, get_job, public_job
+from .rollups import refresh_rollups, rebuild_rollups, build_analysis_from_rollups
 
 # Creamos un Blueprint. Esto nos permite definir rutas en un archivo separado
 # y luego "registrarlas" en nuestra app principal (app.py).
@@ -9,13 +13,82 @@ api_bp = Blueprint('api', __name__)
 @api_bp.route("/analisis", methods=["GET"])
 def api_analisis():
     """
-    Endpoint principal que ejecuta el análisis de Spark y devuelve los resultados.
+    Endpoint principal del análisis de ventas.
+    Por defecto responde desde los rollups materializados (incorporando antes
+    las ventas nuevas); con ?fuente=spark ejecuta el pipeline completo de Spark
+    a través del pool de jobs (comparte caché y jobs en curso); si no termina en
+    SPARK_WAIT_S segundos responde 202 con el job para consultarlo después.
     """
     try:
-        # Llama a la función de lógica de negocio desde analysis.py
-        resultados = run_spark_analysis()
+        db = get_db()
+        if db is None:
+            return jsonify({"error": "DB no disponible"}), 500
+
+        if request.args.get("fuente") == "spark":
+            job = submit_analysis(db)
+            try:
+                resultados = wait_result(job)
+            except FuturesTimeout:
+                # no retener el hilo de Flask: el job sigue y se consulta en /analisis/jobs/<job_id>
+                return jsonify(public_job(job, include_result=False)), 202
+            return jsonify(resultados), 200
+
+        refresh = refresh_rollups(db)
+        if refresh.get("reconstruyendo"):
+            return jsonify({"error": "Los rollups se están construyendo; reintentar en unos segundos"}), 503
+        resultados = build_analysis_from_rollups(db)
+        resultados["refresh"] = refresh
         return jsonify(resultados), 200
     except Exception as e:
         # Manejo de errores centralizado
         print(f"Error en el endpoint /analisis: {str(e)}")
         return jsonify({"error": str(e)}), 500
+
+
+@api_bp.route("/analisis/rollups/rebuild", methods=["POST"])
+def api_rebuild_rollups():
+    """
+    Reconstruye los rollups desde cero para reconciliar.
+    ?modo=spark usa el conector de Spark; ?modo=mongo (por defecto) agrega en el servidor.
+    """
+    try:
+        db = get_db()
+        if db is None:
+            return jsonify({"error": "DB no disponible"}), 500
+        res = rebuild_rollups(db, modo=request.args.get("modo", "mongo"))
+        return jsonify(res), (200 if res.get("ok") else 409)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Error en el endpoint /analisis/rollups/rebuild: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+@api_bp.route("/analisis/jobs", methods=["POST"])
+def api_encolar_analisis():
+    """
+    Encola un análisis de Spark y responde de inmediato con el job.
+    Si el resultado para la versión actual de los datos está en caché, el job ya viene completado.
+    ?force=1 ignora la caché.
+    """
+    try:
+        db = get_db()
+        if db is None:
+            return jsonify({"error": "DB no disponible"}), 500
+        job = submit_analysis(db, force=request.args.get("force") == "1")
+        data = public_job(job, include_result=False)
+        return jsonify(data), (200 if data["estado"] == "completado" else 202)
+    except Exception as e:
+        print(f"Error en el endpoint /analisis/jobs: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+@api_bp.route("/analisis/jobs/<job_id>", methods=["GET"])
+def api_estado_analisis(job_id):
+    """
+    Estado de un job de análisis; incluye 'result' cuando está completado.
+    """
+    job = get_job(job_id)
+    if not job:
+        return jsonify({"error": "Job no encontrado"}), 404
+    return jsonify(job), 200
@@ -5,6 +5,7 @@ Funciones puras que reciben get_db_callable o Database y payload dict.
 Validan con models.ventas_model.VentaCreate y retornan dict serializable.
 Si no viene total se calcula a partir de los items.
 Se intenta conservar referencia cliente_id si es válido ObjectId.
+La venta se suma a ventas_diarias y a los reportes top-N igual que las del punto de venta.
 """
 from typing import Callable, Dict, Any, Optional, List
 from datetime import datetime
@@ -14,6 +15,7 @@ from bson import ObjectId
 from decimal import Decimal
 
 from ...models.ventas_model import VentaCreate, VentaItem
+from ..puntoVenta.checkout import registrar_agregados
 
 class SaleError(ValueError):
     pass
@@ -100,4 +102,5 @@ def create_sale(db_or_callable: Callable[[], Database] | Database, payload: Dict
 
     res = ventas_col.insert_one(doc)
     doc["_id"] = res.inserted_id
+    registrar_agregados(db, doc)
     return _serialize_doc(doc)
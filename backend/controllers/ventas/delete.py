@@ -7,6 +7,8 @@ from typing import Callable
 from pymongo.database import Database
 from bson import ObjectId
 
+from ..puntoVenta.checkout import registrar_agregados
+
 class SaleError(ValueError):
     pass
 
@@ -26,5 +28,10 @@ def delete_sale(db_or_callable: Callable[[], Database] | Database, sale_id: str)
         _id = ObjectId(sale_id)
     except Exception:
         raise SaleError("sale_id inválido")
-    res = ventas_col.delete_one({"_id": _id})
-    return res.deleted_count == 1
+    venta = ventas_col.find_one_and_delete({"_id": _id})
+    if venta is None:
+        return False
+    if venta.get("estado") != "anulada":
+        # la venta deja de contar en ventas_diarias y en los reportes top-N
+        registrar_agregados(db, venta, signo=-1)
+    return True
@@ -5,6 +5,8 @@ Valida payload contra models.ventas_model.VentaUpdate.
 Permite actualizar productos, total, estado, metodo_pago y vendedor_key.
 Si se actualizan productos y no viene total, se recalcula.
 Retorna documento actualizado serializado.
+Si cambian total, productos o estado se ajustan ventas_diarias y los reportes top-N: se descuenta
+la venta anterior y se suma la nueva (una venta anulada no cuenta).
 """
 from typing import Callable, Dict, Any, Optional, List
 from datetime import datetime
@@ -12,8 +14,13 @@ from pymongo.database import Database
 from pydantic import ValidationError
 from bson import ObjectId
 from decimal import Decimal
+from pymongo import ReturnDocument
 
 from ...models.ventas_model import VentaUpdate, VentaItem
+from ..puntoVenta.checkout import registrar_agregados
+
+# Campos que cambian lo que la venta aporta a los agregados
+_CAMPOS_AGREGADOS = ("total", "productos", "estado")
 
 class SaleError(ValueError):
     pass
@@ -79,8 +86,16 @@ def update_sale(db_or_callable: Callable[[], Database] | Database, sale_id: str,
 
     update_doc["updated_at"] = datetime.utcnow()
 
-    res = ventas_col.find_one_and_update({"_id": _id}, {"$set": update_doc}, return_document=True)
-    if not res:
+    anterior = ventas_col.find_one_and_update({"_id": _id}, {"$set": update_doc},
+                                              return_document=ReturnDocument.BEFORE)
+    if not anterior:
         raise SaleError("Venta no encontrada")
+    res = {**anterior, **update_doc}
+
+    if any(c in update_doc for c in _CAMPOS_AGREGADOS):
+        if anterior.get("estado") != "anulada":
+            registrar_agregados(db, anterior, signo=-1)
+        if res.get("estado") != "anulada":
+            registrar_agregados(db, res)
 
     return _serialize_doc(res)
@@ -1,14 +1,227 @@
-from pymongo import MongoClient
+import os
+import threading
+from pymongo import MongoClient, monitoring
+from pymongo.read_preferences import ReadPreference
+
+# -----------------------
+# Configuración (variables de entorno)
+# -----------------------
+MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017/")
+MONGO_DB_NAME = os.environ.get("MONGO_DB_NAME", "superpancho_db")
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+# Modos de read preference aceptados en MONGO_READ_PREFERENCE
+_READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primarypreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondarypreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+
+class _PoolStatsListener(monitoring.ConnectionPoolListener):
+    """
+    Listener de eventos del pool de pymongo.
+    Acumula checkouts, checkins, fallos y tiempos de espera para dimensionar
+    el pool según el número de workers (gunicorn).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.connections_created = 0
+            self.connections_closed = 0
+            self.checkouts_started = 0
+            self.checkouts = 0
+            self.checkins = 0
+            self.checkout_failures = {}
+            self.wait_total_ms = 0.0
+            self.wait_max_ms = 0.0
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "connections_created": self.connections_created,
+                "connections_closed": self.connections_closed,
+                "connections_open": self.connections_created - self.connections_closed,
+                "checkouts_started": self.checkouts_started,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "checked_out": self.checkouts - self.checkins,
+                "checkout_failures": dict(self.checkout_failures),
+                "wait_avg_ms": (self.wait_total_ms / self.checkouts) if self.checkouts else 0.0,
+                "wait_max_ms": self.wait_max_ms,
+            }
+
+    def _add_wait(self, event):
+        # pymongo >= 4.7 expone 'duration' (segundos) en los eventos de checkout
+        duration = getattr(event, "duration", None)
+        if duration is None:
+            return
+        ms = float(duration) * 1000.0
+        self.wait_total_ms += ms
+        if ms > self.wait_max_ms:
+            self.wait_max_ms = ms
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_closed += 1
+
+    def connection_check_out_started(self, event):
+        with self._lock:
+            self.checkouts_started += 1
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            reason = str(getattr(event, "reason", "unknown"))
+            self.checkout_failures[reason] = self.checkout_failures.get(reason, 0) + 1
+            self._add_wait(event)
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checkouts += 1
+            self._add_wait(event)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checkins += 1
+
+
+# -----------------------
+# Cliente compartido por proceso
+# -----------------------
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+_pool_stats = _PoolStatsListener()
+
+
+def _client_options():
+    """Opciones del MongoClient leídas del entorno."""
+    opts = {
+        "maxPoolSize": _env_int("MONGO_MAX_POOL_SIZE", 50),
+        "minPoolSize": _env_int("MONGO_MIN_POOL_SIZE", 0),
+        "waitQueueTimeoutMS": _env_int("MONGO_WAIT_QUEUE_TIMEOUT_MS", 10000),
+        "serverSelectionTimeoutMS": _env_int("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000),
+        "event_listeners": [_pool_stats],
+    }
+    compressors = os.environ.get("MONGO_COMPRESSORS", "").strip()
+    if compressors:
+        opts["compressors"] = compressors
+    read_pref = os.environ.get("MONGO_READ_PREFERENCE", "").strip().lower()
+    if read_pref in _READ_PREFERENCES:
+        opts["read_preference"] = _READ_PREFERENCES[read_pref]
+    return opts
+
+
+def _despues_de_fork():
+    """
+    En el hijo de un fork: locks nuevos y sin cliente heredado. Si el padre tenía otros hilos
+    (Flask, crear_db_worker) alguno pudo dejar tomado _client_lock o el lock del listener, y
+    el hijo se quedaría bloqueado para siempre en get_client().
+    """
+    global _client, _client_pid, _client_lock
+    _client_lock = threading.Lock()
+    _pool_stats._lock = threading.Lock()
+    # el MongoClient del padre no es fork-safe: no se usa ni se cierra en el hijo
+    _client = None
+    _client_pid = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_despues_de_fork)
+
+
+def get_client():
+    """
+    Devuelve el MongoClient compartido del proceso (lo crea la primera vez).
+    Si el proceso fue forkeado (gunicorn con preload), se crea un cliente nuevo
+    porque MongoClient no es fork-safe.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+    with _client_lock:
+        if _client is None or _client_pid != pid:
+            _client = MongoClient(MONGO_URI, **_client_options())
+            _client_pid = pid
+            _pool_stats.reset()
+    return _client
+
 
 def get_db():
     try:
-        # Conexión local (puerto por defecto 27017)
-        client = MongoClient("mongodb://localhost:27017/")
+        # Reutilizamos el cliente (y su pool) compartido del proceso
+        client = get_client()
 
         # Seleccionamos la base de datos
-        db = client["superpancho_db"]
+        db = client[MONGO_DB_NAME]
 
         return db
     except Exception as e:
         print("Error al conectar con MongoDB:", e)
         return None
+
+
+def get_pool_stats():
+    """
+    Estado del cliente compartido: configuración efectiva del pool y contadores
+    de checkout/checkin y tiempos de espera desde que se creó el cliente.
+    """
+    opts = _client_options()
+    return {
+        "connected": _client is not None and _client_pid == os.getpid(),
+        "pid": os.getpid(),
+        "database": MONGO_DB_NAME,
+        "config": {
+            "maxPoolSize": opts["maxPoolSize"],
+            "minPoolSize": opts["minPoolSize"],
+            "waitQueueTimeoutMS": opts["waitQueueTimeoutMS"],
+            "compressors": opts.get("compressors"),
+            "read_preference": os.environ.get("MONGO_READ_PREFERENCE") or "primary",
+        },
+        "pool": _pool_stats.snapshot(),
+    }
+
+
+def close_client():
+    """Cierra el cliente compartido (usado al apagar la app)."""
+    global _client, _client_pid
+    with _client_lock:
+        if _client is not None:
+            try:
+                _client.close()
+            finally:
+                _client = None
+                _client_pid = None
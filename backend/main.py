@@ -13,11 +13,17 @@ load_dotenv()
 # -----------------------
 # Imports internos
 # -----------------------
-from db.conexion import get_db
+from db.conexion import get_db, close_client
 from controllers.regresion_lineal import bp as regresion_bp
 from controllers.regresion_lineal.actualiza_fecha_ordinal import run_migration
 from api import bp as api_bp  # Explorador /api interactivo
 from controllers.puntoVenta.punto_venta_controller import punto_venta
+from controllers.puntoVenta.catalogo_cache import iniciar_change_stream
+from controllers.puntoVenta.checkout import iniciar_reconciliador
+from controllers.puntoVenta.reportes import asegurar_reportes
+from controllers.puntoVenta.ventas_diarias import asegurar_ventas_diarias
+from controllers.spark.rollups import asegurar_rollups
+from controllers.db.backup_writer import asegurar_indices_delta
 from controllers.db.backup_controller import backup_bp
 
 # --- Spark ---
@@ -89,6 +95,27 @@ def start_background_migration():
 
 start_background_migration()
 
+# Invalidación del catálogo del POS por change stream (solo replica set; opcional)
+if os.environ.get("CATALOGO_CHANGE_STREAM", "0") == "1":
+    _db_catalogo = get_db()
+    if _db_catalogo is not None:
+        iniciar_change_stream(_db_catalogo, app.logger)
+
+# Stock de ventas que quedaron a medias (modo sin transacciones): al arrancar y periódicamente
+_db_reservas = get_db()
+if _db_reservas is not None:
+    iniciar_reconciliador(_db_reservas, app.logger)
+    # buckets diarios, reportes del POS y rollups de /api/analisis: la primera construcción corre
+    # en segundo plano, no en un GET
+    try:
+        asegurar_ventas_diarias(_db_reservas)
+        asegurar_reportes(_db_reservas)
+        asegurar_rollups(_db_reservas)
+    except Exception:
+        app.logger.exception("No se pudo lanzar la reconstrucción de ventas_diarias/reportes/rollups")
+    # índices de updated_at de los backups incrementales (bases que no pasaron por /crear_db)
+    asegurar_indices_delta(_db_reservas)
+
 # -----------------------
 # Hook global (CORS)
 # -----------------------
@@ -105,6 +132,7 @@ if __name__ == "__main__":
         # Inicializa Spark antes de levantar Flask
         get_spark_session()
         atexit.register(stop_spark)
+        atexit.register(close_client)
         port = int(os.environ.get("PORT", 5000))
         debug = os.environ.get("FLASK_DEBUG", "1") == "1"
         print(f"🌐 API unificada disponible en http://localhost:{port}")
@@ -1,5 +1,6 @@
 from db.conexion import get_db
 from pymongo import ReturnDocument
+from controllers.puntoVenta.catalogo_cache import invalidar_areas
 
 class AreaModel:
     def __init__(self):
@@ -21,7 +22,9 @@ class AreaModel:
     def create_area(self, data):
         # Generar id nuevo
         data["_id"] = self.get_next_id()
-        return self.collection.insert_one(data)
+        res = self.collection.insert_one(data)
+        invalidar_areas()
+        return res
 
     # Obtener todas
     def get_areas(self):
@@ -56,11 +59,15 @@ class AreaModel:
 
     # Actualizar
     def update_area(self, area_id, new_data):
-        return self.collection.update_one(
+        res = self.collection.update_one(
             {"_id": int(area_id)},
             {"$set": new_data}
         )
+        invalidar_areas()
+        return res
 
     # Eliminar
     def delete_area(self, area_id):
-        return self.collection.delete_one({"_id": int(area_id)})
\ No newline at end of file
+        res = self.collection.delete_one({"_id": int(area_id)})
+        invalidar_areas()
+        return res
\ No newline at end of file
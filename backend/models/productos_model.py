@@ -1,6 +1,7 @@
 from bson.objectid import ObjectId
 from datetime import datetime
 from db.conexion import get_db
+from controllers.puntoVenta.catalogo_cache import invalidar_productos
 
 
 class ProductoModel:
@@ -71,6 +72,7 @@ class ProductoModel:
         data["created_at"] = datetime.utcnow()
         data["activo"] = True  # Correcto
         result = self.collection.insert_one(data)
+        invalidar_productos()
         return str(result.inserted_id)
 
     def update(self, id, data):
@@ -81,6 +83,7 @@ class ProductoModel:
                 {"_id": ObjectId(id)},
                 {"$set": data}
             )
+            invalidar_productos()
             return result.modified_count > 0
         except:
             return False
@@ -92,6 +95,7 @@ class ProductoModel:
                 {"_id": ObjectId(id)},
                 {"$set": {"activo": False}}
             )
+            invalidar_productos()
             return result.modified_count > 0
         except:
             return False
\ No newline at end of file
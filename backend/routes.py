@@ -1,9 +1,10 @@
 # routes.py
 import os
+import time
 import logging
 import json
 import threading
-from flask import Blueprint, request, make_response, current_app
+from flask import Blueprint, request, make_response, current_app, Response, stream_with_context
 from bson import json_util
 from bson.objectid import ObjectId, InvalidId
 import gridfs
@@ -12,8 +13,12 @@ import jwt as pyjwt
 from jwt import ImmatureSignatureError, ExpiredSignatureError, InvalidTokenError
 
 # Imports internos que usan las rutas
-from db.conexion import get_db
-from controllers.db.crear_db_controller import crear_y_poblar_db, ProgressMonitor
+from db.conexion import get_db, get_pool_stats
+from controllers.db.crear_db_controller import crear_y_poblar_db, ProgressMonitor, CONFIG_REGISTROS
+from controllers.db.perfiles_datos import obtener_perfil
+from controllers.db import checkpoint_seed, progreso_registro
+from controllers.puntoVenta.ventas_diarias import reconstruir_ventas_diarias
+from controllers.puntoVenta.reportes import reconstruir_reportes
 from controllers.login.login_controller import login_user, AuthError, JWT_SECRET, JWT_ALGO
 
 # --- Blueprint ---
@@ -155,30 +160,71 @@ def crear_db():
     Inicia el proceso de creación y poblamiento en background.
     Devuelve totals inmediatamente para que el frontend pueda iniciar polling.
     Si ya hay un proceso en ejecución, devuelve 409 con los totals actuales.
+    Parámetro opcional 'perfil' (JSON o query: small, medium, 500k, 5M) para un poblamiento
+    reproducible con la semilla y distribución del perfil.
+    Con 'resume' (true) retoma el poblamiento cancelado o interrumpido desde sus checkpoints,
+    con el perfil con que se lanzó y sin borrar lo ya poblado (409 si no hay nada pendiente).
     """
     global _crear_db_thread
     try:
+        body = request.get_json(silent=True) or {}
+        nombre_perfil = body.get("perfil") or request.args.get("perfil")
+        reanudar = str(body.get("resume", request.args.get("resume", ""))).lower() in ("1", "true", "si", "yes")
+
         with _crear_db_lock:
             if _crear_db_thread and _crear_db_thread.is_alive():
                 totals = ProgressMonitor.counts_from_config()
                 return {"ok": False, "mensaje": "Proceso ya en ejecución", "totals": totals}, 409
 
+            if reanudar:
+                trabajo = checkpoint_seed.cargar(get_db())
+                if not checkpoint_seed.pendiente(trabajo):
+                    return {"ok": False, "mensaje": "No hay un poblamiento pendiente para reanudar"}, 409
+                nombre_perfil = trabajo.get("perfil")
+            try:
+                perfil = obtener_perfil(nombre_perfil) if nombre_perfil else None
+            except ValueError as e:
+                return {"ok": False, "error": str(e)}, 400
+
             def _worker():
                 try:
-                    crear_y_poblar_db(get_db)
+                    result = crear_y_poblar_db(get_db, perfil=nombre_perfil, reanudar=reanudar)
+                    if result.get("cancelado"):
+                        return
+                    # los datos sembrados no pasan por el POS: recalcular buckets diarios y reportes
+                    reconstruir_ventas_diarias(get_db())
+                    reconstruir_reportes(get_db())
                 except Exception as e:
                     logger.exception("Error en background crear_db: %s", e)
+                    checkpoint_seed.cerrar(get_db(), "error")
+                    progreso_registro.finalizar(f"Error: {e}", status="error")
 
+            # trabajo nuevo en el registro antes de arrancar: el primer /db/progreso ya lo ve
+            checkpoint_seed.cancelacion.clear()
+            ProgressMonitor.iniciar(perfil["registros"] if perfil else CONFIG_REGISTROS)
             _crear_db_thread = threading.Thread(target=_worker, daemon=True, name="crear_db_worker")
             _crear_db_thread.start()
 
             totals = ProgressMonitor.counts_from_config()
-            return {"ok": True, "mensaje": "Proceso iniciado", "totals": totals}, 202
+            return {"ok": True, "mensaje": "Proceso reanudado" if reanudar else "Proceso iniciado",
+                    "totals": totals, "perfil": nombre_perfil, "reanudado": reanudar}, 202
 
     except Exception as e:
         logger.exception("Error en /crear_db: %s", e)
         return {"error": str(e)}, 500
 
+@main_bp.route('/crear_db/cancel', methods=['POST'])
+def cancelar_crear_db():
+    """
+    Pide detener el poblamiento en curso. Se detiene entre lotes: los que están en vuelo
+    terminan y quedan en el checkpoint, así que luego se puede continuar con resume=true.
+    """
+    with _crear_db_lock:
+        if not (_crear_db_thread and _crear_db_thread.is_alive()):
+            return {"ok": False, "mensaje": "No hay un proceso en ejecución"}, 409
+        checkpoint_seed.solicitar_cancelacion()
+    return {"ok": True, "mensaje": "Cancelación solicitada"}, 202
+
 # -----------------------
 # Multimedia
 # -----------------------
@@ -250,3 +296,47 @@ def db_progreso():
     except Exception as e:
         logger.exception("Error en /db/progreso: %s", e)
         return {"error": str(e)}, 500
+
+SSE_HEARTBEAT_S = 15
+SSE_INTERVALO_MIN_S = 0.25   # como mucho 4 eventos por segundo aunque haya más lotes
+
+
+@main_bp.route('/db/progreso/stream', methods=['GET'])
+def db_progreso_stream():
+    """
+    Server-sent events con el mismo paquete que /db/progreso, enviado cada vez que cambia el
+    registro de progreso (y un comentario de keep-alive cada SSE_HEARTBEAT_S). El stream se
+    cierra tras enviar el estado final del trabajo.
+    """
+    db = get_db()
+    if db is None:
+        return {"error": "DB no disponible"}, 500
+
+    def _eventos():
+        yield "retry: 3000\n\n"
+        vista = None
+        while True:
+            actual = progreso_registro.version()
+            if actual != vista:
+                vista = actual
+                snapshot = ProgressMonitor.snapshot(db)
+                yield f"data: {json.dumps(_serialize_for_json(snapshot))}\n\n"
+                if not snapshot.get("activo", False):
+                    return
+                time.sleep(SSE_INTERVALO_MIN_S)
+            elif progreso_registro.esperar_cambio(vista, timeout=SSE_HEARTBEAT_S) == vista:
+                yield ": keep-alive\n\n"
+
+    return Response(stream_with_context(_eventos()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# -----------------------
+# Endpoint: estado del pool de conexiones MongoDB
+# -----------------------
+@main_bp.route('/db/pool', methods=['GET'])
+def db_pool():
+    try:
+        return get_pool_stats(), 200
+    except Exception as e:
+        logger.exception("Error en /db/pool: %s", e)
+        return {"error": str(e)}, 500